@@ -0,0 +1,27 @@
+-- 数据库迁移脚本：为 metrics 表添加 latency_hist 列（按小时 / 按天汇总指标）
+-- latency_hist 保存每分钟的延迟直方图（{"lb:<桶>": 次数}），汇总时逐桶相加后重新计算百分位；
+-- 汇总表 metrics_hourly / metrics_daily 由应用启动时自动创建
+-- 使用方法：
+--   psql -U stockai -d stockai_limiter -f add_metric_latency_hist.sql
+-- 或在 pgAdmin 中执行
+
+DO $$ 
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 
+        FROM information_schema.columns 
+        WHERE table_name='metrics' 
+        AND column_name='latency_hist'
+    ) THEN
+        ALTER TABLE metrics ADD COLUMN latency_hist JSON;
+        RAISE NOTICE '✅ 成功添加 latency_hist 列';
+    ELSE
+        RAISE NOTICE '✅ latency_hist 列已存在，无需迁移';
+    END IF;
+END $$;
+
+-- 验证列已添加
+SELECT column_name, data_type, is_nullable
+FROM information_schema.columns 
+WHERE table_name='metrics' 
+AND column_name = 'latency_hist';
@@ -0,0 +1,39 @@
+-- 数据库迁移脚本：为 metrics 表添加 latency_p50 / latency_p99 列
+-- 指标快照从 Redis 中按分钟记录的对数分桶延迟直方图计算 p50 / p95 / p99，
+-- latency_p95 不再是平均延迟
+-- 使用方法：
+--   psql -U stockai -d stockai_limiter -f add_metric_latency_percentiles.sql
+-- 或在 pgAdmin 中执行
+
+DO $$ 
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 
+        FROM information_schema.columns 
+        WHERE table_name='metrics' 
+        AND column_name='latency_p50'
+    ) THEN
+        ALTER TABLE metrics ADD COLUMN latency_p50 DOUBLE PRECISION;
+        RAISE NOTICE '✅ 成功添加 latency_p50 列';
+    ELSE
+        RAISE NOTICE '✅ latency_p50 列已存在，无需迁移';
+    END IF;
+    
+    IF NOT EXISTS (
+        SELECT 1 
+        FROM information_schema.columns 
+        WHERE table_name='metrics' 
+        AND column_name='latency_p99'
+    ) THEN
+        ALTER TABLE metrics ADD COLUMN latency_p99 DOUBLE PRECISION;
+        RAISE NOTICE '✅ 成功添加 latency_p99 列';
+    ELSE
+        RAISE NOTICE '✅ latency_p99 列已存在，无需迁移';
+    END IF;
+END $$;
+
+-- 验证列已添加
+SELECT column_name, data_type, is_nullable
+FROM information_schema.columns 
+WHERE table_name='metrics' 
+AND column_name IN ('latency_p50', 'latency_p95', 'latency_p99');
@@ -0,0 +1,31 @@
+-- 数据库迁移脚本：为 quotas 表添加 parent_id 列（层级配额）
+-- 获取令牌时会同时检查并扣减整条上级链（如 endpoint → domain → global），
+-- 任一层级拒绝则所有层级都不扣减
+-- 使用方法：
+--   psql -U stockai -d stockai_limiter -f add_quota_parent_column.sql
+-- 或在 pgAdmin 中执行
+
+DO $$ 
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 
+        FROM information_schema.columns 
+        WHERE table_name='quotas' 
+        AND column_name='parent_id'
+    ) THEN
+        ALTER TABLE quotas 
+        ADD COLUMN parent_id VARCHAR(100) REFERENCES quotas(id);
+        
+        CREATE INDEX IF NOT EXISTS ix_quotas_parent_id ON quotas (parent_id);
+        
+        RAISE NOTICE '✅ 成功添加 parent_id 列';
+    ELSE
+        RAISE NOTICE '✅ parent_id 列已存在，无需迁移';
+    END IF;
+END $$;
+
+-- 验证列已添加
+SELECT column_name, data_type, is_nullable
+FROM information_schema.columns 
+WHERE table_name='quotas' 
+AND column_name='parent_id';
@@ -0,0 +1,39 @@
+-- 数据库迁移脚本：为 quotas 表添加 min_refill_rate / max_refill_rate 列（自适应速率）
+-- 设置了 max_refill_rate 的配额由速率控制器按 AIMD 调整实际速率，
+-- 范围为 [min_refill_rate, max_refill_rate]；实际速率保存在 Redis 哈希 quota:effective_rates 中，不改写 quotas 表
+-- 使用方法：
+--   psql -U stockai -d stockai_limiter -f add_quota_rate_bounds.sql
+-- 或在 pgAdmin 中执行
+
+DO $$ 
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 
+        FROM information_schema.columns 
+        WHERE table_name='quotas' 
+        AND column_name='min_refill_rate'
+    ) THEN
+        ALTER TABLE quotas ADD COLUMN min_refill_rate DOUBLE PRECISION;
+        RAISE NOTICE '✅ 成功添加 min_refill_rate 列';
+    ELSE
+        RAISE NOTICE '✅ min_refill_rate 列已存在，无需迁移';
+    END IF;
+    
+    IF NOT EXISTS (
+        SELECT 1 
+        FROM information_schema.columns 
+        WHERE table_name='quotas' 
+        AND column_name='max_refill_rate'
+    ) THEN
+        ALTER TABLE quotas ADD COLUMN max_refill_rate DOUBLE PRECISION;
+        RAISE NOTICE '✅ 成功添加 max_refill_rate 列';
+    ELSE
+        RAISE NOTICE '✅ max_refill_rate 列已存在，无需迁移';
+    END IF;
+END $$;
+
+-- 验证列已添加
+SELECT column_name, data_type, is_nullable
+FROM information_schema.columns 
+WHERE table_name='quotas' 
+AND column_name IN ('min_refill_rate', 'max_refill_rate');
@@ -0,0 +1,29 @@
+-- 数据库迁移脚本：为 quotas 表添加 window_unit 列（固定日历窗口配额）
+-- algo = 'fixed_window' 的配额在每个窗口（day / hour / minute，按调度器时区对齐）
+-- 内最多允许 capacity 次调用，窗口切换时预算重置
+-- 使用方法：
+--   psql -U stockai -d stockai_limiter -f add_quota_window_column.sql
+-- 或在 pgAdmin 中执行
+
+DO $$ 
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 
+        FROM information_schema.columns 
+        WHERE table_name='quotas' 
+        AND column_name='window_unit'
+    ) THEN
+        ALTER TABLE quotas 
+        ADD COLUMN window_unit VARCHAR(20);
+        
+        RAISE NOTICE '✅ 成功添加 window_unit 列';
+    ELSE
+        RAISE NOTICE '✅ window_unit 列已存在，无需迁移';
+    END IF;
+END $$;
+
+-- 验证列已添加
+SELECT column_name, data_type, is_nullable
+FROM information_schema.columns 
+WHERE table_name='quotas' 
+AND column_name='window_unit';
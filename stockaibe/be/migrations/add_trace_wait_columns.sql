@@ -0,0 +1,39 @@
+-- 数据库迁移脚本：为 traces 表添加 wait_ms / retries 列
+-- 每次 LimitCallTask 调用只记录一条追踪：latency_ms 为执行耗时，
+-- wait_ms 为等待令牌的时间，retries 为被限流后的重试次数
+-- 使用方法：
+--   psql -U stockai -d stockai_limiter -f add_trace_wait_columns.sql
+-- 或在 pgAdmin 中执行
+
+DO $$ 
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 
+        FROM information_schema.columns 
+        WHERE table_name='traces' 
+        AND column_name='wait_ms'
+    ) THEN
+        ALTER TABLE traces ADD COLUMN wait_ms DOUBLE PRECISION;
+        RAISE NOTICE '✅ 成功添加 wait_ms 列';
+    ELSE
+        RAISE NOTICE '✅ wait_ms 列已存在，无需迁移';
+    END IF;
+    
+    IF NOT EXISTS (
+        SELECT 1 
+        FROM information_schema.columns 
+        WHERE table_name='traces' 
+        AND column_name='retries'
+    ) THEN
+        ALTER TABLE traces ADD COLUMN retries INTEGER;
+        RAISE NOTICE '✅ 成功添加 retries 列';
+    ELSE
+        RAISE NOTICE '✅ retries 列已存在，无需迁移';
+    END IF;
+END $$;
+
+-- 验证列已添加
+SELECT column_name, data_type, is_nullable
+FROM information_schema.columns 
+WHERE table_name='traces' 
+AND column_name IN ('wait_ms', 'retries');
@@ -0,0 +1,86 @@
+-- 数据库迁移脚本：把 metrics / traces 改为按天范围分区的表（PostgreSQL 11+）
+-- 分区名为 <表名>_pYYYYMMDD（UTC 日），主键改为 (id, ts) / (id, created_at)；
+-- 之后由调度任务 Partition Maintenance 提前创建未来的分区、整块删除过期分区
+-- 迁移会复制现有数据，大表请在低峰期执行
+-- 使用方法：
+--   psql -U stockai -d stockai_limiter -f partition_metrics_traces.sql
+-- 或在 pgAdmin 中执行
+
+DO $$
+DECLARE
+    first_day DATE;
+    day DATE;
+BEGIN
+    IF EXISTS (
+        SELECT 1
+        FROM pg_partitioned_table pt
+        JOIN pg_class c ON c.oid = pt.partrelid
+        WHERE c.relname = 'metrics'
+    ) THEN
+        RAISE NOTICE '✅ metrics 已是分区表，无需迁移';
+    ELSE
+        ALTER TABLE metrics RENAME TO metrics_unpartitioned;
+        CREATE TABLE metrics (LIKE metrics_unpartitioned INCLUDING DEFAULTS) PARTITION BY RANGE (ts);
+
+        first_day := COALESCE((SELECT min(ts AT TIME ZONE 'UTC')::date FROM metrics_unpartitioned), current_date);
+        FOR day IN SELECT d::date FROM generate_series(first_day, (now() AT TIME ZONE 'UTC')::date + 7, interval '1 day') AS d LOOP
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF metrics FOR VALUES FROM (%L) TO (%L)',
+                'metrics_p' || to_char(day, 'YYYYMMDD'),
+                day::text || ' 00:00:00+00',
+                (day + 1)::text || ' 00:00:00+00'
+            );
+        END LOOP;
+
+        INSERT INTO metrics SELECT * FROM metrics_unpartitioned;
+        ALTER SEQUENCE metrics_id_seq OWNED BY metrics.id;
+        DROP TABLE metrics_unpartitioned;
+        -- 约束和索引名在旧表删除后才可用
+        ALTER TABLE metrics ADD PRIMARY KEY (id, ts);
+        ALTER TABLE metrics ADD FOREIGN KEY (quota_id) REFERENCES quotas (id);
+        CREATE INDEX ix_metrics_ts ON metrics (ts);
+        CREATE INDEX ix_metrics_quota_id ON metrics (quota_id);
+        RAISE NOTICE '✅ metrics 已改为按天分区';
+    END IF;
+
+    IF EXISTS (
+        SELECT 1
+        FROM pg_partitioned_table pt
+        JOIN pg_class c ON c.oid = pt.partrelid
+        WHERE c.relname = 'traces'
+    ) THEN
+        RAISE NOTICE '✅ traces 已是分区表，无需迁移';
+    ELSE
+        ALTER TABLE traces RENAME TO traces_unpartitioned;
+        CREATE TABLE traces (LIKE traces_unpartitioned INCLUDING DEFAULTS) PARTITION BY RANGE (created_at);
+
+        first_day := COALESCE((SELECT min(created_at AT TIME ZONE 'UTC')::date FROM traces_unpartitioned), current_date);
+        FOR day IN SELECT d::date FROM generate_series(first_day, (now() AT TIME ZONE 'UTC')::date + 7, interval '1 day') AS d LOOP
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF traces FOR VALUES FROM (%L) TO (%L)',
+                'traces_p' || to_char(day, 'YYYYMMDD'),
+                day::text || ' 00:00:00+00',
+                (day + 1)::text || ' 00:00:00+00'
+            );
+        END LOOP;
+
+        INSERT INTO traces SELECT * FROM traces_unpartitioned;
+        ALTER SEQUENCE traces_id_seq OWNED BY traces.id;
+        DROP TABLE traces_unpartitioned;
+        -- 约束和索引名在旧表删除后才可用
+        ALTER TABLE traces ADD PRIMARY KEY (id, created_at);
+        ALTER TABLE traces ADD FOREIGN KEY (quota_id) REFERENCES quotas (id);
+        CREATE INDEX ix_traces_quota_id ON traces (quota_id);
+        CREATE INDEX ix_traces_func_id ON traces (func_id);
+        CREATE INDEX ix_traces_created_at ON traces (created_at);
+        RAISE NOTICE '✅ traces 已改为按天分区';
+    END IF;
+END $$;
+
+-- 验证分区已创建
+SELECT p.relname AS parent, count(*) AS partitions
+FROM pg_inherits i
+JOIN pg_class c ON c.oid = i.inhrelid
+JOIN pg_class p ON p.oid = i.inhparent
+WHERE p.relname IN ('metrics', 'traces')
+GROUP BY p.relname;
@@ -0,0 +1,84 @@
+"""内存限流路径的微基准测试（Redis 不可用 / 单元测试时走的路径）
+
+用法: python script/bench_limiter_memory.py [--seconds 2] [--threads 8] [--shared]
+
+每种算法分别测单线程和多线程的 acquire 次数/秒，不连接 Redis；
+默认关闭共享内存令牌桶表，只测进程内状态，加 --shared 则令牌桶走共享表。
+"""
+import argparse
+import math
+import sys
+import threading
+import time
+from pathlib import Path
+
+src_root = Path(__file__).resolve().parent.parent / "src"
+if str(src_root) not in sys.path:
+    sys.path.insert(0, str(src_root))
+
+from stockaibe_be.core.config import settings  # noqa: E402
+from stockaibe_be.models import Quota  # noqa: E402
+from stockaibe_be.services import CircuitBreaker, LimiterService, quota_cache  # noqa: E402
+
+ALGOS = ["token_bucket", "gcra", "leaky_bucket", "sliding_window", "fixed_window"]
+
+
+def make_service() -> LimiterService:
+    # 熔断器一直打开：所有调用走内存限流，不连接 Redis
+    breaker = CircuitBreaker("bench", failure_threshold=1, reset_timeout=math.inf)
+    breaker.record_failure("memory only")
+    return LimiterService(breaker=breaker)
+
+
+def run(service: LimiterService, quotas: list, seconds: float, threads: int) -> float:
+    """acquire 次数/秒；每个线程轮流使用 quotas 中的配额"""
+    counts = [0] * threads
+    deadline = time.perf_counter() + seconds
+
+    def worker(index: int) -> None:
+        calls = 0
+        n = len(quotas)
+        while time.perf_counter() < deadline:
+            for _ in range(100):
+                service.try_acquire(quotas[(index + calls) % n])
+                calls += 1
+        counts[index] = calls
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return sum(counts) / (time.perf_counter() - start)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=2.0)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--quotas", type=int, default=16, help="每种算法的配额数")
+    parser.add_argument("--shared", action="store_true", help="令牌桶使用共享内存表")
+    args = parser.parse_args()
+    settings.shared_fallback_enabled = args.shared
+
+    # 单层配额，不查父配额
+    quota_cache.chain = lambda quota: [quota]
+
+    print(f"{'algo':<16}{'1 thread':>14}{f'{args.threads} threads':>14}")
+    for algo in ALGOS:
+        quotas = [
+            Quota(id=f"bench-{algo}-{i}", name=f"bench-{algo}-{i}", capacity=1_000_000,
+                  refill_rate=1_000_000.0, algo=algo)
+            for i in range(args.quotas)
+        ]
+        service = make_service()
+        for quota in quotas:
+            service.ensure_quota(quota)
+        single = run(service, quotas, args.seconds, 1)
+        multi = run(service, quotas, args.seconds, args.threads)
+        print(f"{algo:<16}{single:>14,.0f}{multi:>14,.0f}")
+
+
+if __name__ == "__main__":
+    main()
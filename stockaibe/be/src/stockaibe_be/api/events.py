@@ -6,12 +6,13 @@ import json
 from typing import AsyncGenerator
 
 from fastapi import APIRouter, Depends
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import StreamingResponse
 from sqlmodel import Session, select
 
 from ..core.security import get_current_user, get_db
 from ..models import User, TraceLog, Quota
-from ..services import limiter_service
+from ..services import async_limiter_service, quota_cache
 
 router = APIRouter()
 
@@ -23,8 +24,9 @@ async def event_generator(db: Session) -> AsyncGenerator[str, None]:
     while True:
         try:
             # Query new traces since last check
+            # Database reads run in the thread pool, Redis reads on the asyncio client
             statement = select(TraceLog).where(TraceLog.id > last_trace_id).order_by(TraceLog.id.asc()).limit(10)
-            traces = db.exec(statement).all()
+            traces = await run_in_threadpool(lambda: db.exec(statement).all())
             
             for trace in traces:
                 event_data = {
@@ -43,20 +45,23 @@ async def event_generator(db: Session) -> AsyncGenerator[str, None]:
             
             # Send current token status
             statement = select(Quota).where(Quota.enabled == True)
-            quotas = db.exec(statement).all()
-            for quota in quotas:
-                tokens = limiter_service.get_current_tokens(quota.id)
-                if tokens is not None:
-                    event_data = {
-                        "type": "tokens",
-                        "data": {
-                            "quota_id": quota.id,
-                            "tokens_remain": tokens,
-                            "capacity": quota.capacity,
-                            "timestamp": dt.datetime.now(dt.timezone.utc).isoformat(),
-                        }
+            quotas = await run_in_threadpool(lambda: db.exec(statement).all())
+            # One read-only script call for all quotas, no writes to the limiter keys;
+            # the cached copies carry the effective rate of adaptive quotas
+            cached = await run_in_threadpool(lambda: [quota_cache.get(quota.id) or quota for quota in quotas])
+            snapshots = await async_limiter_service.inspect_many(cached)
+            for quota, snapshot in zip(quotas, snapshots):
+                event_data = {
+                    "type": "tokens",
+                    "data": {
+                        "quota_id": quota.id,
+                        "tokens_remain": snapshot.tokens,
+                        "capacity": quota.capacity,
+                        "time_to_full": snapshot.time_to_full,
+                        "timestamp": dt.datetime.now(dt.timezone.utc).isoformat(),
                     }
-                    yield f"data: {json.dumps(event_data)}\n\n"
+                }
+                yield f"data: {json.dumps(event_data)}\n\n"
             
             # Keep-alive ping
             yield f": ping\n\n"
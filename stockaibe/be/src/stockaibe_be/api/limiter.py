@@ -1,35 +1,120 @@
 """Rate limiter API endpoints."""
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlmodel import Session, select
+import datetime as dt
+import math
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Response, status
+from fastapi.concurrency import run_in_threadpool
 
-from ..core.security import get_db
 from ..models import Quota
-from ..schemas import AcquireRequest, AcquireResponse
-from ..services import limiter_service
+from ..schemas import (
+    AcquireRequest,
+    AcquireResponse,
+    BatchAcquireDecision,
+    BatchAcquireRequest,
+    BatchAcquireResponse,
+    TokensResponse,
+)
+from ..services import async_limiter_service, budget_reset_at, limiter_service, quota_cache
+from ..services.limiter_scripts import CONCURRENCY
 
 router = APIRouter()
 
 
+async def _get_quota(quota_id: str) -> Optional[Quota]:
+    """Quota from the shared quota cache; only a stale cache reloads (in the thread pool)."""
+    if quota_cache.fresh:
+        return quota_cache.get(quota_id)
+    return await run_in_threadpool(quota_cache.get, quota_id)
+
+
 @router.post("/acquire", response_model=AcquireResponse)
-def acquire_token(req: AcquireRequest, db: Session = Depends(get_db)):
+async def acquire_token(req: AcquireRequest, response: Response):
     """
     Acquire tokens from a quota.
     
     This is the main endpoint for rate limiting. Clients call this before making requests
     to check if they have permission to proceed.
+    
+    The response carries ``RateLimit-Remaining`` and, when denied, ``Retry-After``
+    (whole seconds until enough tokens exist) headers. ``fixed_window`` quotas
+    also return ``reset_at`` and a ``RateLimit-Reset`` header (seconds until
+    the window budget resets).
+    
+    The quota comes from the quota cache (kept in sync across workers), Redis
+    is called through the asyncio client and the trace is queued on the trace
+    sink, so the decision never touches Postgres or blocks the event loop.
     """
-    statement = select(Quota).where(Quota.id == req.qid)
-    quota = db.exec(statement).first()
+    quota = await _get_quota(req.qid)
     if not quota:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Quota not found")
-    allowed, remain = limiter_service.acquire(
-        db=db,
+    if quota.algo == CONCURRENCY:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Concurrency quotas hold slots and have no tokens to acquire",
+        )
+    allowed, remain, retry_after = await async_limiter_service.acquire(
         quota=quota,
         cost=req.cost,
         success=req.success,
         latency_ms=req.latency_ms,
         message=req.message,
     )
-    db.commit()
-    return AcquireResponse(allow=allowed, remain=remain)
+    response.headers["RateLimit-Remaining"] = str(max(0, math.floor(remain)))
+    if not allowed and retry_after >= 0:
+        response.headers["Retry-After"] = str(math.ceil(retry_after))
+    reset_at = budget_reset_at(quota)
+    if reset_at is not None:
+        reset_in = (reset_at - dt.datetime.now(dt.timezone.utc)).total_seconds()
+        response.headers["RateLimit-Reset"] = str(max(0, math.ceil(reset_in)))
+    return AcquireResponse(allow=allowed, remain=remain, retry_after=retry_after, reset_at=reset_at)
+
+
+@router.post("/acquire/batch", response_model=BatchAcquireResponse)
+def acquire_tokens_batch(req: BatchAcquireRequest):
+    """
+    Acquire tokens for many quotas (or many permits of one quota) at once.
+    
+    All items are resolved with a single Redis script call; traces are written in bulk.
+    Each item gets its own decision; unknown quotas are returned with ``found=false``.
+    """
+    decisions = limiter_service.acquire_many(
+        items=[(item.qid, item.cost) for item in req.items],
+        success=req.success,
+        latency_ms=req.latency_ms,
+        message=req.message,
+    )
+    return BatchAcquireResponse(
+        items=[
+            BatchAcquireDecision(
+                qid=d.qid,
+                cost=d.cost,
+                allow=d.allowed,
+                remain=d.remain,
+                retry_after=d.retry_after,
+                found=d.found,
+            )
+            for d in decisions
+        ]
+    )
+
+
+@router.get("/tokens/{quota_id}", response_model=TokensResponse)
+async def read_tokens(quota_id: str):
+    """Read the remaining tokens of a quota without consuming any.
+
+    For ``fixed_window`` quotas ``tokens_remain`` is what is left of the
+    window budget and ``reset_at`` is when the next window starts.
+    """
+    quota = await _get_quota(quota_id)
+    if not quota:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Quota not found")
+    limiter_service.ensure_quota(quota)
+    tokens = await async_limiter_service.get_current_tokens(quota.id)
+    return TokensResponse(
+        quota_id=quota.id,
+        tokens_remain=tokens,
+        capacity=quota.capacity,
+        reset_at=budget_reset_at(quota),
+    )
@@ -1,14 +1,16 @@
 """Metrics and monitoring API endpoints."""
 
+import datetime as dt
 from typing import List, Optional
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query
 from sqlmodel import Session, select
 
 from ..core.security import get_current_user, get_db
 from ..models import Metric, Quota, User
-from ..schemas import MetricsCurrentResponse, MetricsSeriesResponse
-from ..services import limiter_service
+from ..schemas import LimiterHealthResponse, MetricsCurrentResponse, MetricsSeriesResponse
+from ..services import async_limiter_service, limiter_service, upstream_limits
+from ..services.rollups import RESOLUTIONS, as_utc, choose_resolution
 
 router = APIRouter()
 
@@ -19,8 +21,15 @@ def metrics_current(db: Session = Depends(get_db), _: User = Depends(get_current
     result: list[MetricsCurrentResponse] = []
     statement = select(Quota)
     quotas = db.exec(statement).all()
+    # Snapshots are taken every minute: only the partitions of the last day are scanned
+    since = dt.datetime.now(dt.timezone.utc) - dt.timedelta(days=1)
     for quota in quotas:
-        metric_statement = select(Metric).where(Metric.quota_id == quota.id).order_by(Metric.ts.desc()).limit(1)
+        metric_statement = (
+            select(Metric)
+            .where(Metric.quota_id == quota.id, Metric.ts >= since)
+            .order_by(Metric.ts.desc())
+            .limit(1)
+        )
         metric = db.exec(metric_statement).first()
         state = limiter_service.states.get(quota.id)
         remain_value = metric.tokens_remain if metric else (state.tokens if state else None)
@@ -36,21 +45,62 @@ def metrics_current(db: Session = Depends(get_db), _: User = Depends(get_current
     return result
 
 
+@router.get("/limiter", response_model=LimiterHealthResponse)
+def metrics_limiter(_: User = Depends(get_current_user)):
+    """Get the state of the limiter's Redis circuit breakers.
+
+    While a breaker is open the limits are enforced per process from memory;
+    ``memory_fallback_quotas`` counts quotas waiting to be reconciled to Redis.
+    ``upstreams`` lists the adaptive concurrency limits of this worker process.
+    """
+    return LimiterHealthResponse(
+        breakers=[
+            limiter_service.breaker.snapshot(),
+            async_limiter_service.breaker.snapshot(),
+        ],
+        memory_fallback_quotas=limiter_service.pending_reconcile,
+        upstreams=[limit.snapshot() for limit in upstream_limits()],
+    )
+
+
 @router.get("/series", response_model=MetricsSeriesResponse)
 def metrics_series(
     quota_id: Optional[str] = None,
-    limit: int = 100,
+    limit: int = Query(100, ge=1, description="未指定 start 时返回的最新分钟数据条数"),
+    start: Optional[dt.datetime] = None,
+    end: Optional[dt.datetime] = None,
+    points: int = Query(300, ge=10, le=2000, description="每个配额最多返回的点数"),
     db: Session = Depends(get_db),
     _: User = Depends(get_current_user),
 ):
-    """Get time series metrics data."""
-    statement = select(Metric)
-    if quota_id:
-        statement = statement.where(Metric.quota_id == quota_id)
-    statement = statement.order_by(Metric.ts.desc()).limit(limit)
-    items = list(db.exec(statement).all())
-    items.reverse()
+    """Get time series metrics data.
+
+    With ``start`` (and optionally ``end``, default now) the resolution is
+    chosen from the range: per-minute rows while the range has at most
+    ``points`` minutes, otherwise the hourly or daily rollups; ``points``
+    bounds the result and ``limit`` is not used. Without ``start`` the
+    latest ``limit`` minute rows are returned. Times without an offset are
+    taken as UTC.
+    """
+    if start is None:
+        statement = select(Metric)
+        if quota_id:
+            statement = statement.where(Metric.quota_id == quota_id)
+        statement = statement.order_by(Metric.ts.desc()).limit(limit)
+        items = list(db.exec(statement).all())
+        items.reverse()
+        resolution = RESOLUTIONS[0]
+    else:
+        start = as_utc(start)
+        end = as_utc(end) if end else dt.datetime.now(dt.timezone.utc)
+        resolution = choose_resolution(start, end, points)
+        model = resolution.model
+        statement = select(model).where(model.ts >= start, model.ts < end)
+        if quota_id:
+            statement = statement.where(model.quota_id == quota_id)
+        items = list(db.exec(statement.order_by(model.ts)).all())
     return MetricsSeriesResponse(
+        resolution=resolution.name,
         items=[
             {
                 "ts": item.ts,
@@ -58,9 +108,11 @@ def metrics_series(
                 "ok": item.ok,
                 "err": item.err,
                 "r429": item.r429,
+                "latency_p50": item.latency_p50,
                 "latency_p95": item.latency_p95,
+                "latency_p99": item.latency_p99,
                 "tokens_remain": item.tokens_remain,
             }
             for item in items
-        ]
+        ],
     )
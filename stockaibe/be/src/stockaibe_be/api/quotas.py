@@ -1,6 +1,6 @@
 """Quota management API endpoints."""
 
-from typing import List
+from typing import List, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlmodel import Session, select
@@ -8,11 +8,24 @@ from sqlmodel import Session, select
 from ..core.security import get_current_active_superuser, get_current_user, get_db
 from ..models import Quota, User
 from ..schemas import QuotaCreate, QuotaRead, QuotaUpdate
-from ..services import limiter_service
+from ..services import limiter_service, quota_cache
 
 router = APIRouter()
 
 
+def _check_parent(db: Session, quota_id: str, parent_id: Optional[str]) -> None:
+    """Reject unknown parents and parent chains that would loop back to ``quota_id``."""
+    seen = {quota_id}
+    while parent_id:
+        if parent_id in seen:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Quota parent chain forms a cycle")
+        parent = db.exec(select(Quota).where(Quota.id == parent_id)).first()
+        if not parent:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Parent quota {parent_id} not found")
+        seen.add(parent_id)
+        parent_id = parent.parent_id
+
+
 @router.get("", response_model=List[QuotaRead])
 def list_quotas(db: Session = Depends(get_db), _: User = Depends(get_current_user)):
     """List all quotas with current token counts."""
@@ -26,6 +39,7 @@ def list_quotas(db: Session = Depends(get_db), _: User = Depends(get_current_use
         current_tokens = limiter_service.get_current_tokens(quota.id)
         quota_dict = quota.model_dump()
         quota_dict['current_tokens'] = current_tokens
+        quota_dict['effective_rate'] = quota_cache.effective_rates.get(quota.id)
         result.append(QuotaRead(**quota_dict))
     
     return result
@@ -42,11 +56,13 @@ def create_quota(
     existing_quota = db.exec(statement).first()
     if existing_quota:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Quota already exists")
+    _check_parent(db, quota_in.id, quota_in.parent_id)
     quota = Quota(**quota_in.model_dump())
     db.add(quota)
     db.commit()
     db.refresh(quota)
     limiter_service.ensure_quota(quota)
+    quota_cache.publish_change(quota.id)
     return quota
 
 
@@ -62,11 +78,15 @@ def update_quota(
     quota = db.exec(statement).first()
     if not quota:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Quota not found")
-    for key, value in quota_in.model_dump(exclude_unset=True).items():
+    updates = quota_in.model_dump(exclude_unset=True)
+    if "parent_id" in updates:
+        _check_parent(db, quota_id, updates["parent_id"])
+    for key, value in updates.items():
         setattr(quota, key, value)
     db.commit()
     db.refresh(quota)
     limiter_service.ensure_quota(quota)
+    quota_cache.publish_change(quota.id)
     return quota
 
 
@@ -85,4 +105,5 @@ def toggle_quota(
     db.commit()
     db.refresh(quota)
     limiter_service.ensure_quota(quota)
+    quota_cache.publish_change(quota.id)
     return quota
@@ -8,24 +8,21 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from sqlmodel import Session, select
 
 from ..core.database import engine
+from ..core.logging_config import get_logger
 from ..core.security import get_current_active_superuser, get_current_user, get_db
-from ..models import SchedulerTask, TraceLog, User
+from ..models import SchedulerTask, User
 from ..schemas import TaskCreate, TaskRead, TaskTriggerRequest
 from ..services import register_cron_job, remove_job, scheduler
 
 router = APIRouter()
+logger = get_logger(__name__)
 
 
 def _run_registered_job(job_id: str) -> None:
     """Execute a registered job and log the execution."""
+    # Not tied to a quota, so there is no trace row (traces.quota_id references quotas)
+    logger.info(f"Executed job {job_id}")
     with Session(engine) as session:
-        trace = TraceLog(
-            quota_id="system",
-            status_code=200,
-            latency_ms=None,
-            message=f"Executed job {job_id}",
-        )
-        session.add(trace)
         statement = select(SchedulerTask).where(SchedulerTask.job_id == job_id)
         task = session.exec(statement).first()
         if task:
@@ -1,9 +1,9 @@
 """Request trace logging API endpoints."""
 
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from typing import List
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query
 from sqlmodel import Session, select, delete, func, case
 
 from ..core.security import get_current_user, get_db
@@ -43,8 +43,12 @@ def delete_old_traces(db: Session = Depends(get_db), _: User = Depends(get_curre
 
 
 @router.get("/func-stats", response_model=List[FuncStatsRead])
-def get_func_stats(db: Session = Depends(get_db), _: User = Depends(get_current_user)):
-    """获取每个限流函数的调用统计。
+def get_func_stats(
+    days: int = Query(7, ge=1, le=90, description="统计最近多少天的调用"),
+    db: Session = Depends(get_db),
+    _: User = Depends(get_current_user),
+):
+    """获取每个限流函数最近 ``days`` 天的调用统计（只扫描这几天的 traces 分区）。
     
     按 func_id 分组统计：
     - 总调用次数
@@ -53,6 +57,7 @@ def get_func_stats(db: Session = Depends(get_db), _: User = Depends(get_current_
     - 被限流次数（429）
     - 平均延迟
     - 最后调用时间
+    - 平均等待令牌时间、重试总次数
     """
     # 使用原生 SQL 进行分组统计
     statement = select(
@@ -65,8 +70,11 @@ def get_func_stats(db: Session = Depends(get_db), _: User = Depends(get_current_
         func.sum(case((TraceLog.status_code == 429, 1), else_=0)).label("limited_calls"),
         func.avg(TraceLog.latency_ms).label("avg_latency_ms"),
         func.max(TraceLog.created_at).label("last_call_at"),
+        func.avg(TraceLog.wait_ms).label("avg_wait_ms"),
+        func.sum(TraceLog.retries).label("total_retries"),
     ).where(
-        TraceLog.func_id.isnot(None)  # 只统计有 func_id 的记录（限流函数）
+        TraceLog.func_id.isnot(None),  # 只统计有 func_id 的记录（限流函数）
+        TraceLog.created_at >= datetime.now(timezone.utc) - timedelta(days=days),
     ).group_by(
         TraceLog.func_id, TraceLog.func_name, TraceLog.quota_id
     ).order_by(
@@ -88,6 +96,8 @@ def get_func_stats(db: Session = Depends(get_db), _: User = Depends(get_current_
             limited_calls=row[6] or 0,
             avg_latency_ms=row[7],
             last_call_at=row[8],
+            avg_wait_ms=row[9],
+            total_retries=row[10] or 0,
         ))
     
     return stats
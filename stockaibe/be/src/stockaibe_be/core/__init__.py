@@ -2,7 +2,7 @@
 
 from .config import settings
 from .database import engine, get_session, session_scope
-from .redis_client import get_redis, close_redis
+from .redis_client import close_async_redis, close_redis, get_async_redis, get_redis
 from .security import (
     create_access_token,
     decode_token,
@@ -22,6 +22,8 @@ __all__ = [
     "get_db",
     "get_redis",
     "close_redis",
+    "get_async_redis",
+    "close_async_redis",
     "create_access_token",
     "decode_token",
     "get_current_active_superuser",
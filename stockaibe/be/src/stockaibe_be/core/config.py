@@ -1,3 +1,4 @@
+from typing import List, Optional
 from pathlib import Path
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -29,11 +30,83 @@ class Settings(BaseSettings):
     # Redis configuration
     redis_url: str = "redis://localhost:6379/0"
     redis_decode_responses: bool = False  # Keep bytes for Lua scripts
+    redis_max_connections: int = 50  # Pool size of the asyncio client
+    # Limiter circuit breaker: open after this many consecutive Redis failures,
+    # probe Redis again after this many seconds
+    redis_breaker_failure_threshold: int = 3
+    redis_breaker_reset_seconds: float = 5.0
+    # While Redis is unavailable, token buckets live in a memory-mapped table
+    # shared by all workers on the host (path defaults to /dev/shm)
+    shared_fallback_enabled: bool = True
+    shared_fallback_path: Optional[str] = None
+    shared_fallback_slots: int = 1024
     
     # Alert thresholds
     alert_error_rate_threshold: float = 0.3  # 30% error rate
     alert_429_rate_threshold: float = 0.3  # 30% 429 rate
     alert_window_minutes: int = 3  # Alert if threshold exceeded for 3 minutes
+    # Multi-window burn rate: alert when failed calls use up the error budget
+    # (allowed failed share) this many times faster than allowed in every window
+    alert_error_budget: float = 0.01
+    alert_burn_rate_threshold: float = 10.0
+    alert_burn_windows_minutes: List[int] = [3, 30]  # empty = off
+    
+    # AIMD rate control of adaptive quotas (max_refill_rate set), run with the
+    # health check: a window whose error rate or p95 latency exceeds these
+    # multiplies the rate by the decrease factor; a healthy window in which the
+    # limiter denied calls adds increase_fraction of the configured rate
+    rate_control_enabled: bool = True
+    rate_control_error_rate_threshold: float = 0.05
+    rate_control_latency_p95_ms: float = 0.0  # 0 = ignore latency
+    rate_control_increase_fraction: float = 0.1
+    rate_control_decrease_factor: float = 0.7
+    rate_control_floor_fraction: float = 0.1  # floor when min_refill_rate is not set
+    
+    # Max seconds a LimitCallTask waits for tokens before raising RateLimitTimeout
+    limit_call_timeout_seconds: float = 30.0
+    
+    # Token leasing: a lease lives this long before unused tokens go back to Redis,
+    # and never holds more than this fraction of the quota capacity
+    lease_ttl_seconds: float = 1.0
+    lease_max_fraction: float = 0.1
+    
+    # Concurrency quotas: a held slot is reclaimed after this many seconds if its
+    # holder never releases it (crash); waiters poll for a free slot this often
+    concurrency_lease_ttl_seconds: float = 300.0
+    concurrency_poll_seconds: float = 0.05
+    
+    # Adaptive concurrency per upstream host (AkShare fetchers): start at
+    # initial parallel calls, never exceed max; latency may grow by the
+    # tolerance factor over its no-load latency before the limit shrinks
+    adaptive_concurrency_initial: int = 2
+    adaptive_concurrency_max: int = 16
+    adaptive_concurrency_tolerance: float = 1.5
+    
+    # Quota definitions cached in process; reloaded after this many seconds even
+    # without an invalidation from the quota API
+    quota_cache_ttl_seconds: float = 60.0
+    
+    # Trace writer: rows are inserted in batches of trace_batch_size or every
+    # trace_flush_interval_seconds; producers wait up to trace_enqueue_timeout_seconds
+    # when trace_queue_size rows are pending
+    trace_batch_size: int = 500
+    trace_flush_interval_seconds: float = 1.0
+    trace_queue_size: int = 20000
+    trace_enqueue_timeout_seconds: float = 5.0
+    
+    # Retention (days, 0 = keep forever), applied daily at 03:00 in chunks of
+    # retention_chunk_size ids; traces with a 5xx status are kept longer
+    metric_retention_days: int = 7
+    trace_retention_days: int = 7
+    trace_error_retention_days: int = 30
+    retention_chunk_size: int = 5000
+    # metrics / traces daily partitions are created this many days ahead
+    partition_premake_days: int = 7
+    # Hourly / daily metric rollups: each hourly run rebuilds this many closed
+    # hours; rollups are kept much longer than the minute rows
+    rollup_lookback_hours: int = 2
+    metric_hourly_retention_days: int = 90
+    metric_daily_retention_days: int = 730
 
     model_config = SettingsConfigDict(
         env_prefix="LIMITER_", 
@@ -1,11 +1,13 @@
 """Redis client configuration and connection management."""
 
 import redis
+import redis.asyncio as aioredis
 from typing import Optional
 
 from .config import settings
 
 _redis_client: Optional[redis.Redis] = None
+_async_redis_client: Optional[aioredis.Redis] = None
 
 
 def get_redis() -> redis.Redis:
@@ -28,3 +30,28 @@ def close_redis() -> None:
     if _redis_client is not None:
         _redis_client.close()
         _redis_client = None
+
+
+def get_async_redis() -> aioredis.Redis:
+    """Get the asyncio Redis client backed by a shared connection pool (singleton)."""
+    global _async_redis_client
+    if _async_redis_client is None:
+        pool = aioredis.ConnectionPool.from_url(
+            settings.redis_url,
+            decode_responses=settings.redis_decode_responses,
+            max_connections=settings.redis_max_connections,
+            socket_connect_timeout=5,
+            socket_keepalive=True,
+            health_check_interval=30,
+        )
+        _async_redis_client = aioredis.Redis(connection_pool=pool)
+    return _async_redis_client
+
+
+async def close_async_redis() -> None:
+    """Close the asyncio Redis client and its connection pool."""
+    global _async_redis_client
+    if _async_redis_client is not None:
+        await _async_redis_client.aclose()
+        await _async_redis_client.connection_pool.disconnect()
+        _async_redis_client = None
@@ -15,12 +15,11 @@ from pathlib import Path
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
-from sqlmodel import Session, SQLModel, select
+from sqlmodel import SQLModel
 
 from .api import api_router
-from .core import engine, close_redis, get_logger
-from .models import Quota
-from .services import init_jobs, limiter_service
+from .core import engine, close_async_redis, close_redis, get_logger
+from .services import init_jobs, limiter_service, partition_maintenance, quota_cache, trace_sink
 
 # 获取日志记录器
 logger = get_logger(__name__)
@@ -68,6 +67,8 @@ async def startup_event() -> None:
         # Create database tables
         logger.info("创建数据库表...")
         SQLModel.metadata.create_all(engine)
+        # metrics / traces are partitioned by day: make sure the current partitions exist
+        partition_maintenance()
         logger.info("✓ 数据库表创建完成")
         
         # Determine tasks directory
@@ -86,15 +87,14 @@ async def startup_event() -> None:
         
         # Load existing quotas into limiter service
         logger.info("加载配额配置到限流服务...")
-        with Session(engine) as session:
-            statement = select(Quota)
-            quotas = session.exec(statement).all()
-            logger.info(f"找到 {len(quotas)} 个配额配置")
-            for quota in quotas:
-                limiter_service.ensure_quota(quota)
-                logger.debug(f"加载配额: {quota.id}")
+        quota_cache.add_listener(limiter_service.sync_quotas)
+        quotas = quota_cache.all()
+        logger.info(f"找到 {len(quotas)} 个配额配置")
         logger.info("✓ 配额配置加载完成")
         
+        # Reload quotas in every worker when one of them changes a quota
+        quota_cache.start_subscriber()
+        
         logger.info("✓✓✓ 应用启动完成 ✓✓✓")
     except Exception as e:
         logger.error(f"✗✗✗ 应用启动失败: {e}", exc_info=True)
@@ -106,7 +106,13 @@ async def shutdown_event() -> None:
     """Clean up resources on shutdown."""
     logger.info("应用关闭中...")
     try:
+        quota_cache.stop_subscriber()
+        released = limiter_service.release_leases(expired_only=False)
+        logger.info(f"✓ 已归还 {released} 个令牌租约")
+        trace_sink.close()
+        logger.info(f"✓ 追踪日志已写入（丢弃 {trace_sink.dropped} 条）")
         close_redis()
+        await close_async_redis()
         logger.info("✓ Redis 连接已关闭")
         logger.info("✓ 应用已关闭")
     except Exception as e:
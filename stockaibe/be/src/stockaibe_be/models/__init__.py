@@ -2,6 +2,8 @@
 
 from .models import (
     Metric,
+    MetricDaily,
+    MetricHourly,
     Quota,
     SchedulerTask,
     ShanghaiACompanyNews,
@@ -22,6 +24,8 @@ __all__ = [
     "User",
     "Quota",
     "Metric",
+    "MetricHourly",
+    "MetricDaily",
     "TraceLog",
     "SchedulerTask",
     "ShanghaiAStock",
@@ -1,9 +1,11 @@
 from __future__ import annotations
 
 import datetime as dt
-from typing import Optional
+from typing import Dict, Optional
 
-from sqlalchemy import Text, UniqueConstraint, text
+from sqlalchemy import JSON, Text, UniqueConstraint, text
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.schema import CreateColumn, PrimaryKeyConstraint
 from sqlmodel import Field, SQLModel, Column
 
 
@@ -46,34 +48,99 @@ class Quota(TimestampMixin, table=True):
     refill_rate: float = Field(default=1.0)
     leak_rate: Optional[float] = Field(default=None)
     burst: Optional[int] = Field(default=None)
+    parent_id: Optional[str] = Field(default=None, foreign_key="quotas.id", index=True, max_length=100)  # 上级配额（如 endpoint → domain → global）
+    window_unit: Optional[str] = Field(default=None, max_length=20)  # fixed_window 的日历窗口：day / hour / minute
+    min_refill_rate: Optional[float] = Field(default=None)  # 自适应速率下限（默认为 refill_rate 的一定比例）
+    max_refill_rate: Optional[float] = Field(default=None)  # 自适应速率上限，设置后由速率控制器调整速率
     enabled: bool = Field(default=True)
     notes: Optional[str] = Field(default=None, sa_column=Column(Text))
 
 
 class Metric(SQLModel, table=True):
     __tablename__ = "metrics"
-    __table_args__ = {"extend_existing": True}
+    # Range-partitioned by day on PostgreSQL (see services/partitions.py); the
+    # partition key has to be part of the primary key
+    __table_args__ = {"extend_existing": True, "postgresql_partition_by": "RANGE (ts)"}
 
     id: Optional[int] = Field(default=None, primary_key=True, sa_column_kwargs={"autoincrement": True})
-    ts: dt.datetime = Field(index=True)
+    ts: dt.datetime = Field(primary_key=True, index=True)
     quota_id: str = Field(foreign_key="quotas.id", index=True)
     ok: int = Field(default=0)
     err: int = Field(default=0)
     r429: int = Field(default=0)
+    latency_p50: Optional[float] = Field(default=None)
     latency_p95: Optional[float] = Field(default=None)
+    latency_p99: Optional[float] = Field(default=None)
+    # Latency histogram of the minute ({"lb:<bucket>": count}), merged by the rollups
+    latency_hist: Optional[Dict[str, int]] = Field(default=None, sa_type=JSON)
     tokens_remain: Optional[float] = Field(default=None)
 
 
+# metrics / traces carry their partition key in the primary key, and SQLite
+# cannot autoincrement a composite key: there the id alone is the key, as
+# before partitioning (PostgreSQL keeps the composite key)
+_ID_KEYED_ON_SQLITE = {"metrics", "traces"}
+
+
+@compiles(CreateColumn, "sqlite")
+def _sqlite_create_column(element, compiler, **kw):
+    column = element.element
+    if column.table.name in _ID_KEYED_ON_SQLITE and column.name == "id":
+        return f"{compiler.preparer.format_column(column)} INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT"
+    return compiler.visit_create_column(element, **kw)
+
+
+@compiles(PrimaryKeyConstraint, "sqlite")
+def _sqlite_primary_key(constraint, compiler, **kw):
+    if constraint.table is not None and constraint.table.name in _ID_KEYED_ON_SQLITE:
+        return None  # declared inline on the id column
+    return compiler.visit_primary_key_constraint(constraint, **kw)
+
+
+class MetricRollupBase(SQLModel):
+    """Columns of the hourly / daily metric rollups (see services/rollups.py)."""
+    id: Optional[int] = Field(default=None, primary_key=True, sa_column_kwargs={"autoincrement": True})
+    ts: dt.datetime = Field(index=True)  # bucket start (UTC)
+    quota_id: str = Field(foreign_key="quotas.id", index=True)
+    ok: int = Field(default=0)
+    err: int = Field(default=0)
+    r429: int = Field(default=0)
+    latency_p50: Optional[float] = Field(default=None)
+    latency_p95: Optional[float] = Field(default=None)
+    latency_p99: Optional[float] = Field(default=None)
+    latency_hist: Optional[Dict[str, int]] = Field(default=None, sa_type=JSON)
+    tokens_remain: Optional[float] = Field(default=None)  # at the end of the bucket
+
+
+class MetricHourly(MetricRollupBase, table=True):
+    __tablename__ = "metrics_hourly"
+    __table_args__ = (UniqueConstraint("quota_id", "ts", name="uq_metrics_hourly_quota_ts"), {"extend_existing": True})
+
+
+class MetricDaily(MetricRollupBase, table=True):
+    __tablename__ = "metrics_daily"
+    __table_args__ = (UniqueConstraint("quota_id", "ts", name="uq_metrics_daily_quota_ts"), {"extend_existing": True})
+
+
 class TraceLog(TimestampMixin, table=True):
     __tablename__ = "traces"
-    __table_args__ = {"extend_existing": True}
+    # Range-partitioned by day on PostgreSQL, like metrics
+    __table_args__ = {"extend_existing": True, "postgresql_partition_by": "RANGE (created_at)"}
 
     id: Optional[int] = Field(default=None, primary_key=True, sa_column_kwargs={"autoincrement": True})
+    created_at: dt.datetime = Field(
+        default_factory=lambda: dt.datetime.now(dt.timezone.utc),
+        primary_key=True,
+        index=True,
+        sa_column_kwargs={"server_default": text("CURRENT_TIMESTAMP")}
+    )
     quota_id: str = Field(foreign_key="quotas.id", index=True)
     func_id: Optional[str] = Field(default=None, max_length=100, index=True)  # 限流函数ID（LimitTask/LimitCallTask的id）
     func_name: Optional[str] = Field(default=None, max_length=100)  # 限流函数名称
     status_code: int
-    latency_ms: Optional[float] = Field(default=None)
+    latency_ms: Optional[float] = Field(default=None)  # 执行耗时（不含等待令牌时间）
+    wait_ms: Optional[float] = Field(default=None)  # 等待令牌的时间
+    retries: Optional[int] = Field(default=None)  # 被限流后重试的次数
     message: Optional[str] = Field(default=None, sa_column=Column(Text))
 
 
@@ -3,9 +3,17 @@
 from .schemas import (
     AcquireRequest,
     AcquireResponse,
+    BatchAcquireDecision,
+    BatchAcquireItem,
+    BatchAcquireRequest,
+    BatchAcquireResponse,
+    TokensResponse,
     FuncStatsRead,
     MetricSeriesPoint,
     MetricsCurrentResponse,
+    BreakerStatus,
+    LimiterHealthResponse,
+    UpstreamConcurrencyStatus,
     MetricsSeriesResponse,
     PaginatedResponse,
     QuotaBase,
@@ -60,9 +68,17 @@ __all__ = [
     "QuotaRead",
     "AcquireRequest",
     "AcquireResponse",
+    "BatchAcquireItem",
+    "BatchAcquireRequest",
+    "BatchAcquireDecision",
+    "BatchAcquireResponse",
+    "TokensResponse",
     "MetricSeriesPoint",
     "MetricsSeriesResponse",
     "MetricsCurrentResponse",
+    "BreakerStatus",
+    "LimiterHealthResponse",
+    "UpstreamConcurrencyStatus",
     "TraceRead",
     "FuncStatsRead",
     "TaskCreate",
@@ -48,16 +48,24 @@ class UserLogin(BaseModel):
     password: str
 
 
+QuotaAlgo = Literal["token_bucket", "gcra", "leaky_bucket", "sliding_window", "fixed_window", "concurrency"]
+QuotaWindow = Literal["day", "hour", "minute"]
+
+
 class QuotaBase(BaseModel):
     id: str
     name: Optional[str] = None
     domain: Optional[str] = None
     endpoint: Optional[str] = None
-    algo: str = "token_bucket"
+    algo: QuotaAlgo = "token_bucket"
     capacity: int = 60
     refill_rate: float = 1.0
     leak_rate: Optional[float] = None
     burst: Optional[int] = None
+    parent_id: Optional[str] = None  # acquires also debit the parent chain
+    window_unit: Optional[QuotaWindow] = None  # fixed_window only, default "day"
+    min_refill_rate: Optional[float] = None  # adaptive rate floor
+    max_refill_rate: Optional[float] = None  # adaptive rate ceiling; set = rate controlled by AIMD
     enabled: bool = True
     notes: Optional[str] = None
 
@@ -70,11 +78,15 @@ class QuotaUpdate(BaseModel):
     name: Optional[str] = None
     domain: Optional[str] = None
     endpoint: Optional[str] = None
-    algo: Optional[str] = None
+    algo: Optional[QuotaAlgo] = None
     capacity: Optional[int] = None
     refill_rate: Optional[float] = None
     leak_rate: Optional[float] = None
     burst: Optional[int] = None
+    parent_id: Optional[str] = None
+    window_unit: Optional[QuotaWindow] = None
+    min_refill_rate: Optional[float] = None
+    max_refill_rate: Optional[float] = None
     enabled: Optional[bool] = None
     notes: Optional[str] = None
 
@@ -83,13 +95,14 @@ class QuotaRead(QuotaBase):
     created_at: dt.datetime
     updated_at: dt.datetime
     current_tokens: Optional[float] = None
+    effective_rate: Optional[float] = None  # adaptive quotas: rate set by the rate controller
     
     model_config = {"from_attributes": True}
 
 
 class AcquireRequest(BaseModel):
     qid: str
-    cost: int = 1
+    cost: int = Field(default=1, ge=1)
     latency_ms: Optional[float] = None
     success: bool = True
     message: Optional[str] = None
@@ -98,6 +111,40 @@ class AcquireRequest(BaseModel):
 class AcquireResponse(BaseModel):
     allow: bool
     remain: float
+    retry_after: float = 0.0  # seconds until the request can succeed, -1 = never
+    reset_at: Optional[dt.datetime] = None  # fixed_window: when the budget resets
+
+
+class BatchAcquireItem(BaseModel):
+    qid: str
+    cost: int = Field(default=1, ge=1)
+
+
+class BatchAcquireRequest(BaseModel):
+    items: List[BatchAcquireItem] = Field(min_length=1, max_length=5000)
+    latency_ms: Optional[float] = None
+    success: bool = True
+    message: Optional[str] = None
+
+
+class BatchAcquireDecision(BaseModel):
+    qid: str
+    cost: int
+    allow: bool
+    remain: float
+    retry_after: float
+    found: bool = True
+
+
+class BatchAcquireResponse(BaseModel):
+    items: List[BatchAcquireDecision]
+
+
+class TokensResponse(BaseModel):
+    quota_id: str
+    tokens_remain: Optional[float]
+    capacity: int
+    reset_at: Optional[dt.datetime] = None  # fixed_window: when the budget resets
 
 
 class MetricSeriesPoint(BaseModel):
@@ -106,12 +153,15 @@ class MetricSeriesPoint(BaseModel):
     ok: int
     err: int
     r429: int
+    latency_p50: Optional[float] = None
     latency_p95: Optional[float]
+    latency_p99: Optional[float] = None
     tokens_remain: Optional[float]
 
 
 class MetricsSeriesResponse(BaseModel):
     items: list[MetricSeriesPoint]
+    resolution: str = "1m"  # "1m", "1h" (hourly rollup) or "1d" (daily rollup)
 
 
 class MetricsCurrentResponse(BaseModel):
@@ -122,6 +172,29 @@ class MetricsCurrentResponse(BaseModel):
     tokens_remain: Optional[float]
 
 
+class BreakerStatus(BaseModel):
+    name: str
+    state: Literal["closed", "open", "half_open"]
+    failures: int  # consecutive failures
+    trips: int  # times the breaker opened since startup
+    open_seconds: Optional[float] = None
+    last_error: Optional[str] = None
+
+
+class UpstreamConcurrencyStatus(BaseModel):
+    name: str  # upstream host
+    limit: int  # current adaptive concurrency limit
+    inflight: int
+    base_rtt_ms: Optional[float] = None  # estimated no-load latency
+    short_rtt_ms: Optional[float] = None
+
+
+class LimiterHealthResponse(BaseModel):
+    breakers: List[BreakerStatus]
+    memory_fallback_quotas: int  # quotas served from memory, pending reconcile
+    upstreams: List[UpstreamConcurrencyStatus] = []  # adaptive limits of this process
+
+
 class TraceRead(BaseModel):
     id: int
     quota_id: str
@@ -129,6 +202,8 @@ class TraceRead(BaseModel):
     func_name: Optional[str] = None
     status_code: int
     latency_ms: Optional[float]
+    wait_ms: Optional[float] = None
+    retries: Optional[int] = None
     message: Optional[str]
     created_at: dt.datetime
 
@@ -161,6 +236,8 @@ class FuncStatsRead(BaseModel):
     failed_calls: int  # status_code = 500
     limited_calls: int  # status_code = 429
     avg_latency_ms: Optional[float]
+    avg_wait_ms: Optional[float] = None
+    total_retries: int = 0
     last_call_at: Optional[dt.datetime]
 
 
@@ -1,8 +1,33 @@
 """Business logic services."""
 
-from .limiter import BucketState, LimiterService, limiter_service
+from .limiter import (
+    AcquireDecision,
+    AsyncLimiterService,
+    BucketState,
+    ConcurrencyState,
+    FixedWindowState,
+    GcraState,
+    LeakyBucketState,
+    LimiterService,
+    RateLimitTimeout,
+    SlidingWindowState,
+    TokenLease,
+    TokenSnapshot,
+    async_limiter_service,
+    budget_reset_at,
+    limiter_service,
+)
+from .adaptive_concurrency import AdaptiveConcurrencyLimit, upstream_limit, upstream_limits
+from .circuit_breaker import CircuitBreaker
+from .quota_store import QuotaCache, quota_cache
+from .rate_control import QuotaSignals, RateController, rate_controller
+from .partitions import ensure_partitions, drop_expired_partitions, partition_maintenance
+from .retention import RetentionPolicy, apply_retention, retention_policies
+from .rollups import Resolution, choose_resolution, rollup_metrics
+from .shared_buckets import SharedBucketTable
 from .scheduler import init_jobs, register_cron_job, remove_job, scheduler, snapshot_metrics
 from .shanghai_a_service import ShanghaiAService
+from .trace_writer import TraceSink, trace_sink
 from .task_decorators import (
     SchedulerTask, 
     LimitTask, 
@@ -15,15 +40,48 @@ from .task_decorators import (
 from .task_registry import initialize_task_system, sync_tasks_to_database, get_active_tasks
 
 __all__ = [
+    "AcquireDecision",
     "BucketState",
+    "ConcurrencyState",
+    "FixedWindowState",
+    "GcraState",
+    "LeakyBucketState",
+    "SlidingWindowState",
     "LimiterService",
+    "AsyncLimiterService",
+    "RateLimitTimeout",
+    "TokenLease",
+    "TokenSnapshot",
     "limiter_service",
+    "async_limiter_service",
+    "budget_reset_at",
+    "AdaptiveConcurrencyLimit",
+    "upstream_limit",
+    "upstream_limits",
+    "CircuitBreaker",
+    "SharedBucketTable",
+    "QuotaCache",
+    "quota_cache",
+    "QuotaSignals",
+    "RateController",
+    "rate_controller",
+    "ensure_partitions",
+    "drop_expired_partitions",
+    "partition_maintenance",
+    "Resolution",
+    "choose_resolution",
+    "rollup_metrics",
+    "RetentionPolicy",
+    "apply_retention",
+    "retention_policies",
     "scheduler",
     "init_jobs",
     "register_cron_job",
     "remove_job",
     "snapshot_metrics",
     "ShanghaiAService",
+    "TraceSink",
+    "trace_sink",
     "SchedulerTask",
     "LimitTask",
     "LimitCallTask",
@@ -0,0 +1,133 @@
+"""Latency-driven adaptive concurrency limits for upstream hosts.
+
+Each upstream host gets a gradient limit (after Netflix's Gradient2 and TCP
+Vegas): the no-load latency of the host (the lowest latency seen, allowed
+to creep up slowly so it follows lasting changes) is compared with the
+average of the last few calls, and
+
+    gradient  = clamp(tolerance * base_rtt / short_rtt, 0.5, 1.0)
+    new_limit = limit * gradient + sqrt(limit)
+
+smoothed into the current limit. While latency stays flat the gradient is 1
+and the ``sqrt(limit)`` headroom grows the limit; when upstream queues and
+latency rises the gradient drops below 1 and the limit shrinks. Failed
+calls multiply the limit by ``backoff``. The limit only grows while callers
+actually use at least half of it.
+
+Limits are per process and sit underneath the quota checks: a LimitCallTask
+with ``upstream=host`` takes its quota token first, then waits for a slot of
+the host and holds it around the wrapped call, so the recorded latency is
+the upstream call alone.
+"""
+
+from __future__ import annotations
+
+import math
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional
+
+from ..core.config import settings
+from ..core.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+
+# Weight of a new sample in the recent latency average (~ the last 10 calls)
+SHORT_RTT_SMOOTHING = 2 / 11
+# The no-load latency estimate rises by this fraction per call (doubles in ~700 calls)
+BASE_RTT_DRIFT = 0.001
+
+
+@dataclass
+class AdaptiveConcurrencyLimit:
+    """Gradient concurrency limit of one upstream host, shared by the threads of this process."""
+    name: str
+    initial: int = settings.adaptive_concurrency_initial
+    min_limit: int = 1
+    max_limit: int = settings.adaptive_concurrency_max
+    tolerance: float = settings.adaptive_concurrency_tolerance
+    smoothing: float = 0.2
+    backoff: float = 0.9
+    limit: float = 0.0
+    inflight: int = 0
+    base_rtt: Optional[float] = None  # seconds
+    short_rtt: Optional[float] = None
+    _cond: threading.Condition = field(default_factory=threading.Condition)
+
+    def __post_init__(self) -> None:
+        self.limit = float(min(max(self.initial, self.min_limit), self.max_limit))
+
+    @contextmanager
+    def slot(self, timeout: Optional[float] = None) -> Iterator[None]:
+        """Hold one in-flight slot around an upstream call and learn from its latency.
+
+        Raises TimeoutError when no slot frees up within ``timeout`` seconds.
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.inflight < int(self.limit), timeout):
+                raise TimeoutError(f"上游 {self.name} 并发已满（{int(self.limit)}），等待超时")
+            self.inflight += 1
+            inflight = self.inflight
+        start = time.monotonic()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            with self._cond:
+                self.inflight -= 1
+                self._update(time.monotonic() - start, ok, inflight)
+                self._cond.notify_all()
+
+    def _update(self, rtt: float, ok: bool, inflight: int) -> None:
+        """Adjust the limit from one finished call; ``inflight`` is the count when it started."""
+        previous = int(self.limit)
+        if not ok:
+            self.limit = max(float(self.min_limit), self.limit * self.backoff)
+        else:
+            if self.base_rtt is None or self.short_rtt is None:
+                self.base_rtt = self.short_rtt = rtt
+            else:
+                self.short_rtt += (rtt - self.short_rtt) * SHORT_RTT_SMOOTHING
+                self.base_rtt = min(rtt, self.base_rtt * (1 + BASE_RTT_DRIFT))
+            # Not using the current limit, so latency says nothing about a higher one
+            if inflight < self.limit / 2:
+                return
+            gradient = max(0.5, min(1.0, self.tolerance * self.base_rtt / max(self.short_rtt, 1e-6)))
+            target = self.limit * gradient + math.sqrt(self.limit)
+            limit = self.limit * (1 - self.smoothing) + target * self.smoothing
+            self.limit = min(float(self.max_limit), max(float(self.min_limit), limit))
+        if int(self.limit) != previous:
+            logger.debug(f"上游 {self.name} 并发上限 {previous} → {int(self.limit)}")
+
+    def snapshot(self) -> dict:
+        """Current state for the metrics API."""
+        with self._cond:
+            return {
+                "name": self.name,
+                "limit": int(self.limit),
+                "inflight": self.inflight,
+                "base_rtt_ms": self.base_rtt * 1000 if self.base_rtt is not None else None,
+                "short_rtt_ms": self.short_rtt * 1000 if self.short_rtt is not None else None,
+            }
+
+
+_limits: Dict[str, AdaptiveConcurrencyLimit] = {}
+_limits_lock = threading.Lock()
+
+
+def upstream_limit(host: str) -> AdaptiveConcurrencyLimit:
+    """The adaptive concurrency limit of ``host`` (created on first use)."""
+    limit = _limits.get(host)
+    if limit is None:
+        with _limits_lock:
+            limit = _limits.setdefault(host, AdaptiveConcurrencyLimit(host))
+    return limit
+
+
+def upstream_limits() -> List[AdaptiveConcurrencyLimit]:
+    """All upstream limits created so far."""
+    return list(_limits.values())
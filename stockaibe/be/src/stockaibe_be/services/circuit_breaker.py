@@ -0,0 +1,85 @@
+"""Circuit breaker guarding the limiter's Redis path.
+
+After ``failure_threshold`` consecutive failures the breaker opens and
+callers use the in-memory fallback without waiting on Redis timeouts. Once
+``reset_timeout`` seconds pass a single call is let through as a probe
+(half-open): success closes the breaker, failure opens it again.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+from ..core.config import settings
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+@dataclass
+class CircuitBreaker:
+    """Thread-safe closed → open → half-open breaker. Times are ``time.monotonic()``."""
+    name: str
+    failure_threshold: int = settings.redis_breaker_failure_threshold
+    reset_timeout: float = settings.redis_breaker_reset_seconds
+    state: str = CLOSED
+    failures: int = 0  # consecutive failures
+    trips: int = 0  # times the breaker opened
+    opened_at: Optional[float] = None
+    probe_at: Optional[float] = None
+    last_error: Optional[str] = None
+    _lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def allow(self) -> bool:
+        """Whether a call may go to Redis now; in half-open only the probe does."""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            now = time.monotonic()
+            if self.state == OPEN and now - self.opened_at < self.reset_timeout:
+                return False
+            # Let one probe through; another one only if it never reported back
+            if self.state == HALF_OPEN and now - self.probe_at < self.reset_timeout:
+                return False
+            self.state = HALF_OPEN
+            self.probe_at = now
+            return True
+
+    def record_success(self) -> bool:
+        """Report a successful call. Returns True when this closed an open breaker."""
+        with self._lock:
+            recovered = self.state != CLOSED
+            self.state = CLOSED
+            self.failures = 0
+            self.opened_at = self.probe_at = None
+            return recovered
+
+    def record_failure(self, error: Exception | str) -> bool:
+        """Report a failed call. Returns True when this opened the breaker."""
+        with self._lock:
+            self.failures += 1
+            self.last_error = str(error)
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                self.probe_at = None
+                self.trips += 1
+                return True
+            return False
+
+    def snapshot(self) -> dict:
+        """Current state for the metrics API."""
+        with self._lock:
+            open_for = time.monotonic() - self.opened_at if self.opened_at is not None else None
+            return {
+                "name": self.name,
+                "state": self.state,
+                "failures": self.failures,
+                "trips": self.trips,
+                "open_seconds": open_for,
+                "last_error": self.last_error,
+            }
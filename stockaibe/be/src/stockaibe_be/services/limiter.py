@@ -2,192 +2,1313 @@
 
 from __future__ import annotations
 
+import asyncio
 import datetime as dt
+import math
+import threading
 import time
+import uuid
+from contextlib import contextmanager
 from dataclasses import dataclass, field
-from typing import Dict, Optional
+from typing import ClassVar, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Union
+from zoneinfo import ZoneInfo
 
 import redis
-from sqlalchemy.orm import Session
+import redis.asyncio as aioredis
 
-from ..core import get_redis, get_logger
-from ..models import Metric, Quota, TraceLog
+from ..core import get_async_redis, get_redis, get_logger
+from ..core.config import settings
+from ..models import Metric, Quota
+from .circuit_breaker import CircuitBreaker
+from .limiter_scripts import (
+    ALGORITHMS,
+    CONCURRENCY,
+    FIXED_WINDOW,
+    LATENCY_BUCKET_GROWTH,
+    LATENCY_BUCKET_PREFIX,
+    LATENCY_BUCKETS,
+    SCRIPTS,
+)
+from .quota_store import quota_cache
+from .shared_buckets import SharedBucketTable
+from .trace_writer import trace_sink
 
 # 获取日志记录器
 logger = get_logger(__name__)
 
 
-# Lua script for token bucket rate limiting with atomic operations
-LUA_TOKEN_BUCKET_SCRIPT = """
-local quota_key = KEYS[1]
-local stats_key = KEYS[2]
-local now = tonumber(ARGV[1])
-local capacity = tonumber(ARGV[2])
-local refill_rate = tonumber(ARGV[3])
-local cost = tonumber(ARGV[4])
+# Stats hashes (stats:{quota}:{minute}) are kept for one hour
+STATS_TTL_SECONDS = 3600
 
--- Get current tokens and last refill time
-local tokens = tonumber(redis.call('GET', quota_key .. ':tokens')) or capacity
-local last_refill = tonumber(redis.call('GET', quota_key .. ':last_refill')) or now
+# Tolerance for float rounding, same as EPS in the Lua scripts
+_EPSILON = 1e-9
 
--- Calculate refill
-local elapsed = now - last_refill
-local added = elapsed * refill_rate
-tokens = math.min(capacity, tokens + added)
 
--- Try to acquire
-local allowed = 0
-if tokens >= cost then
-    tokens = tokens - cost
-    allowed = 1
-end
+def _algo_params(quota: Quota) -> tuple[str, int, float]:
+    """Resolve ``(algo, capacity, rate)`` for a quota.
 
--- Update Redis
-redis.call('SET', quota_key .. ':tokens', tokens)
-redis.call('SET', quota_key .. ':last_refill', now)
+    - token_bucket: ``capacity`` tokens refilled at ``refill_rate``/s
+    - gcra: bursts of ``burst`` (default ``capacity``) at ``refill_rate``/s
+    - leaky_bucket: bucket of ``burst`` (default ``capacity``) draining at
+      ``leak_rate`` (default ``refill_rate``)/s
+    - sliding_window: ``capacity`` requests per ``capacity / refill_rate`` seconds
+    - fixed_window: ``capacity`` requests per calendar ``window_unit``, see
+      _window_args for the optional burst bucket
+    - concurrency: ``capacity`` calls in flight at once (no rate)
+    """
+    if quota.algo == CONCURRENCY:
+        return CONCURRENCY, quota.capacity, 0.0
+    algo = quota.algo if quota.algo in ALGORITHMS else "token_bucket"
+    if algo == "gcra":
+        return algo, quota.burst or quota.capacity, quota.refill_rate
+    if algo == "leaky_bucket":
+        return algo, quota.burst or quota.capacity, quota.leak_rate or quota.refill_rate
+    return algo, quota.capacity, quota.refill_rate
 
--- Return: allowed (0/1), remaining tokens
-return {allowed, tokens}
-"""
 
+def window_bounds(unit: Optional[str], now: float) -> tuple[int, int]:
+    """Start and reset (epoch seconds) of the calendar window containing ``now``.
 
-@dataclass
+    Windows are aligned to ``settings.scheduler_timezone``; ``unit`` is
+    "day" (default), "hour" or "minute". A day window resets at local
+    midnight, so it is 23 or 25 hours long across DST changes.
+    """
+    tz = ZoneInfo(settings.scheduler_timezone)
+    local = dt.datetime.fromtimestamp(now, tz)
+    if unit == "minute":
+        start = int(local.replace(second=0, microsecond=0).timestamp())
+        return start, start + 60
+    if unit == "hour":
+        start = int(local.replace(minute=0, second=0, microsecond=0).timestamp())
+        return start, start + 3600
+    day = local.date()
+    start = dt.datetime.combine(day, dt.time(), tzinfo=tz)
+    reset = dt.datetime.combine(day + dt.timedelta(days=1), dt.time(), tzinfo=tz)
+    return int(start.timestamp()), int(reset.timestamp())
+
+
+def budget_reset_at(quota: Quota, now: float | None = None) -> Optional[dt.datetime]:
+    """When the budget of a fixed_window quota resets (None for other algorithms)."""
+    if quota.algo != FIXED_WINDOW:
+        return None
+    _, reset = window_bounds(quota.window_unit, time.time() if now is None else now)
+    return dt.datetime.fromtimestamp(reset, dt.timezone.utc)
+
+
+def latency_histogram(stats: Mapping) -> Dict[str, int]:
+    """The non-empty histogram fields of a stats hash as ``{"lb:<bucket>": count}``.
+
+    Histograms of several minutes merge by adding the counts of each field,
+    and the result can be passed to ``latency_percentiles``.
+    """
+    histogram: Dict[str, int] = {}
+    for field_name, value in stats.items():
+        name = field_name.decode() if isinstance(field_name, bytes) else field_name
+        if name.startswith(LATENCY_BUCKET_PREFIX) and int(value):
+            histogram[name] = int(value)
+    return histogram
+
+
+def latency_percentiles(
+    stats: Mapping, quantiles: Sequence[float] = (0.5, 0.95, 0.99)
+) -> List[Optional[float]]:
+    """Latency percentiles (ms) from the histogram fields of a stats hash.
+
+    ``stats`` is the HGETALL of ``stats:{quota}:{minute}`` (bytes or str
+    keys). Values are interpolated inside their log bucket, so they are
+    within a bucket width of the true percentile. None when nothing was
+    recorded.
+    """
+    counts = [0] * LATENCY_BUCKETS
+    for field_name, value in stats.items():
+        name = field_name.decode() if isinstance(field_name, bytes) else field_name
+        if name.startswith(LATENCY_BUCKET_PREFIX):
+            counts[int(name[len(LATENCY_BUCKET_PREFIX):])] += int(value)
+    total = sum(counts)
+    if total == 0:
+        return [None for _ in quantiles]
+    result: List[Optional[float]] = []
+    for quantile in quantiles:
+        rank = quantile * total
+        seen = 0
+        for bucket, count in enumerate(counts):
+            if count and seen + count >= rank:
+                lower = LATENCY_BUCKET_GROWTH ** bucket if bucket > 0 else 0.0
+                if bucket == LATENCY_BUCKETS - 1:
+                    result.append(lower)  # open-ended last bucket
+                else:
+                    upper = LATENCY_BUCKET_GROWTH ** (bucket + 1)
+                    result.append(lower + (upper - lower) * max(0.0, rank - seen) / count)
+                break
+            seen += count
+    return result
+
+
+def _window_args(algo: str, unit: Optional[str], burst: Optional[int], now: float) -> tuple[int, int, int]:
+    """``window_start, window_reset, burst`` script arguments; zeros unless fixed_window.
+
+    A fixed_window ``burst`` layers a token bucket of ``burst`` tokens refilled
+    at ``refill_rate``/s on top of the window budget (0 = no burst limit).
+    """
+    if algo != FIXED_WINDOW:
+        return 0, 0, 0
+    start, reset = window_bounds(unit, now)
+    return start, reset, burst or 0
+
+
+def _state_key(quota_id: str, algo: str) -> str:
+    """Redis key holding the limiter state of a quota for an algorithm."""
+    if algo == "token_bucket":
+        return f"quota:{quota_id}"
+    return f"quota:{quota_id}:{algo}"
+
+
+def _outcome_arg(success: bool | None) -> int:
+    """Script argument for the outcome of a call: 1 ok, 0 err, -1 recorded later."""
+    if success is None:
+        return -1
+    return 1 if success else 0
+
+
+def _acquire_script_args(
+    items: Sequence[tuple[Quota, int]],
+    success: bool | None,
+    latency_ms: float | None = None,
+) -> tuple[list[str], list[float | int | str]]:
+    """Build KEYS and ARGV of the ``acquire`` script for (quota, cost) items.
+
+    Each quota is expanded to its parent chain so every level is checked.
+    ``success=None`` counts neither ok nor err; the caller reports the outcome
+    after the call with record_outcome.
+    """
+    now = time.time()
+    minute_key = dt.datetime.now(dt.timezone.utc).strftime("%Y%m%d%H%M")
+    keys: list[str] = []
+    args: list[float | int | str] = [now, STATS_TTL_SECONDS]
+    for quota, cost in items:
+        # Concurrency quotas in a parent chain are held with slots, not debited
+        chain = [level for level in quota_cache.chain(quota) if level.algo != CONCURRENCY]
+        args.extend((cost, _outcome_arg(success), latency_ms or 0, len(chain)))
+        for level in chain:
+            algo, capacity, rate = _algo_params(level)
+            keys.append(_state_key(level.id, algo))
+            keys.append(f"stats:{level.id}:{minute_key}")
+            args.extend((algo, capacity, rate, 1 if level.enabled else 0))
+            args.extend(_window_args(algo, level.window_unit, level.burst, now))
+    return keys, args
+
+
+def _parse_acquire_reply(result: Sequence) -> List[tuple[bool, float, float]]:
+    """Split the flat ``acquire`` reply into (allowed, remain, retry_after) per item."""
+    return [
+        (bool(int(result[i])), float(result[i + 1]), float(result[i + 2]))
+        for i in range(0, len(result), 3)
+    ]
+
+
+def _peek_script_args(quota_id: str, state: LimiterState) -> list[float | str]:
+    """KEYS and ARGV of the ``peek`` script for a quota's current algorithm."""
+    now = time.time()
+    unit, burst = (state.window_unit, state.burst) if isinstance(state, FixedWindowState) else (None, 0)
+    return [
+        _state_key(quota_id, state.algo),
+        now,
+        state.algo,
+        state.capacity,
+        state.refill_rate,
+        *_window_args(state.algo, unit, burst, now),
+    ]
+
+
+def _inspect_script_args(quotas: Sequence[Quota]) -> tuple[list[str], list[float | int | str]]:
+    """KEYS and ARGV of the read-only ``inspect`` script for many quotas."""
+    now = time.time()
+    keys: list[str] = []
+    args: list[float | int | str] = [now]
+    for quota in quotas:
+        algo, capacity, rate = _algo_params(quota)
+        keys.append(_state_key(quota.id, algo))
+        args.extend((algo, capacity, rate, *_window_args(algo, quota.window_unit, quota.burst, now)))
+    return keys, args
+
+
+def _parse_inspect_reply(quotas: Sequence[Quota], result: Sequence) -> List[TokenSnapshot]:
+    """Split the flat ``inspect`` reply into one TokenSnapshot per quota."""
+    return [
+        TokenSnapshot(
+            quota_id=quota.id,
+            tokens=float(result[i * 3]),
+            capacity=float(result[i * 3 + 1]),
+            time_to_full=float(result[i * 3 + 2]),
+        )
+        for i, quota in enumerate(quotas)
+    ]
+
+
+@dataclass(slots=True)
 class BucketState:
-    """In-memory bucket state for fallback when Redis is unavailable."""
+    """In-memory bucket state for fallback when Redis is unavailable.
+
+    Like the other twins below, times are ``time.monotonic()`` seconds and
+    callers hold the quota's stripe lock (see LimiterService._stripes_for).
+    """
+    algo: ClassVar[str] = "token_bucket"
+
     tokens: float
-    last_refill: dt.datetime
+    last_refill: float
     capacity: int
     refill_rate: float
-    leak_rate: float | None = None
 
-    def refill(self, now: dt.datetime) -> None:
-        if self.leak_rate and self.leak_rate > 0:
-            elapsed = (now - self.last_refill).total_seconds()
-            leaked = elapsed * self.leak_rate
-            self.tokens = max(0.0, self.tokens - leaked)
+    @classmethod
+    def new(cls, capacity: int, rate: float, now: float) -> "BucketState":
+        return cls(tokens=float(capacity), last_refill=now, capacity=capacity, refill_rate=rate)
+
+    def reconfigure(self, capacity: int, rate: float) -> None:
+        self.capacity = capacity
+        self.refill_rate = rate
+        self.tokens = min(self.tokens, capacity)
+
+    def refill(self, now: float) -> None:
         if self.refill_rate > 0:
-            elapsed = (now - self.last_refill).total_seconds()
-            added = elapsed * self.refill_rate
+            added = (now - self.last_refill) * self.refill_rate
             self.tokens = min(self.capacity, self.tokens + added)
         self.last_refill = now
 
-    def acquire(self, cost: int, now: dt.datetime) -> bool:
+    def acquire(self, cost: int, now: float) -> bool:
         self.refill(now)
-        if self.tokens >= cost:
+        if self.tokens + _EPSILON >= cost:
             self.tokens -= cost
             return True
         return False
 
+    def retry_after(self, cost: int) -> float:
+        """Seconds until ``cost`` tokens are available, -1 if never."""
+        if self.tokens + _EPSILON >= cost:
+            return 0.0
+        if cost > self.capacity or self.refill_rate <= 0:
+            return -1.0
+        return (cost - self.tokens) / self.refill_rate
+
+
+@dataclass(slots=True)
+class GcraState:
+    """In-memory twin of the ``gcra`` script (theoretical arrival time)."""
+    algo: ClassVar[str] = "gcra"
+
+    tat: float
+    last_seen: float
+    capacity: int
+    refill_rate: float
+
+    @classmethod
+    def new(cls, capacity: int, rate: float, now: float) -> "GcraState":
+        return cls(tat=now, last_seen=now, capacity=capacity, refill_rate=rate)
+
+    def reconfigure(self, capacity: int, rate: float) -> None:
+        self.capacity = capacity
+        self.refill_rate = rate
+
+    @property
+    def tokens(self) -> float:
+        if self.refill_rate <= 0:
+            return 0.0
+        return self.capacity - (self.tat - self.last_seen) * self.refill_rate
+
+    def refill(self, now: float) -> None:
+        self.last_seen = now
+        if self.tat < now:
+            self.tat = now
+
+    def acquire(self, cost: int, now: float) -> bool:
+        self.refill(now)
+        if self.refill_rate <= 0:
+            return False
+        ahead = (self.tat - now) + cost / self.refill_rate
+        if ahead <= self.capacity / self.refill_rate + _EPSILON:
+            self.tat = now + ahead
+            return True
+        return False
+
+    def retry_after(self, cost: int) -> float:
+        if self.refill_rate <= 0 or cost > self.capacity:
+            return -1.0
+        ahead = (self.tat - self.last_seen) + cost / self.refill_rate
+        return max(0.0, ahead - self.capacity / self.refill_rate)
+
+
+@dataclass(slots=True)
+class LeakyBucketState:
+    """In-memory twin of the ``leaky_bucket`` script (bucket as a meter)."""
+    algo: ClassVar[str] = "leaky_bucket"
+
+    level: float
+    last_leak: float
+    capacity: int
+    refill_rate: float  # leak rate
+
+    @classmethod
+    def new(cls, capacity: int, rate: float, now: float) -> "LeakyBucketState":
+        return cls(level=0.0, last_leak=now, capacity=capacity, refill_rate=rate)
+
+    def reconfigure(self, capacity: int, rate: float) -> None:
+        self.capacity = capacity
+        self.refill_rate = rate
+
+    @property
+    def tokens(self) -> float:
+        return self.capacity - self.level
+
+    def refill(self, now: float) -> None:
+        if self.refill_rate > 0:
+            self.level = max(0.0, self.level - (now - self.last_leak) * self.refill_rate)
+        self.last_leak = now
+
+    def acquire(self, cost: int, now: float) -> bool:
+        self.refill(now)
+        if self.level + cost <= self.capacity + _EPSILON:
+            self.level += cost
+            return True
+        return False
+
+    def retry_after(self, cost: int) -> float:
+        if self.level + cost <= self.capacity + _EPSILON:
+            return 0.0
+        if cost > self.capacity or self.refill_rate <= 0:
+            return -1.0
+        return (self.level + cost - self.capacity) / self.refill_rate
+
+
+@dataclass(slots=True)
+class SlidingWindowState:
+    """In-memory twin of the ``sliding_window`` script (weighted two-window counter)."""
+    algo: ClassVar[str] = "sliding_window"
+
+    start: float
+    last_seen: float
+    capacity: int
+    refill_rate: float
+    cur: float = 0.0
+    prev: float = 0.0
+
+    @classmethod
+    def new(cls, capacity: int, rate: float, now: float) -> "SlidingWindowState":
+        return cls(start=now, last_seen=now, capacity=capacity, refill_rate=rate)
+
+    def reconfigure(self, capacity: int, rate: float) -> None:
+        self.capacity = capacity
+        self.refill_rate = rate
+
+    @property
+    def window(self) -> float:
+        return self.capacity / self.refill_rate if self.refill_rate > 0 else float("inf")
+
+    @property
+    def used(self) -> float:
+        offset = self.last_seen - self.start
+        return self.prev * (1 - offset / self.window) + self.cur
+
+    @property
+    def tokens(self) -> float:
+        return max(0.0, self.capacity - self.used)
+
+    def refill(self, now: float) -> None:
+        self.last_seen = now
+        window = self.window
+        periods = int((now - self.start) // window)
+        if periods >= 2:
+            self.prev = self.cur = 0.0
+        elif periods == 1:
+            self.prev, self.cur = self.cur, 0.0
+        if periods >= 1:
+            self.start += periods * window
+
+    def acquire(self, cost: int, now: float) -> bool:
+        self.refill(now)
+        if self.refill_rate > 0 and self.used + cost <= self.capacity + _EPSILON:
+            self.cur += cost
+            return True
+        return False
+
+    def retry_after(self, cost: int) -> float:
+        if self.refill_rate > 0 and self.used + cost <= self.capacity + _EPSILON:
+            return 0.0
+        if cost > self.capacity or self.refill_rate <= 0:
+            return -1.0
+        room = self.capacity - cost
+        window = self.window
+        if self.cur <= room and self.prev > 0:
+            offset = window * (1 - (room - self.cur) / self.prev)
+        elif self.cur > 0:
+            offset = window + window * (1 - room / self.cur)
+        else:
+            offset = window
+        return max(0.0, offset - (self.last_seen - self.start))
+
+
+@dataclass(slots=True)
+class FixedWindowState:
+    """In-memory twin of the ``fixed_window`` script (calendar window + burst bucket).
+
+    The calendar window follows the wall clock; only the burst bucket uses
+    the monotonic ``now``.
+    """
+    algo: ClassVar[str] = FIXED_WINDOW
+
+    capacity: int
+    refill_rate: float
+    last_seen: float
+    window_unit: str = "day"
+    burst: int = 0
+    start: int = 0  # epoch seconds of the current window
+    reset: int = 0
+    wall: float = 0.0  # epoch seconds at last_seen
+    used: float = 0.0
+    bucket: Optional[float] = None  # burst tokens left, None = full
+
+    @classmethod
+    def new(cls, capacity: int, rate: float, now: float) -> "FixedWindowState":
+        return cls(capacity=capacity, refill_rate=rate, last_seen=now)
+
+    def reconfigure(self, capacity: int, rate: float) -> None:
+        self.capacity = capacity
+        self.refill_rate = rate
+
+    def configure_window(self, unit: Optional[str], burst: Optional[int]) -> None:
+        unit = unit or "day"
+        if unit != self.window_unit:
+            self.window_unit = unit
+            self.reset = 0  # recompute the window on the next refill
+        self.burst = burst or 0
+        if self.bucket is not None:
+            self.bucket = min(self.bucket, self.burst)
+
+    @property
+    def tokens(self) -> float:
+        return max(0.0, self.capacity - self.used)
+
+    def refill(self, now: float) -> None:
+        wall = time.time()
+        # Window bounds only change when the window rolls over
+        if not self.start <= wall < self.reset:
+            start, self.reset = window_bounds(self.window_unit, wall)
+            if start != self.start:
+                self.start, self.used = start, 0.0
+        if self.burst > 0:
+            elapsed = max(0.0, now - self.last_seen)
+            bucket = self.burst if self.bucket is None else self.bucket
+            self.bucket = min(self.burst, bucket + elapsed * self.refill_rate)
+        self.last_seen = now
+        self.wall = wall
+
+    def _fits(self, cost: int) -> tuple[bool, bool]:
+        fits_window = self.used + cost <= self.capacity + _EPSILON
+        fits_burst = self.burst <= 0 or (self.bucket or 0.0) + _EPSILON >= cost
+        return fits_window, fits_burst
+
+    def acquire(self, cost: int, now: float) -> bool:
+        self.refill(now)
+        fits_window, fits_burst = self._fits(cost)
+        if fits_window and fits_burst:
+            self.used += cost
+            if self.burst > 0:
+                self.bucket -= cost
+            return True
+        return False
+
+    def retry_after(self, cost: int) -> float:
+        fits_window, fits_burst = self._fits(cost)
+        if fits_window and fits_burst:
+            return 0.0
+        if cost > self.capacity or (self.burst > 0 and (cost > self.burst or self.refill_rate <= 0)):
+            return -1.0
+        wait = 0.0
+        if not fits_window:
+            wait = max(0.0, self.reset - self.wall)
+        if not fits_burst:
+            wait = max(wait, (cost - (self.bucket or 0.0)) / self.refill_rate)
+        return wait
+
+
+@dataclass(slots=True)
+class ConcurrencyState:
+    """In-memory twin of the slot scripts; only sees slots held by this process."""
+    algo: ClassVar[str] = CONCURRENCY
+
+    capacity: int
+    refill_rate: float  # unused, keeps the common state interface
+    leases: Dict[str, float] = field(default_factory=dict)  # lease id -> expiry (monotonic)
+
+    @classmethod
+    def new(cls, capacity: int, rate: float, now: float) -> "ConcurrencyState":
+        return cls(capacity=capacity, refill_rate=rate)
+
+    def reconfigure(self, capacity: int, rate: float) -> None:
+        self.capacity = capacity
+
+    @property
+    def tokens(self) -> float:
+        return float(max(0, self.capacity - len(self.leases)))
+
+    def refill(self, now: float) -> None:
+        for lease_id in [lid for lid, expires in self.leases.items() if expires <= now]:
+            del self.leases[lease_id]
+
+    def hold(self, lease_id: str, ttl: float, now: float) -> bool:
+        self.refill(now)
+        if len(self.leases) < self.capacity:
+            self.leases[lease_id] = now + ttl
+            return True
+        return False
+
+    def release(self, lease_id: str) -> bool:
+        return self.leases.pop(lease_id, None) is not None
+
+    def renew(self, lease_id: str, ttl: float, now: float) -> bool:
+        if lease_id not in self.leases:
+            return False
+        self.leases[lease_id] = now + ttl
+        return True
+
+    def retry_after(self, cost: int) -> float:
+        """Seconds until the oldest lease expires, -1 if no slot can ever free up."""
+        if self.capacity <= 0:
+            return -1.0
+        if len(self.leases) < self.capacity:
+            return 0.0
+        return max(0.0, min(self.leases.values()) - time.monotonic())
+
+
+LimiterState = Union[
+    BucketState, GcraState, LeakyBucketState, SlidingWindowState, FixedWindowState, ConcurrencyState
+]
+
+
+def _time_to_full(state: LimiterState, tokens: float) -> float:
+    """Seconds until an in-memory twin with ``tokens`` left is full again, -1 if never.
+
+    Twin of time_to_full in the ``inspect`` script; ``state`` is refilled.
+    """
+    if isinstance(state, ConcurrencyState):
+        if not state.leases:
+            return 0.0
+        return max(0.0, max(state.leases.values()) - time.monotonic())
+    if tokens + _EPSILON >= state.capacity:
+        return 0.0
+    if isinstance(state, FixedWindowState):
+        return max(0.0, state.reset - state.wall)
+    if state.refill_rate <= 0:
+        return -1.0
+    if isinstance(state, SlidingWindowState):
+        periods = 2 if state.cur > 0 else 1
+        return max(0.0, state.start + periods * state.window - state.last_seen)
+    return (state.capacity - tokens) / state.refill_rate
+
+# In-memory twin for each algorithm of the Lua scripts
+STATE_TYPES: Dict[str, type] = {
+    "token_bucket": BucketState,
+    "gcra": GcraState,
+    "leaky_bucket": LeakyBucketState,
+    "sliding_window": SlidingWindowState,
+    FIXED_WINDOW: FixedWindowState,
+    CONCURRENCY: ConcurrencyState,
+}
+
+
+@dataclass
+class TokenSnapshot:
+    """Read-only view of a quota, see LimiterService.inspect_many."""
+    quota_id: str
+    tokens: float
+    capacity: float
+    time_to_full: float  # seconds until full again, 0 = full, -1 = never
+
+
+@dataclass
+class AcquireDecision:
+    """Outcome of a batch item or a blocking acquire."""
+    qid: str
+    cost: int
+    allowed: bool
+    remain: float
+    retry_after: float
+    found: bool = True
+    waited: float = 0.0  # seconds slept by acquire_blocking
+    attempts: int = 1
+    lease_id: Optional[str] = None  # concurrency slot held, see acquire_slot
+
+
+class RateLimitTimeout(RuntimeError):
+    """Raised by acquire_blocking when tokens cannot be obtained in time."""
+
+    def __init__(self, message: str, decision: AcquireDecision):
+        super().__init__(message)
+        self.decision = decision
+
+
+@dataclass
+class TokenLease:
+    """Block of tokens reserved from Redis and handed out locally.
+
+    ``tokens`` are still unused, ``used`` were handed out; ``ok`` of those
+    were taken with ``success=True`` and are reported as ok stats when the
+    lease goes back. ``rate`` is the smoothed call rate (calls/s) that sizes
+    the next lease. Times are ``time.monotonic()``.
+    """
+    quota: Quota
+    tokens: int
+    used: int
+    granted_at: float
+    expires_at: float
+    rate: float = 0.0
+    ok: int = 0
+
+
+# Weight of the newest observation in the lease call-rate average
+LEASE_RATE_SMOOTHING = 0.5
+
+# Locks guarding the in-memory states; a quota maps to one by its id hash
+STATE_LOCK_STRIPES = 64
+
 
 @dataclass
 class LimiterService:
-    """Rate limiter service with Redis + Lua script support."""
-    states: Dict[str, BucketState] = field(default_factory=dict)
+    """Rate limiter service with Redis + Lua script support.
+
+    Redis calls go through ``breaker``: while it is open the in-memory twins
+    enforce the limits, and when a probe succeeds the usage served from
+    memory is reconciled back into Redis. Token-bucket chains fall back to
+    ``shared``, a table in shared memory, so all workers on the host enforce
+    one limit; other algorithms use the per-process twins in ``states``,
+    each guarded by one of the ``_stripes`` locks. Token leases are guarded
+    per quota by the ``_lease_stripes`` locks, so a lease renewal waiting on
+    Redis only holds up callers of the same quota.
+    """
+    states: Dict[str, LimiterState] = field(default_factory=dict)
+    breaker: CircuitBreaker = field(default_factory=lambda: CircuitBreaker("redis"))
     _redis: Optional[redis.Redis] = None
-    _lua_sha: Optional[str] = None
-    _use_redis: bool = True
+    _lua_shas: Dict[str, str] = field(default_factory=dict)
+    _leases: Dict[str, TokenLease] = field(default_factory=dict)
+    _lease_stripes: List[threading.Lock] = field(
+        default_factory=lambda: [threading.Lock() for _ in range(STATE_LOCK_STRIPES)]
+    )
+    _slot_lock: threading.Lock = field(default_factory=threading.Lock)  # in-memory concurrency slots
+    _outage_quotas: set = field(default_factory=set)  # served from memory since the last reconcile
+    _outage_lock: threading.Lock = field(default_factory=threading.Lock)
+    shared: Optional[SharedBucketTable] = None
+    _shared_opened: bool = False
+    _shared_lock: threading.Lock = field(default_factory=threading.Lock)
+    _stripes: List[threading.Lock] = field(
+        default_factory=lambda: [threading.Lock() for _ in range(STATE_LOCK_STRIPES)]
+    )
+
+    def _stripes_for(self, quota_ids: Iterable[str]) -> List[threading.Lock]:
+        """Stripe locks of the states of ``quota_ids``, in one global order so lockers never deadlock."""
+        stripes = self._stripes
+        return [stripes[i] for i in sorted({hash(quota_id) % STATE_LOCK_STRIPES for quota_id in quota_ids})]
+
+    def _lease_stripe(self, quota_id: str) -> threading.Lock:
+        """Lock guarding the token lease of ``quota_id``."""
+        return self._lease_stripes[hash(quota_id) % STATE_LOCK_STRIPES]
 
     def _get_redis(self) -> Optional[redis.Redis]:
-        """Get Redis client, cache it, and handle connection errors."""
-        if not self._use_redis:
-            return None
+        """Get Redis client, cache it, and load the Lua scripts on first use."""
         if self._redis is None:
             try:
-                self._redis = get_redis()
-                # Load Lua script
-                self._lua_sha = self._redis.script_load(LUA_TOKEN_BUCKET_SCRIPT)
+                client = get_redis()
+                self._load_scripts(client)
+                self._redis = client
                 logger.info("Redis 连接成功，Lua 脚本已加载")
             except Exception as e:
-                logger.warning(f"Redis 连接失败，回退到内存模式: {e}")
-                self._use_redis = False
+                logger.warning(f"Redis 连接失败，使用内存模式: {e}")
+                self._redis_failed(e)
                 return None
         return self._redis
 
+    def _load_scripts(self, r: redis.Redis) -> None:
+        for name, script in SCRIPTS.items():
+            self._lua_shas[name] = r.script_load(script)
+
+    def _evalsha(self, name: str, numkeys: int, *keys_and_args):
+        """Run a loaded script; reload the scripts once if Redis lost them (NOSCRIPT after a restart)."""
+        r = self._get_redis()
+        if not r or name not in self._lua_shas:
+            raise RuntimeError("Redis not available")
+        try:
+            return r.evalsha(self._lua_shas[name], numkeys, *keys_and_args)
+        except redis.exceptions.NoScriptError:
+            logger.warning("Redis 脚本缓存已丢失（可能已重启），重新加载 Lua 脚本")
+            self._load_scripts(r)
+            return r.evalsha(self._lua_shas[name], numkeys, *keys_and_args)
+
+    def _redis_ready(self) -> bool:
+        """Whether to use Redis for this call: let through by the breaker."""
+        return self.breaker.allow()
+
+    def _redis_failed(self, error: Exception) -> None:
+        if self.breaker.record_failure(error):
+            logger.warning(
+                f"Redis 熔断器打开，{self.breaker.reset_timeout:.1f}s 后探测恢复，期间使用内存限流: {error}"
+            )
+
+    def _redis_succeeded(self) -> None:
+        if self.breaker.record_success():
+            reconciled = self.reconcile()
+            logger.info(f"Redis 已恢复，熔断器关闭，已同步 {reconciled} 个配额的内存状态")
+
+    def _shared_table(self) -> Optional[SharedBucketTable]:
+        """Shared-memory bucket table, opened on first use of the fallback."""
+        if not self._shared_opened:
+            with self._shared_lock:
+                if not self._shared_opened:
+                    self.shared = SharedBucketTable.open_default()
+                    self._shared_opened = True
+        return self.shared
+
+    def _fallback_tokens(self, quota_id: str, state: LimiterState) -> float:
+        """Remaining capacity of a quota in the fallback (shared table or twin)."""
+        if self.shared is not None and state.algo == "token_bucket":
+            tokens = self.shared.tokens(quota_id, state.capacity, state.refill_rate)
+            if tokens is not None:
+                return tokens
+        with self._stripes_for([quota_id])[0]:
+            state.refill(time.monotonic())
+            return state.tokens
+
+    @property
+    def pending_reconcile(self) -> int:
+        """Quotas served from memory that are not reconciled to Redis yet."""
+        return len(self._outage_quotas)
+
+    def reconcile(self) -> int:
+        """Write usage served from memory during a Redis outage back to Redis.
+
+        Every quota touched in memory is debited in Redis down to the
+        remaining capacity of its in-memory twin, so the shared state is no
+        fuller than what this process already handed out. Returns the number
+        of quotas that were debited.
+        """
+        with self._outage_lock:
+            quota_ids, self._outage_quotas = self._outage_quotas, set()
+        debited = 0
+        pending = list(quota_ids)
+        while pending:
+            quota_id = pending[-1]
+            state = self.states.get(quota_id)
+            if state is not None and state.algo != CONCURRENCY:
+                target = self._fallback_tokens(quota_id, state)
+                try:
+                    amount = self._evalsha("reconcile", 1, *_peek_script_args(quota_id, state), target)
+                except Exception as e:
+                    logger.warning(f"同步内存限流状态失败 {quota_id}: {e}")
+                    with self._outage_lock:
+                        self._outage_quotas.update(pending)
+                    self._redis_failed(e)
+                    break
+                debited += 1 if int(amount) > 0 else 0
+            pending.pop()
+        return debited
+
     def ensure_quota(self, quota: Quota) -> None:
-        """Ensure quota is initialized in Redis or memory."""
-        now = dt.datetime.now(dt.timezone.utc)
+        """Ensure quota is initialized in memory (Redis state is created lazily)."""
+        with self._stripes_for([quota.id])[0]:
+            self._configure_state(quota)
+
+    def _configure_state(self, quota: Quota) -> LimiterState:
+        """Create or reconfigure the in-memory twin of a quota; the caller holds its stripe lock."""
+        algo, capacity, rate = _algo_params(quota)
         
         # Always maintain memory state as fallback
-        if quota.id not in self.states:
-            self.states[quota.id] = BucketState(
-                tokens=float(quota.capacity),
-                last_refill=now,
-                capacity=quota.capacity,
-                refill_rate=quota.refill_rate,
-                leak_rate=quota.leak_rate,
-            )
+        state = self.states.get(quota.id)
+        if state is None or state.algo != algo:
+            state = self.states[quota.id] = STATE_TYPES[algo].new(capacity, rate, time.monotonic())
         else:
-            state = self.states[quota.id]
-            state.capacity = quota.capacity
-            state.refill_rate = quota.refill_rate
-            state.leak_rate = quota.leak_rate
-            state.tokens = min(state.tokens, quota.capacity)
-        
-        # Initialize Redis if available
-        r = self._get_redis()
-        if r:
-            try:
-                quota_key = f"quota:{quota.id}"
-                if not r.exists(f"{quota_key}:tokens"):
-                    r.set(f"{quota_key}:tokens", quota.capacity)
-                    r.set(f"{quota_key}:last_refill", time.time())
-                    logger.debug(f"Redis 中初始化配额: {quota.id}")
-            except Exception as e:
-                logger.error(f"Redis 初始化配额失败 {quota.id}: {e}")
+            state.reconfigure(capacity, rate)
+        if isinstance(state, FixedWindowState):
+            state.configure_window(quota.window_unit, quota.burst)
+        return state
+
+    def sync_quotas(self, quotas: Sequence[Quota]) -> None:
+        """Bring in-memory state in line with the full list of quota definitions."""
+        for quota in quotas:
+            self.ensure_quota(quota)
+        known = {quota.id for quota in quotas}
+        for quota_id in [qid for qid in self.states if qid not in known]:
+            self.states.pop(quota_id, None)
 
     def remove_quota(self, quota_id: str) -> None:
         """Remove quota from memory and Redis."""
         self.states.pop(quota_id, None)
-        r = self._get_redis()
-        if r:
+        with self._lease_stripe(quota_id):
+            self._leases.pop(quota_id, None)
+        if self._redis_ready():
             try:
+                r = self._get_redis()
+                if r is None:
+                    raise RuntimeError("Redis not available")
                 quota_key = f"quota:{quota_id}"
-                r.delete(f"{quota_key}:tokens", f"{quota_key}:last_refill")
-            except Exception:
-                pass
+                # Also drop the legacy string keys (:tokens / :last_refill)
+                r.delete(
+                    *(_state_key(quota_id, algo) for algo in (*ALGORITHMS, CONCURRENCY)),
+                    f"{quota_key}:tokens",
+                    f"{quota_key}:last_refill",
+                )
+            except Exception as e:
+                logger.warning(f"删除 Redis 限流状态失败 {quota_id}: {e}")
+                self._redis_failed(e)
+            else:
+                self._redis_succeeded()
+
+    def _acquire_redis_many(
+        self,
+        items: Sequence[tuple[Quota, int]],
+        success: bool | None,
+        latency_ms: float | None = None,
+    ) -> List[tuple[bool, float, float]]:
+        """Acquire tokens for many (quota, cost) items with a single Lua script call."""
+        keys, args = _acquire_script_args(items, success, latency_ms)
+        result = self._evalsha("acquire", len(keys), *keys, *args)
+        return _parse_acquire_reply(result)
 
     def _acquire_redis(
+        self,
+        quota: Quota,
+        cost: int,
+        success: bool | None,
+        latency_ms: float | None = None,
+    ) -> tuple[bool, float, float]:
+        """Acquire tokens and record stats with a single Lua script call."""
+        return self._acquire_redis_many([(quota, cost)], success, latency_ms)[0]
+
+    def _acquire_memory(
         self, quota: Quota, cost: int
-    ) -> tuple[bool, float]:
-        """Acquire tokens using Redis + Lua script."""
-        r = self._get_redis()
-        if not r or not self._lua_sha:
-            raise RuntimeError("Redis not available")
-        
-        quota_key = f"quota:{quota.id}"
+    ) -> tuple[bool, float, float]:
+        """Acquire tokens using the in-memory twins of the quota chain (fallback).
+
+        Like the acquire script, every level is checked before any is debited.
+        Chains of token buckets use the shared-memory table when it is available.
+        States are created on first use; later changes to a quota reach them
+        through ensure_quota / sync_quotas, not on every call.
+        """
+        chain = [level for level in quota_cache.chain(quota) if level.algo != CONCURRENCY]
+        if any(level.id not in self._outage_quotas for level in chain):
+            with self._outage_lock:
+                self._outage_quotas.update(level.id for level in chain)
+        locks = self._stripes_for(level.id for level in chain)
+        for lock in locks:
+            lock.acquire()
+        try:
+            states = [self.states.get(level.id) or self._configure_state(level) for level in chain]
+            table = self._shared_table()
+            if table is not None and all(state.algo == "token_bucket" for state in states):
+                outcome = table.acquire(
+                    [
+                        (level.id, state.capacity, state.refill_rate, level.enabled)
+                        for level, state in zip(chain, states)
+                    ],
+                    cost,
+                )
+                if outcome is not None:
+                    return outcome
+            now = time.monotonic()
+            allowed = True
+            retry_after = 0.0
+            for level, state in zip(chain, states):
+                state.refill(now)
+                level_retry = state.retry_after(cost) if level.enabled else -1.0
+                if level_retry < 0 or level_retry > _EPSILON:
+                    allowed = False
+                    retry_after = -1.0 if level_retry < 0 or retry_after < 0 else max(retry_after, level_retry)
+            if allowed:
+                for state in states:
+                    state.acquire(cost, now)
+            return allowed, min(state.tokens for state in states), retry_after
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+    def try_acquire(
+        self,
+        quota: Quota,
+        cost: int = 1,
+        success: bool | None = True,
+        latency_ms: float | None = None,
+    ) -> tuple[bool, float, float]:
+        """Acquire tokens without touching the database.
+
+        Returns ``(allowed, remaining tokens, retry-after seconds)``; the
+        retry-after is the exact time until ``cost`` tokens exist, -1 if never.
+        Pass ``success=None`` when the work runs after the acquire and report
+        its outcome with record_outcome. Concurrency quotas have no rate; they
+        are held with acquire_slot.
+        """
+        if quota.algo == CONCURRENCY:
+            raise ValueError(f"配额 {quota.id} 是并发配额，请使用 acquire_slot/hold_slot")
+        # Try Redis first, fallback to memory
+        if self._redis_ready():
+            try:
+                result = self._acquire_redis(quota, cost, success, latency_ms)
+            except Exception as e:
+                logger.warning(f"Redis 限流失败，使用内存模式: {e}")
+                self._redis_failed(e)
+            else:
+                self._redis_succeeded()
+                return result
+        return self._acquire_memory(quota, cost)
+
+    def _lease_size(self, quota: Quota, rate: float) -> int:
+        """Tokens to reserve for a lease: the expected calls of one lease TTL.
+
+        Bounded by ``lease_max_fraction`` of the quota capacity so one
+        process never drains a shared bucket.
+        """
+        _, capacity, _ = _algo_params(quota)
+        max_size = max(1, int(capacity * settings.lease_max_fraction))
+        want = math.ceil(rate * settings.lease_ttl_seconds)
+        return max(1, min(max_size, want))
+
+    def _lease_redis(
+        self, quota: Quota, unused: int, used: int, want: int, min_grant: int
+    ) -> tuple[int, float, float]:
+        """Return a lease and reserve a new block with one Lua script call."""
+        algo, capacity, rate = _algo_params(quota)
         minute_key = dt.datetime.now(dt.timezone.utc).strftime("%Y%m%d%H%M")
-        stats_key = f"stats:{quota.id}:{minute_key}"
+        result = self._evalsha(
+            "lease",
+            2,
+            _state_key(quota.id, algo),
+            f"stats:{quota.id}:{minute_key}",
+            time.time(),
+            algo,
+            capacity,
+            rate,
+            unused,
+            used,
+            want,
+            min_grant,
+            STATS_TTL_SECONDS,
+        )
+        return int(result[0]), float(result[1]), float(result[2])
+
+    def acquire_leased(
+        self, quota: Quota, cost: int = 1, success: bool | None = True
+    ) -> tuple[bool, float, float]:
+        """Acquire tokens from a locally held lease, renewing it from Redis when needed.
+
+        Most calls are served from memory; Redis is only hit when the lease is
+        used up or expired, and that call returns the unused tokens and
+        reserves the next block atomically. Global limits stay exact because
+        leased tokens are debited from the shared bucket up front.
+
+        Returns ``(allowed, tokens left in the lease, retry-after seconds)``.
+        Calls taken with ``success=None`` are not counted as ok; their outcome
+        comes from record_outcome. Disabled quotas, quotas with a parent chain and calendar-window
+        budgets go through try_acquire; while the breaker is open leases are
+        not renewed and calls use the in-memory fallback.
+        """
+        if not quota.enabled or quota.parent_id or quota.algo == FIXED_WINDOW:
+            return self.try_acquire(quota, cost, success)
+        ok = cost if success else 0
         
-        now = time.time()
-        result = r.evalsha(
-            self._lua_sha,
-            2,  # number of keys
-            quota_key,
-            stats_key,
-            now,
+        now = time.monotonic()
+        with self._lease_stripe(quota.id):
+            lease = self._leases.get(quota.id)
+            if lease and now < lease.expires_at and lease.tokens >= cost:
+                lease.tokens -= cost
+                lease.used += cost
+                lease.ok += ok
+                return True, float(lease.tokens), 0.0
+            
+            rate = 0.0
+            if lease:
+                # Calls seen during the previous lease, including this one
+                observed = (lease.used + cost) / max(now - lease.granted_at, 1e-3)
+                rate = observed if lease.rate <= 0 else (
+                    LEASE_RATE_SMOOTHING * observed + (1 - LEASE_RATE_SMOOTHING) * lease.rate
+                )
+            want = max(cost, self._lease_size(quota, rate))
+            if not self.breaker.allow():
+                return self._acquire_memory(quota, cost)
+            try:
+                granted, remain, retry_after = self._lease_redis(
+                    quota,
+                    unused=lease.tokens if lease else 0,
+                    used=lease.ok if lease else 0,
+                    want=want,
+                    min_grant=cost,
+                )
+            except Exception as e:
+                # Keep the old lease so its unused tokens go back once Redis recovers
+                logger.warning(f"Redis 租约失败，使用内存模式: {e}")
+                self._redis_failed(e)
+                return self._acquire_memory(quota, cost)
+            self._redis_succeeded()
+            
+            # An empty lease keeps the observed rate for the next renewal
+            ttl = settings.lease_ttl_seconds if granted else 0.0
+            self._leases[quota.id] = TokenLease(
+                quota=quota,
+                tokens=max(0, granted - cost),
+                used=cost if granted else 0,
+                granted_at=now,
+                expires_at=now + ttl,
+                rate=rate,
+                ok=ok if granted else 0,
+            )
+            if granted:
+                return True, float(granted - cost), 0.0
+            return False, remain, retry_after
+
+    def release_leases(self, expired_only: bool = True) -> int:
+        """Hand unused lease tokens back to Redis and flush their usage stats.
+
+        Called periodically for expired leases and with ``expired_only=False``
+        on shutdown. Returns the number of leases returned.
+        """
+        now = time.monotonic()
+        released = 0
+        for quota_id, lease in list(self._leases.items()):
+            with self._lease_stripe(quota_id):
+                if self._leases.get(quota_id) is not lease:
+                    continue  # renewed or removed meanwhile
+                if expired_only and now < lease.expires_at:
+                    continue
+                if lease.tokens or lease.ok:
+                    # While Redis is unavailable the lease is kept and returned later
+                    if not self._redis_ready():
+                        continue
+                    try:
+                        self._lease_redis(lease.quota, lease.tokens, lease.ok, 0, 0)
+                    except Exception as e:
+                        logger.warning(f"归还租约失败 {quota_id}: {e}")
+                        self._redis_failed(e)
+                        continue
+                    self._redis_succeeded()
+                    released += 1
+                    lease.tokens = lease.used = lease.ok = 0
+                if not expired_only:
+                    del self._leases[quota_id]
+        return released
+
+    def _acquire_slot_redis(
+        self, quota: Quota, lease_id: str, ttl: float, success: bool | None = True
+    ) -> tuple[bool, float, float]:
+        """Take a concurrency slot with one Lua script call."""
+        minute_key = dt.datetime.now(dt.timezone.utc).strftime("%Y%m%d%H%M")
+        result = self._evalsha(
+            "slot_acquire",
+            2,
+            _state_key(quota.id, CONCURRENCY),
+            f"stats:{quota.id}:{minute_key}",
+            time.time(),
             quota.capacity,
-            quota.refill_rate,
-            cost,
+            lease_id,
+            ttl,
+            STATS_TTL_SECONDS,
+            1 if quota.enabled else 0,
+            _outcome_arg(success),
         )
-        
-        allowed = bool(result[0])
-        remain = float(result[1])
-        return allowed, remain
+        return bool(int(result[0])), float(result[1]), float(result[2])
 
-    def _acquire_memory(
-        self, quota: Quota, cost: int
-    ) -> tuple[bool, float]:
-        """Acquire tokens using in-memory state (fallback)."""
-        now = dt.datetime.now(dt.timezone.utc)
-        self.ensure_quota(quota)
-        state = self.states[quota.id]
-        allowed = state.acquire(cost, now)
-        remain = state.tokens
-        return allowed, remain
+    def _acquire_slot_memory(
+        self, quota: Quota, lease_id: str, ttl: float
+    ) -> tuple[bool, float, float]:
+        """Take a concurrency slot from the in-memory twin (fallback)."""
+        with self._slot_lock:
+            state = self.states.get(quota.id)
+            if state is None:
+                self.ensure_quota(quota)
+                state = self.states[quota.id]
+            if quota.enabled and state.hold(lease_id, ttl, time.monotonic()):
+                return True, state.tokens, 0.0
+            return False, state.tokens, state.retry_after(1) if quota.enabled else -1.0
+
+    def acquire_slot(
+        self, quota: Quota, ttl: float | None = None, success: bool | None = True
+    ) -> tuple[Optional[str], float, float]:
+        """Take one in-flight slot of a concurrency quota.
+
+        Slots are leases in a Redis sorted set that expire after ``ttl``
+        seconds (default ``concurrency_lease_ttl_seconds``), so slots of a
+        crashed holder are reclaimed. Returns ``(lease id or None, free
+        slots, retry-after seconds)``; the retry-after is the time until the
+        oldest lease expires, -1 if the quota is disabled or has no slots.
+        ``success`` is counted as for try_acquire.
+        """
+        if quota.algo != CONCURRENCY:
+            raise ValueError(f"配额 {quota.id} 不是并发配额")
+        ttl = ttl if ttl is not None else settings.concurrency_lease_ttl_seconds
+        lease_id = uuid.uuid4().hex
+        outcome = None
+        if self._redis_ready():
+            try:
+                outcome = self._acquire_slot_redis(quota, lease_id, ttl, success)
+            except Exception as e:
+                logger.warning(f"Redis 并发限流失败，使用内存模式: {e}")
+                self._redis_failed(e)
+            else:
+                self._redis_succeeded()
+        if outcome is None:
+            outcome = self._acquire_slot_memory(quota, lease_id, ttl)
+        allowed, remain, retry_after = outcome
+        return (lease_id if allowed else None), remain, retry_after
+
+    def release_slot(self, quota: Quota, lease_id: str) -> bool:
+        """Give a concurrency slot back. Returns False if it had already expired."""
+        with self._slot_lock:
+            state = self.states.get(quota.id)
+            released = isinstance(state, ConcurrencyState) and state.release(lease_id)
+        r = self._get_redis() if self._redis_ready() else None
+        if r:
+            try:
+                removed = r.zrem(_state_key(quota.id, CONCURRENCY), lease_id)
+            except Exception as e:
+                # The lease expires on its own after its TTL
+                logger.warning(f"归还并发槽位失败 {quota.id}: {e}")
+                self._redis_failed(e)
+            else:
+                self._redis_succeeded()
+                return bool(removed) or released
+        return released
+
+    def renew_slot(self, quota: Quota, lease_id: str, ttl: float | None = None) -> bool:
+        """Push the expiry of a held slot to ``ttl`` seconds from now.
+
+        Returns False if the lease is no longer held (expired and reclaimed,
+        or released).
+        """
+        ttl = ttl if ttl is not None else settings.concurrency_lease_ttl_seconds
+        with self._slot_lock:
+            state = self.states.get(quota.id)
+            renewed = isinstance(state, ConcurrencyState) and state.renew(lease_id, ttl, time.monotonic())
+        if self._redis_ready():
+            try:
+                held = self._evalsha("slot_renew", 1, _state_key(quota.id, CONCURRENCY), time.time(), lease_id, ttl)
+            except Exception as e:
+                logger.warning(f"续期并发槽位失败 {quota.id}: {e}")
+                self._redis_failed(e)
+            else:
+                self._redis_succeeded()
+                return bool(int(held)) or renewed
+        return renewed
+
+    @contextmanager
+    def slot_heartbeat(
+        self, quota: Quota, lease_id: str, ttl: float | None = None
+    ) -> Iterator[None]:
+        """Renew a held slot every third of its TTL while the ``with`` block runs.
+
+        Keeps the slot of work that outlasts ``concurrency_lease_ttl_seconds``
+        from being reclaimed mid-run; the renewals run on a daemon thread and
+        stop when the block exits (the slot itself is released by the caller).
+        """
+        ttl = ttl if ttl is not None else settings.concurrency_lease_ttl_seconds
+        stop = threading.Event()
+
+        def beat() -> None:
+            while not stop.wait(ttl / 3):
+                # Not held can also mean Redis is down: keep trying until the block exits
+                if not self.renew_slot(quota, lease_id, ttl):
+                    logger.warning(f"续期并发槽位 {quota.id}:{lease_id} 未成功")
+
+        thread = threading.Thread(target=beat, name=f"slot-heartbeat-{quota.id}", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def acquire_slot_blocking(
+        self,
+        quota: Quota,
+        timeout: float | None = None,
+        ttl: float | None = None,
+        success: bool | None = True,
+    ) -> AcquireDecision:
+        """Wait for a concurrency slot; the decision carries its ``lease_id``.
+
+        Slots free up when a holder releases, which the sorted set does not
+        announce, so waiting polls every ``concurrency_poll_seconds`` (or
+        until the oldest lease expires, if sooner). Raises RateLimitTimeout
+        like acquire_blocking.
+        """
+        start = time.monotonic()
+        attempts = 0
+        while True:
+            attempts += 1
+            lease_id, remain, retry_after = self.acquire_slot(quota, ttl, success)
+            waited = time.monotonic() - start
+            decision = AcquireDecision(
+                quota.id, 1, lease_id is not None, remain, retry_after,
+                waited=waited, attempts=attempts, lease_id=lease_id,
+            )
+            if decision.allowed:
+                return decision
+            if retry_after < 0:
+                raise RateLimitTimeout(f"配额 {quota.id} 无可用并发槽位", decision)
+            delay = min(retry_after, settings.concurrency_poll_seconds)
+            if timeout is not None and waited + delay > timeout:
+                raise RateLimitTimeout(
+                    f"配额 {quota.id} 在 {timeout:.2f}s 内无法获取并发槽位", decision
+                )
+            time.sleep(delay)
+
+    @contextmanager
+    def hold_slot(
+        self,
+        quota: Quota,
+        timeout: float | None = None,
+        ttl: float | None = None,
+    ) -> Iterator[AcquireDecision]:
+        """Hold a concurrency slot for the duration of a ``with`` block, renewing it as it runs."""
+        decision = self.acquire_slot_blocking(quota, timeout, ttl)
+        try:
+            with self.slot_heartbeat(quota, decision.lease_id, ttl):
+                yield decision
+        finally:
+            self.release_slot(quota, decision.lease_id)
+
+    def acquire_blocking(
+        self,
+        quota: Quota,
+        cost: int = 1,
+        timeout: float | None = None,
+        success: bool | None = True,
+        lease: bool = False,
+    ) -> AcquireDecision:
+        """Acquire tokens, sleeping exactly the reported retry-after between attempts.
+
+        Raises RateLimitTimeout when the tokens cannot be obtained within
+        ``timeout`` seconds (None waits indefinitely), or immediately when the
+        request can never be satisfied (quota disabled or cost > capacity).
+        With ``lease=True`` tokens come from acquire_leased.
+        """
+        start = time.monotonic()
+        attempts = 0
+        while True:
+            attempts += 1
+            if lease:
+                allowed, remain, retry_after = self.acquire_leased(quota, cost, success)
+            else:
+                allowed, remain, retry_after = self.try_acquire(quota, cost, success)
+            waited = time.monotonic() - start
+            decision = AcquireDecision(
+                quota.id, cost, allowed, remain, retry_after, waited=waited, attempts=attempts
+            )
+            if allowed:
+                return decision
+            if retry_after < 0:
+                raise RateLimitTimeout(
+                    f"配额 {quota.id} 无法满足 {cost} 个令牌的请求", decision
+                )
+            if timeout is not None and waited + retry_after > timeout:
+                raise RateLimitTimeout(
+                    f"配额 {quota.id} 在 {timeout:.2f}s 内无法获取令牌", decision
+                )
+            time.sleep(retry_after)
 
     def acquire(
         self,
-        db: Session,
         quota: Quota,
         cost: int,
         success: bool,
@@ -195,27 +1316,16 @@ class LimiterService:
         message: str | None = None,
         func_id: str | None = None,
         func_name: str | None = None,
-    ) -> tuple[bool, float]:
-        """Acquire tokens with rate limiting."""
-        now = dt.datetime.now(dt.timezone.utc)
-        
-        # Try Redis first, fallback to memory
-        try:
-            if self._use_redis:
-                allowed, remain = self._acquire_redis(quota, cost)
-            else:
-                allowed, remain = self._acquire_memory(quota, cost)
-        except Exception as e:
-            print(f"Acquire failed, using memory fallback: {e}")
-            self._use_redis = False
-            allowed, remain = self._acquire_memory(quota, cost)
-        
-        # Apply enabled check
-        if not quota.enabled:
-            allowed = False
+    ) -> tuple[bool, float, float]:
+        """Acquire tokens with rate limiting and queue a trace on the trace sink.
+
+        Returns ``(allowed, remaining tokens, retry-after seconds)``; a
+        retry-after of -1 means the request can never be satisfied.
+        """
+        allowed, remain, retry_after = self.try_acquire(quota, cost, success, latency_ms)
         
         # Record trace
-        trace = TraceLog(
+        trace_sink.record(
             quota_id=quota.id,
             func_id=func_id,
             func_name=func_name,
@@ -223,68 +1333,303 @@ class LimiterService:
             latency_ms=latency_ms,
             message=message,
         )
-        db.add(trace)
         
-        # Update stats in Redis
-        r = self._get_redis()
-        if r:
+        return allowed, remain, retry_after
+    
+    def acquire_many(
+        self,
+        items: Sequence[tuple[str, int]],
+        success: bool = True,
+        latency_ms: float | None = None,
+        message: str | None = None,
+    ) -> List[AcquireDecision]:
+        """Acquire tokens for many ``(qid, cost)`` items at once.
+
+        Quotas come from the quota cache, all items are resolved with one Lua
+        script call and the trace rows are queued on the trace sink in one go.
+        Unknown quota ids are reported with ``found=False``; concurrency
+        quotas have no tokens and are always denied with retry-after -1.
+        """
+        quotas: Dict[str, Quota] = {}
+        for qid, _ in items:
+            quota = quota_cache.get(qid)
+            if quota is not None and quota.algo != CONCURRENCY:
+                quotas[qid] = quota
+        
+        known = [(quotas[qid], cost) for qid, cost in items if qid in quotas]
+        outcomes = None
+        if known and self._redis_ready():
             try:
-                minute_key = now.strftime("%Y%m%d%H%M")
-                stats_key = f"stats:{quota.id}:{minute_key}"
-                pipe = r.pipeline()
-                if allowed and success:
-                    pipe.hincrby(stats_key, "ok", 1)
-                elif allowed and not success:
-                    pipe.hincrby(stats_key, "err", 1)
-                else:
-                    pipe.hincrby(stats_key, "r429", 1)
-                if latency_ms:
-                    pipe.hincrbyfloat(stats_key, "latency_sum", latency_ms)
-                    pipe.hincrby(stats_key, "latency_count", 1)
-                pipe.expire(stats_key, 3600)  # Keep for 1 hour
-                pipe.execute()
+                outcomes = self._acquire_redis_many(known, success, latency_ms)
             except Exception as e:
-                print(f"Failed to update Redis stats: {e}")
+                logger.warning(f"Redis 批量限流失败，使用内存模式: {e}")
+                self._redis_failed(e)
+            else:
+                self._redis_succeeded()
+        if outcomes is None:
+            outcomes = [self._acquire_memory(quota, cost) for quota, cost in known]
+        
+        decisions: List[AcquireDecision] = []
+        traces: List[dict] = []
+        outcome_iter = iter(outcomes)
+        for qid, cost in items:
+            if qid not in quotas:
+                found = quota_cache.get(qid) is not None
+                decisions.append(AcquireDecision(qid, cost, False, 0.0, -1.0, found=found))
+                continue
+            allowed, remain, retry_after = next(outcome_iter)
+            decisions.append(AcquireDecision(qid, cost, allowed, remain, retry_after))
+            traces.append(
+                dict(
+                    quota_id=qid,
+                    status_code=200 if allowed and success else 429 if not allowed else 500,
+                    latency_ms=latency_ms,
+                    message=message,
+                )
+            )
+        trace_sink.record_many(traces)
         
-        return allowed, remain
+        return decisions
     
     def get_current_tokens(self, quota_id: str) -> Optional[float]:
-        """Get current token count for a quota with refill calculation."""
-        r = self._get_redis()
-        if r:
+        """Get current remaining capacity for a quota without modifying its state."""
+        state = self.states.get(quota_id)
+        if state and self._redis_ready():
             try:
-                quota_key = f"quota:{quota_id}"
-                tokens = r.get(f"{quota_key}:tokens")
-                last_refill = r.get(f"{quota_key}:last_refill")
-                
-                if tokens is not None and last_refill is not None:
-                    # Get quota config from memory state
-                    state = self.states.get(quota_id)
-                    if state:
-                        # Calculate refill
-                        now = time.time()
-                        elapsed = now - float(last_refill)
-                        added = elapsed * state.refill_rate
-                        current_tokens = min(state.capacity, float(tokens) + added)
-                        
-                        # Update Redis with new values
-                        r.set(f"{quota_key}:tokens", current_tokens)
-                        r.set(f"{quota_key}:last_refill", now)
-                        
-                        return current_tokens
-                    else:
-                        # No state info, just return stored value
-                        return float(tokens)
+                remain = self._evalsha("peek", 1, *_peek_script_args(quota_id, state))
             except Exception as e:
                 logger.error(f"获取令牌数失败 {quota_id}: {e}")
+                self._redis_failed(e)
+            else:
+                self._redis_succeeded()
+                return float(remain)
         
-        # Fallback to memory
+        return self._memory_tokens(quota_id)
+
+    def get_budget(self, quota: Quota) -> tuple[Optional[float], Optional[dt.datetime]]:
+        """Remaining capacity and, for fixed_window quotas, when it resets.
+
+        Lets schedulers size a run to what is left of the day's budget
+        instead of discovering exhaustion halfway through.
+        """
+        self.ensure_quota(quota)
+        return self.get_current_tokens(quota.id), budget_reset_at(quota)
+
+    def _memory_tokens(self, quota_id: str) -> Optional[float]:
+        """Remaining capacity from the fallback (shared table or in-memory twin)."""
         state = self.states.get(quota_id)
         if state:
-            now = dt.datetime.now(dt.timezone.utc)
-            state.refill(now)
-            return state.tokens
+            return self._fallback_tokens(quota_id, state)
         return None
 
+    def record_outcome(self, quota: Quota, success: bool, latency_ms: float) -> None:
+        """Count a call as ok or err and add its execution time to the latency histogram.
+
+        For work acquired with ``success=None`` (LimitCallTask calls,
+        scheduled tasks), whose outcome is only known once it has run; both
+        are written to every level of the quota chain in one script call.
+        Acquires that already know their outcome record it in the acquire
+        script. Dropped while Redis is unavailable.
+        """
+        if not self._redis_ready():
+            return
+        minute_key = dt.datetime.now(dt.timezone.utc).strftime("%Y%m%d%H%M")
+        keys = [f"stats:{level.id}:{minute_key}" for level in quota_cache.chain(quota)]
+        try:
+            self._evalsha(
+                "observe", len(keys), *keys, max(latency_ms, 0.0), STATS_TTL_SECONDS, _outcome_arg(success)
+            )
+        except Exception as e:
+            logger.warning(f"记录调用结果失败 {quota.id}: {e}")
+            self._redis_failed(e)
+        else:
+            self._redis_succeeded()
+
+    def inspect_many(self, quotas: Sequence[Quota]) -> List[TokenSnapshot]:
+        """Remaining tokens, capacity and time-to-full of many quotas in one call.
+
+        Uses the read-only ``inspect`` script, so dashboards and metric
+        snapshots polling every quota never write to the limiter keys.
+        """
+        if not quotas:
+            return []
+        if self._redis_ready():
+            try:
+                keys, args = _inspect_script_args(quotas)
+                result = self._evalsha("inspect", len(keys), *keys, *args)
+            except Exception as e:
+                logger.error(f"批量读取令牌数失败: {e}")
+                self._redis_failed(e)
+            else:
+                self._redis_succeeded()
+                return _parse_inspect_reply(quotas, result)
+        return [self._inspect_memory(quota) for quota in quotas]
+
+    def _inspect_memory(self, quota: Quota) -> TokenSnapshot:
+        """TokenSnapshot of a quota from the fallback state."""
+        state = self.states.get(quota.id)
+        if state is None:
+            self.ensure_quota(quota)
+            state = self.states[quota.id]
+        tokens = self._fallback_tokens(quota.id, state)
+        return TokenSnapshot(
+            quota_id=quota.id,
+            tokens=tokens,
+            capacity=float(state.capacity),
+            time_to_full=_time_to_full(state, tokens),
+        )
+
 
 limiter_service = LimiterService()
+
+
+@dataclass
+class AsyncLimiterService:
+    """Asyncio twin of LimiterService for FastAPI handlers.
+
+    Runs the same Lua scripts on the pooled ``redis.asyncio`` client so
+    handlers never block the event loop on Redis I/O. Quota registration and
+    the in-memory fallback are shared with ``fallback`` (the sync service);
+    the asyncio client has its own circuit breaker.
+    """
+    fallback: LimiterService = field(default_factory=lambda: limiter_service)
+    breaker: CircuitBreaker = field(default_factory=lambda: CircuitBreaker("redis-async"))
+    _redis: Optional[aioredis.Redis] = None
+    _lua_shas: Dict[str, str] = field(default_factory=dict)
+
+    async def _get_redis(self) -> Optional[aioredis.Redis]:
+        """Get the asyncio Redis client and load the Lua scripts on first use."""
+        if self._redis is None:
+            try:
+                client = get_async_redis()
+                await self._load_scripts(client)
+                self._redis = client
+                logger.info("异步 Redis 连接成功，Lua 脚本已加载")
+            except Exception as e:
+                logger.warning(f"异步 Redis 连接失败，使用内存模式: {e}")
+                self._redis_failed(e)
+                return None
+        return self._redis
+
+    async def _load_scripts(self, r: aioredis.Redis) -> None:
+        for name, script in SCRIPTS.items():
+            self._lua_shas[name] = await r.script_load(script)
+
+    async def _evalsha(self, name: str, numkeys: int, *keys_and_args):
+        """Async LimiterService._evalsha (reloads the scripts once on NOSCRIPT)."""
+        r = await self._get_redis()
+        if not r or name not in self._lua_shas:
+            raise RuntimeError("Redis not available")
+        try:
+            return await r.evalsha(self._lua_shas[name], numkeys, *keys_and_args)
+        except redis.exceptions.NoScriptError:
+            logger.warning("Redis 脚本缓存已丢失（可能已重启），重新加载 Lua 脚本")
+            await self._load_scripts(r)
+            return await r.evalsha(self._lua_shas[name], numkeys, *keys_and_args)
+
+    def _redis_ready(self) -> bool:
+        return self.breaker.allow()
+
+    def _redis_failed(self, error: Exception) -> None:
+        if self.breaker.record_failure(error):
+            logger.warning(
+                f"异步 Redis 熔断器打开，{self.breaker.reset_timeout:.1f}s 后探测恢复，期间使用内存限流: {error}"
+            )
+
+    async def _redis_succeeded(self) -> None:
+        if self.breaker.record_success():
+            # Reconcile with the sync client, off the event loop
+            reconciled = await asyncio.to_thread(self.fallback.reconcile)
+            logger.info(f"异步 Redis 已恢复，熔断器关闭，已同步 {reconciled} 个配额的内存状态")
+
+    async def _acquire_redis_many(
+        self,
+        items: Sequence[tuple[Quota, int]],
+        success: bool,
+        latency_ms: float | None = None,
+    ) -> List[tuple[bool, float, float]]:
+        """Acquire tokens for many (quota, cost) items with a single Lua script call."""
+        keys, args = _acquire_script_args(items, success, latency_ms)
+        result = await self._evalsha("acquire", len(keys), *keys, *args)
+        return _parse_acquire_reply(result)
+
+    async def try_acquire(
+        self,
+        quota: Quota,
+        cost: int = 1,
+        success: bool = True,
+        latency_ms: float | None = None,
+    ) -> tuple[bool, float, float]:
+        """Async LimiterService.try_acquire: ``(allowed, remain, retry-after)``."""
+        if quota.algo == CONCURRENCY:
+            raise ValueError(f"配额 {quota.id} 是并发配额，请使用 acquire_slot/hold_slot")
+        if self._redis_ready():
+            try:
+                result = (await self._acquire_redis_many([(quota, cost)], success, latency_ms))[0]
+            except Exception as e:
+                logger.warning(f"异步 Redis 限流失败，使用内存模式: {e}")
+                self._redis_failed(e)
+            else:
+                await self._redis_succeeded()
+                return result
+        # The fallback takes thread locks and the shared-table file lock: keep it off the event loop
+        return await asyncio.to_thread(self.fallback._acquire_memory, quota, cost)
+
+    async def acquire(
+        self,
+        quota: Quota,
+        cost: int,
+        success: bool,
+        latency_ms: float | None = None,
+        message: str | None = None,
+        func_id: str | None = None,
+        func_name: str | None = None,
+    ) -> tuple[bool, float, float]:
+        """Async LimiterService.acquire: acquire tokens and queue a trace.
+
+        Queueing never touches the database; the trace sink writes in bulk.
+        """
+        allowed, remain, retry_after = await self.try_acquire(quota, cost, success, latency_ms)
+        trace_sink.record(
+            quota_id=quota.id,
+            func_id=func_id,
+            func_name=func_name,
+            status_code=200 if allowed and success else 429 if not allowed else 500,
+            latency_ms=latency_ms,
+            message=message,
+            block=False,
+        )
+        return allowed, remain, retry_after
+
+    async def get_current_tokens(self, quota_id: str) -> Optional[float]:
+        """Async LimiterService.get_current_tokens (read-only peek script)."""
+        state = self.fallback.states.get(quota_id)
+        if state and self._redis_ready():
+            try:
+                remain = await self._evalsha("peek", 1, *_peek_script_args(quota_id, state))
+            except Exception as e:
+                logger.error(f"获取令牌数失败 {quota_id}: {e}")
+                self._redis_failed(e)
+            else:
+                await self._redis_succeeded()
+                return float(remain)
+        return await asyncio.to_thread(self.fallback._memory_tokens, quota_id)
+
+    async def inspect_many(self, quotas: Sequence[Quota]) -> List[TokenSnapshot]:
+        """Async LimiterService.inspect_many (one read-only inspect script call)."""
+        if not quotas:
+            return []
+        if self._redis_ready():
+            try:
+                keys, args = _inspect_script_args(quotas)
+                result = await self._evalsha("inspect", len(keys), *keys, *args)
+            except Exception as e:
+                logger.error(f"批量读取令牌数失败: {e}")
+                self._redis_failed(e)
+            else:
+                await self._redis_succeeded()
+                return _parse_inspect_reply(quotas, result)
+        return await asyncio.to_thread(lambda: [self.fallback._inspect_memory(quota) for quota in quotas])
+
+
+async_limiter_service = AsyncLimiterService()
@@ -0,0 +1,657 @@
+"""Lua scripts used by the Redis-backed rate limiter.
+
+Every algorithm is a Lua function with the same signature::
+
+    fn(key, now, capacity, rate, cost, apply, win) -> allowed, remain, retry_after
+
+``win`` is only used by ``fixed_window``: ``{start, reset, burst}`` with the
+calendar window bounds, which the caller computes in the scheduler timezone
+because Lua has no timezone data. ``apply`` = 0 evaluates the decision without writing state, which lets the
+same functions serve acquires and read-only inspection. State is only written
+when a request is allowed, and keys expire once they would be back at their
+idle state, so a missing key always means "full".
+
+The Python twins of these functions live in ``services/limiter.py``.
+"""
+
+import math
+
+# Algorithms understood by the scripts (Quota.algo values)
+ALGORITHMS = ("token_bucket", "gcra", "leaky_bucket", "sliding_window", "fixed_window")
+
+# Quota.algo of calendar-window budgets and their window_unit values
+FIXED_WINDOW = "fixed_window"
+WINDOW_UNITS = ("day", "hour", "minute")
+
+# Quota.algo of max-in-flight quotas; these use the slot scripts, not acquire
+CONCURRENCY = "concurrency"
+
+# Latency histogram in the stats hashes: field "lb:<i>" counts latencies in
+# [GROWTH ** i, GROWTH ** (i + 1)) ms (bucket 0 also holds everything below
+# 1 ms), so a bucket is ~19% wide and percentiles are within ~9%. The last
+# bucket holds everything above GROWTH ** (BUCKETS - 1) ms (~3.9 h).
+LATENCY_BUCKET_GROWTH = 2 ** 0.25
+LATENCY_BUCKETS = 96
+LATENCY_BUCKET_PREFIX = "lb:"
+
+LUA_ALGORITHMS = """
+-- Tolerance for float rounding when comparing against capacity
+local EPS = 1e-9
+
+-- Token bucket: hash {tokens, ts}; capacity tokens, refilled at rate/s
+local function token_bucket(key, now, capacity, rate, cost, apply)
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or capacity
+    local last_refill = tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - last_refill) * rate)
+
+    if tokens + EPS >= cost then
+        if apply == 1 then
+            tokens = tokens - cost
+            redis.call('HSET', key, 'tokens', tokens, 'ts', now)
+            if rate > 0 then
+                redis.call('EXPIRE', key, math.ceil((capacity - tokens) / rate) + 1)
+            end
+        end
+        return 1, tokens, 0
+    end
+    if cost > capacity or rate <= 0 then
+        return 0, tokens, -1
+    end
+    return 0, tokens, (cost - tokens) / rate
+end
+
+-- GCRA: one string key holding the theoretical arrival time (TAT).
+-- Emission interval is 1/rate, up to capacity requests may arrive at once.
+local function gcra(key, now, capacity, rate, cost, apply)
+    if rate <= 0 then
+        return 0, 0, -1
+    end
+    local interval = 1 / rate
+    local tolerance = interval * capacity
+    local tat = math.max(tonumber(redis.call('GET', key)) or now, now)
+    local new_tat = tat + cost * interval
+    local allow_at = new_tat - tolerance
+
+    if now + EPS >= allow_at then
+        if apply == 1 then
+            redis.call('SET', key, new_tat, 'PX', math.ceil((new_tat - now) * 1000) + 1)
+            tat = new_tat
+        end
+        return 1, (tolerance - (tat - now)) / interval, 0
+    end
+    local remain = (tolerance - (tat - now)) / interval
+    if cost > capacity then
+        return 0, remain, -1
+    end
+    return 0, remain, allow_at - now
+end
+
+-- Leaky bucket (as a meter): hash {level, ts}; level drains at rate/s and
+-- a request fits while level + cost <= capacity
+local function leaky_bucket(key, now, capacity, rate, cost, apply)
+    local state = redis.call('HMGET', key, 'level', 'ts')
+    local level = tonumber(state[1]) or 0
+    local last_leak = tonumber(state[2]) or now
+    level = math.max(0, level - math.max(0, now - last_leak) * rate)
+
+    if level + cost <= capacity + EPS then
+        if apply == 1 then
+            level = level + cost
+            redis.call('HSET', key, 'level', level, 'ts', now)
+            if rate > 0 then
+                redis.call('EXPIRE', key, math.ceil(level / rate) + 1)
+            end
+        end
+        return 1, capacity - level, 0
+    end
+    if cost > capacity or rate <= 0 then
+        return 0, capacity - level, -1
+    end
+    return 0, capacity - level, (level + cost - capacity) / rate
+end
+
+-- Sliding window counter: hash {start, cur, prev}; capacity requests per
+-- window of capacity/rate seconds, the previous window weighted by overlap
+local function sliding_window(key, now, capacity, rate, cost, apply)
+    if rate <= 0 then
+        return 0, 0, -1
+    end
+    local window = capacity / rate
+    local state = redis.call('HMGET', key, 'start', 'cur', 'prev')
+    local start = tonumber(state[1]) or now
+    local cur = tonumber(state[2]) or 0
+    local prev = tonumber(state[3]) or 0
+
+    local periods = math.floor((now - start) / window)
+    if periods >= 2 then
+        prev = 0
+        cur = 0
+        start = start + periods * window
+    elseif periods == 1 then
+        prev = cur
+        cur = 0
+        start = start + window
+    end
+    local used = prev * (1 - (now - start) / window) + cur
+
+    if used + cost <= capacity + EPS then
+        if apply == 1 then
+            cur = cur + cost
+            used = used + cost
+            redis.call('HSET', key, 'start', start, 'cur', cur, 'prev', prev)
+            redis.call('EXPIRE', key, math.ceil(start + 2 * window - now) + 1)
+        end
+        return 1, capacity - used, 0
+    end
+    if cost > capacity then
+        return 0, math.max(0, capacity - used), -1
+    end
+    -- Earliest time the weighted count leaves room for cost
+    local room = capacity - cost
+    local at
+    if cur <= room and prev > 0 then
+        at = start + window * (1 - (room - cur) / prev)
+    elseif cur > 0 then
+        at = start + window + window * (1 - room / cur)
+    else
+        at = start + window
+    end
+    return 0, math.max(0, capacity - used), math.max(0, at - now)
+end
+
+-- Fixed calendar window: hash {start, used, tokens, ts}; capacity requests per
+-- window [win.start, win.reset). With win.burst > 0 a token bucket of burst
+-- tokens refilled at rate/s is layered on top so the budget is not spent at once.
+local function fixed_window(key, now, capacity, rate, cost, apply, win)
+    if not win or win.reset <= now then
+        return 0, 0, -1
+    end
+    local state = redis.call('HMGET', key, 'start', 'used', 'tokens', 'ts')
+    local used = 0
+    if tonumber(state[1]) == win.start then
+        used = tonumber(state[2]) or 0
+    end
+    local burst = win.burst
+    local tokens = 0
+    if burst > 0 then
+        tokens = tonumber(state[3]) or burst
+        local last = tonumber(state[4]) or now
+        tokens = math.min(burst, tokens + math.max(0, now - last) * rate)
+    end
+
+    local fits_window = used + cost <= capacity + EPS
+    local fits_burst = burst <= 0 or tokens + EPS >= cost
+    if fits_window and fits_burst then
+        if apply == 1 then
+            used = used + cost
+            local expire_at = win.reset
+            redis.call('HSET', key, 'start', win.start, 'used', used)
+            if burst > 0 then
+                tokens = tokens - cost
+                redis.call('HSET', key, 'tokens', tokens, 'ts', now)
+                if rate > 0 then
+                    expire_at = math.max(expire_at, now + (burst - tokens) / rate)
+                end
+            end
+            redis.call('EXPIREAT', key, math.ceil(expire_at) + 1)
+        end
+        return 1, capacity - used, 0
+    end
+    if cost > capacity or (burst > 0 and (cost > burst or rate <= 0)) then
+        return 0, math.max(0, capacity - used), -1
+    end
+    local retry_after = 0
+    if not fits_window then
+        retry_after = win.reset - now
+    end
+    if not fits_burst then
+        retry_after = math.max(retry_after, (cost - tokens) / rate)
+    end
+    return 0, math.max(0, capacity - used), retry_after
+end
+
+local ALGORITHMS = {
+    token_bucket = token_bucket,
+    gcra = gcra,
+    leaky_bucket = leaky_bucket,
+    sliding_window = sliding_window,
+    fixed_window = fixed_window,
+}
+
+-- Window bounds of a fixed_window level from ARGV (nil for other algorithms)
+local function window_arg(start, reset, burst)
+    local reset_at = tonumber(reset)
+    if not reset_at or reset_at <= 0 then
+        return nil
+    end
+    return {start = tonumber(start), reset = reset_at, burst = tonumber(burst) or 0}
+end
+"""
+
+
+# Refund functions used when a lease returns unused tokens:
+# fn(key, now, capacity, rate, amount). A missing key is already full.
+LUA_REFUNDS = """
+local function refund_token_bucket(key, now, capacity, rate, amount)
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    if not state[1] then
+        return
+    end
+    local tokens = tonumber(state[1]) + math.max(0, now - tonumber(state[2])) * rate
+    tokens = math.min(capacity, tokens + amount)
+    redis.call('HSET', key, 'tokens', tokens, 'ts', now)
+    if rate > 0 then
+        redis.call('EXPIRE', key, math.ceil((capacity - tokens) / rate) + 1)
+    end
+end
+
+local function refund_gcra(key, now, capacity, rate, amount)
+    local tat = tonumber(redis.call('GET', key))
+    if not tat or rate <= 0 then
+        return
+    end
+    tat = tat - amount / rate
+    if tat <= now then
+        redis.call('DEL', key)
+    else
+        redis.call('SET', key, tat, 'PX', math.ceil((tat - now) * 1000) + 1)
+    end
+end
+
+local function refund_leaky_bucket(key, now, capacity, rate, amount)
+    local state = redis.call('HMGET', key, 'level', 'ts')
+    if not state[1] then
+        return
+    end
+    local level = tonumber(state[1]) - math.max(0, now - tonumber(state[2])) * rate
+    level = math.max(0, level - amount)
+    redis.call('HSET', key, 'level', level, 'ts', now)
+    if rate > 0 then
+        redis.call('EXPIRE', key, math.ceil(level / rate) + 1)
+    end
+end
+
+local function refund_sliding_window(key, now, capacity, rate, amount)
+    local state = redis.call('HMGET', key, 'start', 'cur', 'prev')
+    if not state[1] or rate <= 0 then
+        return
+    end
+    -- Only refund while the window the tokens were counted in is still weighted
+    local window = capacity / rate
+    local start = tonumber(state[1])
+    local periods = math.floor((now - start) / window)
+    if periods == 0 then
+        redis.call('HSET', key, 'cur', math.max(0, tonumber(state[2]) - amount))
+    elseif periods == 1 then
+        redis.call('HSET', key, 'start', start + window, 'cur', 0,
+            'prev', math.max(0, tonumber(state[2]) - amount))
+    end
+end
+
+local REFUNDS = {
+    token_bucket = refund_token_bucket,
+    gcra = refund_gcra,
+    leaky_bucket = refund_leaky_bucket,
+    sliding_window = refund_sliding_window,
+}
+"""
+
+
+LUA_STATS = f"""
+local LATENCY_LOG_GROWTH = {math.log(LATENCY_BUCKET_GROWTH)!r}
+local LATENCY_BUCKETS = {LATENCY_BUCKETS}
+""" + """
+-- Latency sum/count for the average plus one histogram bucket for percentiles
+local function record_latency(stats_key, latency_ms)
+    local bucket = 0
+    if latency_ms >= 1 then
+        bucket = math.min(LATENCY_BUCKETS - 1, math.floor(math.log(latency_ms) / LATENCY_LOG_GROWTH))
+    end
+    redis.call('HINCRBYFLOAT', stats_key, 'latency_sum', latency_ms)
+    redis.call('HINCRBY', stats_key, 'latency_count', 1)
+    redis.call('HINCRBY', stats_key, 'lb:' .. bucket, 1)
+end
+
+-- outcome: 1 = ok, 0 = err, -1 = counted after the call by the observe script
+local function record_outcome(stats_key, outcome)
+    if outcome == 1 then
+        redis.call('HINCRBY', stats_key, 'ok', 1)
+    elseif outcome == 0 then
+        redis.call('HINCRBY', stats_key, 'err', 1)
+    end
+end
+
+local function record_stats(stats_key, allowed, success, latency_ms, stats_ttl)
+    if allowed == 1 then
+        record_outcome(stats_key, success)
+    else
+        redis.call('HINCRBY', stats_key, 'r429', 1)
+    end
+    if latency_ms > 0 then
+        record_latency(stats_key, latency_ms)
+    end
+    redis.call('EXPIRE', stats_key, stats_ttl)
+end
+"""
+
+
+# Acquire script: resolves any number of items in one call and updates the
+# per-minute stats hashes in the same call so state and stats never disagree.
+#
+# Each item is a chain of quotas (leaf first, then its parents). All levels
+# are checked before any is debited, so an item is either taken from every
+# level or from none.
+#
+# KEYS holds a (state_key, stats_key) pair per level, item after item. ARGV is
+# ``now, stats_ttl`` followed, per item, by ``cost, success, latency_ms,
+# levels`` (success 1 = ok, 0 = err, -1 = the outcome is recorded after the
+# call with the observe script) and 7 values per level (algo, capacity, rate, enabled,
+# window_start, window_reset, burst; the last three are 0 unless the level is a
+# fixed_window). Items are
+# decided in order, so several items on the same quota see each other's
+# debits. Returns allowed (0/1), remaining (lowest level), retry-after seconds
+# (-1 = never) per item; floats are returned as strings because Redis would
+# truncate Lua numbers to integers.
+LUA_ACQUIRE_SCRIPT = LUA_ALGORITHMS + LUA_STATS + """
+local now = tonumber(ARGV[1])
+local stats_ttl = tonumber(ARGV[2])
+
+local result = {}
+local arg = 3
+local key = 1
+while arg <= #ARGV do
+    local cost = tonumber(ARGV[arg])
+    local success = tonumber(ARGV[arg + 1])
+    local latency_ms = tonumber(ARGV[arg + 2])
+    local levels = tonumber(ARGV[arg + 3])
+    arg = arg + 4
+
+    local chain = {}
+    local allowed, remain, retry_after = 1, nil, 0
+    for l = 1, levels do
+        local level = {
+            key = KEYS[key],
+            stats_key = KEYS[key + 1],
+            fn = ALGORITHMS[ARGV[arg]] or token_bucket,
+            capacity = tonumber(ARGV[arg + 1]),
+            rate = tonumber(ARGV[arg + 2]),
+            win = window_arg(ARGV[arg + 4], ARGV[arg + 5], ARGV[arg + 6]),
+        }
+        local enabled = tonumber(ARGV[arg + 3])
+        key = key + 2
+        arg = arg + 7
+        chain[l] = level
+
+        local ok, level_remain, level_retry = level.fn(level.key, now, level.capacity, level.rate, cost, 0, level.win)
+        if enabled ~= 1 then
+            ok, level_retry = 0, -1
+        end
+        if not remain or level_remain < remain then
+            remain = level_remain
+        end
+        if ok ~= 1 then
+            allowed = 0
+            if level_retry < 0 or retry_after < 0 then
+                retry_after = -1
+            elseif level_retry > retry_after then
+                retry_after = level_retry
+            end
+        end
+    end
+
+    if allowed == 1 then
+        remain = nil
+        for _, level in ipairs(chain) do
+            local _, level_remain = level.fn(level.key, now, level.capacity, level.rate, cost, 1, level.win)
+            if not remain or level_remain < remain then
+                remain = level_remain
+            end
+        end
+    end
+    for _, level in ipairs(chain) do
+        record_stats(level.stats_key, allowed, success, latency_ms, stats_ttl)
+    end
+
+    result[#result + 1] = allowed
+    result[#result + 1] = tostring(remain)
+    result[#result + 1] = tostring(retry_after)
+end
+return result
+"""
+
+
+# Read-only peek: KEYS[1] = state key, ARGV = now, algo, capacity, rate,
+# window_start, window_reset, burst (see the acquire script).
+# Returns the remaining capacity without writing anything; for concurrency
+# quotas that is the number of free slots (unexpired leases are held).
+LUA_PEEK_SCRIPT = LUA_ALGORITHMS + """
+if ARGV[2] == 'concurrency' then
+    local held = redis.call('ZCOUNT', KEYS[1], '(' .. ARGV[1], '+inf')
+    return tostring(math.max(0, tonumber(ARGV[3]) - held))
+end
+local fn = ALGORITHMS[ARGV[2]] or token_bucket
+local win = window_arg(ARGV[5], ARGV[6], ARGV[7])
+local _, remain = fn(KEYS[1], tonumber(ARGV[1]), tonumber(ARGV[3]), tonumber(ARGV[4]), 0, 0, win)
+return tostring(remain)
+"""
+
+
+# Read-only inspection of many quotas in one call, for dashboards and metric
+# snapshots. KEYS = state key per quota; ARGV = now followed by 6 values per
+# quota (algo, capacity, rate, window_start, window_reset, burst; see the
+# acquire script). Returns remaining, capacity and seconds until the quota is
+# full again (0 = full, -1 = never) per quota as strings; nothing is written.
+LUA_INSPECT_SCRIPT = LUA_ALGORITHMS + """
+local now = tonumber(ARGV[1])
+
+-- Seconds until a level is back at its idle (full) state
+local function time_to_full(key, algo, capacity, rate, remain, win)
+    if algo == 'concurrency' then
+        local last = redis.call('ZRANGE', key, -1, -1, 'WITHSCORES')
+        if remain >= capacity or not last[2] then
+            return 0
+        end
+        return math.max(0, tonumber(last[2]) - now)
+    end
+    if remain + EPS >= capacity then
+        return 0
+    end
+    if algo == 'fixed_window' then
+        if not win then
+            return -1
+        end
+        return math.max(0, win.reset - now)
+    end
+    if rate <= 0 then
+        return -1
+    end
+    if algo == 'sliding_window' then
+        -- Counts leave the weighted sum two windows after the one they were made in
+        local state = redis.call('HMGET', key, 'start', 'cur')
+        local start = tonumber(state[1]) or now
+        local window = capacity / rate
+        if (tonumber(state[2]) or 0) > 0 then
+            return math.max(0, start + 2 * window - now)
+        end
+        return math.max(0, start + window - now)
+    end
+    return (capacity - remain) / rate
+end
+
+local result = {}
+for i = 1, #KEYS do
+    local arg = 2 + (i - 1) * 6
+    local algo = ARGV[arg]
+    local capacity = tonumber(ARGV[arg + 1])
+    local rate = tonumber(ARGV[arg + 2])
+    local win = window_arg(ARGV[arg + 3], ARGV[arg + 4], ARGV[arg + 5])
+    local remain
+    if algo == 'concurrency' then
+        local held = redis.call('ZCOUNT', KEYS[i], '(' .. ARGV[1], '+inf')
+        remain = math.max(0, capacity - held)
+    else
+        local fn = ALGORITHMS[algo] or token_bucket
+        local _
+        _, remain = fn(KEYS[i], now, capacity, rate, 0, 0, win)
+    end
+    result[#result + 1] = tostring(remain)
+    result[#result + 1] = tostring(capacity)
+    result[#result + 1] = tostring(time_to_full(KEYS[i], algo, capacity, rate, remain, win))
+end
+return result
+"""
+
+
+# Lease script: returns the previous lease of a process and reserves a new
+# block of tokens in one call.
+#
+# KEYS[1] = state key, KEYS[2] = stats key; ARGV = now, algo, capacity, rate,
+# unused (tokens handed back), used (tokens consumed locally by calls counted as ok),
+# want (block size, 0 = only return), min_grant, stats_ttl. Grants the largest
+# block <= want that is available right now, or nothing if that is below
+# min_grant (counted as r429). Returns granted, remaining, retry-after.
+LUA_LEASE_SCRIPT = LUA_ALGORITHMS + LUA_REFUNDS + """
+local key = KEYS[1]
+local stats_key = KEYS[2]
+local now = tonumber(ARGV[1])
+local fn = ALGORITHMS[ARGV[2]] or token_bucket
+local refund = REFUNDS[ARGV[2]] or refund_token_bucket
+local capacity = tonumber(ARGV[3])
+local rate = tonumber(ARGV[4])
+local unused = tonumber(ARGV[5])
+local used = tonumber(ARGV[6])
+local want = tonumber(ARGV[7])
+local min_grant = tonumber(ARGV[8])
+local stats_ttl = tonumber(ARGV[9])
+
+if unused > 0 then
+    refund(key, now, capacity, rate, unused)
+end
+if used > 0 then
+    redis.call('HINCRBY', stats_key, 'ok', used)
+    redis.call('EXPIRE', stats_key, stats_ttl)
+end
+
+local granted = 0
+local _, remain, retry_after = fn(key, now, capacity, rate, 0, 0)
+if want > 0 then
+    local grant = math.min(want, math.floor(remain + EPS))
+    if grant >= min_grant then
+        _, remain = fn(key, now, capacity, rate, grant, 1)
+        granted = grant
+        retry_after = 0
+    else
+        _, remain, retry_after = fn(key, now, capacity, rate, min_grant, 0)
+        redis.call('HINCRBY', stats_key, 'r429', 1)
+        redis.call('EXPIRE', stats_key, stats_ttl)
+    end
+end
+return {granted, tostring(remain), tostring(retry_after)}
+"""
+
+
+# Outcome of work acquired with success = -1 (task execution), recorded once
+# it has run: KEYS = stats key of every level of the quota; ARGV = latency_ms,
+# stats_ttl, outcome (1 = ok, 0 = err, -1 = latency only). A latency of 0 only
+# counts the outcome.
+LUA_OBSERVE_SCRIPT = LUA_STATS + """
+local latency_ms = tonumber(ARGV[1])
+local stats_ttl = tonumber(ARGV[2])
+local outcome = tonumber(ARGV[3] or -1)
+for _, stats_key in ipairs(KEYS) do
+    record_outcome(stats_key, outcome)
+    if latency_ms > 0 then
+        record_latency(stats_key, latency_ms)
+    end
+    redis.call('EXPIRE', stats_key, stats_ttl)
+end
+return #KEYS
+"""
+
+
+# Concurrency slots: KEYS[1] = sorted set of lease id -> expiry time,
+# KEYS[2] = stats key; ARGV = now, capacity, lease_id, ttl, stats_ttl, enabled,
+# success (as for the acquire script). Expired leases (crashed holders) are reclaimed first. Returns allowed, free
+# slots left, and seconds until the oldest lease expires when full. Releasing
+# is a plain ZREM of the lease id.
+LUA_SLOT_ACQUIRE_SCRIPT = LUA_STATS + """
+local key = KEYS[1]
+local now = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local lease_id = ARGV[3]
+local ttl = tonumber(ARGV[4])
+local stats_ttl = tonumber(ARGV[5])
+local enabled = tonumber(ARGV[6])
+local success = tonumber(ARGV[7] or 1)
+
+redis.call('ZREMRANGEBYSCORE', key, '-inf', now)
+local held = redis.call('ZCARD', key)
+if enabled == 1 and held < capacity then
+    redis.call('ZADD', key, now + ttl, lease_id)
+    local last = redis.call('ZRANGE', key, -1, -1, 'WITHSCORES')
+    redis.call('PEXPIREAT', key, math.ceil(tonumber(last[2]) * 1000) + 1)
+    record_stats(KEYS[2], 1, success, 0, stats_ttl)
+    return {1, tostring(capacity - held - 1), '0'}
+end
+
+record_stats(KEYS[2], 0, success, 0, stats_ttl)
+if enabled ~= 1 or capacity <= 0 then
+    return {0, '0', '-1'}
+end
+local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+return {0, tostring(math.max(0, capacity - held)), tostring(tonumber(oldest[2]) - now)}
+"""
+
+
+# Renew a held slot: KEYS[1] = sorted set of the slots; ARGV = now, lease_id,
+# ttl. Moves the lease's expiry to now + ttl (ZADD XX never re-creates a
+# lease that was already reclaimed) and keeps the key alive until the last
+# lease expires. Returns 1 if the lease was still held, else 0.
+LUA_SLOT_RENEW_SCRIPT = """
+local key = KEYS[1]
+local now = tonumber(ARGV[1])
+if not redis.call('ZSCORE', key, ARGV[2]) then
+    return 0
+end
+redis.call('ZADD', key, 'XX', now + tonumber(ARGV[3]), ARGV[2])
+local last = redis.call('ZRANGE', key, -1, -1, 'WITHSCORES')
+redis.call('PEXPIREAT', key, math.ceil(tonumber(last[2]) * 1000) + 1)
+return 1
+"""
+
+
+# Reconcile after a Redis outage: KEYS[1] = state key; ARGV = now, algo,
+# capacity, rate, window_start, window_reset, burst (as for peek), target.
+# Debits the state down to ``target`` remaining, i.e. what the in-memory
+# fallback left over, and never below empty. Returns the amount debited.
+LUA_RECONCILE_SCRIPT = LUA_ALGORITHMS + """
+local now = tonumber(ARGV[1])
+local fn = ALGORITHMS[ARGV[2]] or token_bucket
+local capacity = tonumber(ARGV[3])
+local rate = tonumber(ARGV[4])
+local win = window_arg(ARGV[5], ARGV[6], ARGV[7])
+local _, remain = fn(KEYS[1], now, capacity, rate, 0, 0, win)
+local debit = math.floor(remain - tonumber(ARGV[8]) + EPS)
+if debit <= 0 then
+    return 0
+end
+local ok = fn(KEYS[1], now, capacity, rate, debit, 1, win)
+if ok ~= 1 then
+    return 0
+end
+return debit
+"""
+
+
+# Scripts loaded into Redis by LimiterService, keyed by name
+SCRIPTS = {
+    "acquire": LUA_ACQUIRE_SCRIPT,
+    "peek": LUA_PEEK_SCRIPT,
+    "inspect": LUA_INSPECT_SCRIPT,
+    "lease": LUA_LEASE_SCRIPT,
+    "slot_acquire": LUA_SLOT_ACQUIRE_SCRIPT,
+    "slot_renew": LUA_SLOT_RENEW_SCRIPT,
+    "observe": LUA_OBSERVE_SCRIPT,
+    "reconcile": LUA_RECONCILE_SCRIPT,
+}
@@ -0,0 +1,142 @@
+"""Daily range partitions of the metrics and traces tables (PostgreSQL).
+
+Both tables are partitioned by their timestamp, one partition per UTC day
+named ``<table>_pYYYYMMDD``. The maintenance job creates the partitions of
+the coming days ahead of time and drops whole partitions once every row in
+them is past the table's retention, which is O(1) and leaves no bloat; the
+chunked DELETEs of services/retention.py only handle what is left inside the
+kept days (e.g. successful traces kept shorter than error traces). Queries
+bounded on the timestamp only touch the partitions of their range.
+
+Tables created before partitioning are converted by
+migrations/partition_metrics_traces.sql; until then the job does nothing.
+"""
+
+from __future__ import annotations
+
+import datetime as dt
+import re
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+
+from ..core.config import settings
+from ..core.database import engine
+from ..core.logging_config import get_logger
+from .retention import retention_policies
+
+logger = get_logger(__name__)
+
+
+# Partitioned table -> partition key column
+PARTITIONED_TABLES = {"metrics": "ts", "traces": "created_at"}
+
+_PARTITION_SUFFIX = re.compile(r"_p(\d{8})$")
+
+
+def partition_name(table: str, day: dt.date) -> str:
+    return f"{table}_p{day:%Y%m%d}"
+
+
+def _is_partitioned(conn, table: str) -> bool:
+    return conn.execute(
+        text(
+            "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid "
+            "WHERE c.relname = :table AND pg_table_is_visible(c.oid)"
+        ),
+        {"table": table},
+    ).first() is not None
+
+
+def _partitions(conn, table: str) -> Dict[str, dt.date]:
+    """Daily partitions of ``table`` by name, with the day they hold."""
+    rows = conn.execute(
+        text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = :table AND pg_table_is_visible(p.oid)"
+        ),
+        {"table": table},
+    ).all()
+    result = {}
+    for (name,) in rows:
+        match = _PARTITION_SUFFIX.search(name)
+        if match:
+            result[name] = dt.datetime.strptime(match.group(1), "%Y%m%d").date()
+    return result
+
+
+def retention_days(table: str) -> int:
+    """Days a partition of ``table`` is kept: the longest of the table's retention policies (0 = forever)."""
+    days = [policy.days for policy in retention_policies() if policy.model.__tablename__ == table]
+    if not days or min(days) <= 0:
+        return 0
+    return max(days)
+
+
+def expired_partitions(partitions: Dict[str, dt.date], days: int, today: dt.date) -> List[str]:
+    """Names of the partitions whose whole day is older than ``days`` days before ``today``, oldest first."""
+    if days <= 0:
+        return []
+    # A partition holds [day, day + 1); it expires once day + 1 <= the cutoff
+    cutoff = today - dt.timedelta(days=days)
+    return [
+        name
+        for name, day in sorted(partitions.items(), key=lambda item: item[1])
+        if day + dt.timedelta(days=1) <= cutoff
+    ]
+
+
+def ensure_partitions(today: Optional[dt.date] = None, days_ahead: Optional[int] = None) -> List[str]:
+    """Create the partitions from yesterday to ``days_ahead`` days from now; returns the new ones."""
+    if engine.dialect.name != "postgresql":
+        return []
+    today = today or dt.datetime.now(dt.timezone.utc).date()
+    days_ahead = settings.partition_premake_days if days_ahead is None else days_ahead
+    created = []
+    with engine.begin() as conn:
+        for table in PARTITIONED_TABLES:
+            if not _is_partitioned(conn, table):
+                logger.warning(f"{table} 表未分区，请执行 migrations/partition_metrics_traces.sql")
+                continue
+            existing = _partitions(conn, table)
+            for offset in range(-1, days_ahead + 1):
+                day = today + dt.timedelta(days=offset)
+                name = partition_name(table, day)
+                if name in existing:
+                    continue
+                conn.execute(text(
+                    f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF "{table}" '
+                    f"FOR VALUES FROM ('{day.isoformat()} 00:00:00+00') "
+                    f"TO ('{(day + dt.timedelta(days=1)).isoformat()} 00:00:00+00')"
+                ))
+                created.append(name)
+    return created
+
+
+def drop_expired_partitions(today: Optional[dt.date] = None) -> List[str]:
+    """Drop the partitions whose whole day is past the table's retention; returns the dropped ones."""
+    if engine.dialect.name != "postgresql":
+        return []
+    today = today or dt.datetime.now(dt.timezone.utc).date()
+    dropped = []
+    with engine.begin() as conn:
+        for table in PARTITIONED_TABLES:
+            days = retention_days(table)
+            if days <= 0 or not _is_partitioned(conn, table):
+                continue
+            for name in expired_partitions(_partitions(conn, table), days, today):
+                conn.execute(text(f'DROP TABLE IF EXISTS "{name}"'))
+                dropped.append(name)
+    return dropped
+
+
+def partition_maintenance() -> None:
+    """Pre-create the coming partitions and drop the expired ones."""
+    try:
+        created = ensure_partitions()
+        dropped = drop_expired_partitions()
+        if created or dropped:
+            logger.info(f"分区维护完成：新建 {len(created)} 个，删除 {len(dropped)} 个 {dropped}")
+    except Exception as e:
+        logger.error(f"分区维护失败: {e}", exc_info=True)
@@ -0,0 +1,222 @@
+"""Quota definitions cached per process and kept in sync across workers.
+
+Every worker holds a copy of the quotas table. Changes made through the quota
+API are published on a Redis channel; each worker's listener thread reloads
+its copy as soon as the message arrives, so the limiter never has to read
+Postgres on the acquire path.
+
+Adaptive quotas (``max_refill_rate`` set) run at the rate the rate
+controller keeps in ``EFFECTIVE_RATES_KEY``; the cached copies carry that
+rate instead of the configured one, so every limiter path picks it up.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+from sqlmodel import Session, select
+
+from ..core.config import settings
+from ..core.database import engine
+from ..core.logging_config import get_logger
+from ..core.redis_client import get_redis
+from ..models import Quota
+
+logger = get_logger(__name__)
+
+
+# Redis channel carrying quota change notifications (payload: quota id)
+QUOTA_CHANNEL = "quota:changed"
+
+# Longest parent chain followed for hierarchical quotas (endpoint → domain → global)
+MAX_QUOTA_DEPTH = 8
+
+# Redis hash of quota id -> refill rate set by the rate controller
+EFFECTIVE_RATES_KEY = "quota:effective_rates"
+
+
+def configured_rate(quota: Quota) -> float:
+    """Rate the limiter refills (or drains) the quota at: leak_rate for leaky buckets that set one."""
+    if quota.algo == "leaky_bucket" and quota.leak_rate:
+        return quota.leak_rate
+    return quota.refill_rate
+
+
+def rate_bounds(quota: Quota) -> Optional[tuple[float, float]]:
+    """``(floor, ceiling)`` of an adaptive quota, None when its rate is fixed.
+
+    The floor defaults to ``rate_control_floor_fraction`` of the configured rate.
+    """
+    if not quota.max_refill_rate or quota.algo == "concurrency":
+        return None
+    rate = configured_rate(quota)
+    floor = quota.min_refill_rate if quota.min_refill_rate is not None else rate * settings.rate_control_floor_fraction
+    return min(floor, quota.max_refill_rate), quota.max_refill_rate
+
+
+def _apply_rate(quota: Quota, rate: float) -> None:
+    if quota.algo == "leaky_bucket" and quota.leak_rate:
+        quota.leak_rate = rate
+    else:
+        quota.refill_rate = rate
+
+
+@dataclass
+class QuotaCache:
+    """Detached copies of all Quota rows, looked up by id or by name.
+
+    The whole (small) quotas table is loaded with one SELECT and reused until
+    it is invalidated (locally or through ``QUOTA_CHANNEL``), or ``ttl``
+    seconds pass as a safety net for edits made outside the quota API.
+    Cached objects are shared between threads and must be treated as
+    read-only. Callbacks added with ``add_listener`` get every reloaded list.
+    """
+    ttl: float = settings.quota_cache_ttl_seconds
+    _by_id: Dict[str, Quota] = field(default_factory=dict)
+    _by_name: Dict[str, Quota] = field(default_factory=dict)
+    _loaded_at: Optional[float] = None
+    _lock: threading.Lock = field(default_factory=threading.Lock)
+    _listeners: List[Callable[[List[Quota]], None]] = field(default_factory=list)
+    effective_rates: Dict[str, float] = field(default_factory=dict)  # copy of EFFECTIVE_RATES_KEY
+    _subscriber: Optional[threading.Thread] = None
+    _stop: threading.Event = field(default_factory=threading.Event)
+
+    @property
+    def fresh(self) -> bool:
+        """True when lookups are answered without touching the database."""
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl
+
+    def _load(self, force: bool = False) -> None:
+        with self._lock:
+            if self.fresh and not force:
+                return
+            with Session(engine) as session:
+                rows = session.exec(select(Quota)).all()
+                quotas = [Quota(**row.model_dump()) for row in rows]
+            for quota in quotas:
+                bounds = rate_bounds(quota)
+                rate = self.effective_rates.get(quota.id)
+                if bounds is not None and rate is not None:
+                    _apply_rate(quota, min(max(rate, bounds[0]), bounds[1]))
+            self._by_id = {quota.id: quota for quota in quotas}
+            self._by_name = {quota.name: quota for quota in quotas if quota.name}
+            self._loaded_at = time.monotonic()
+            logger.debug(f"配额缓存已加载 {len(quotas)} 个配额")
+            for listener in self._listeners:
+                try:
+                    listener(quotas)
+                except Exception as e:
+                    logger.error(f"配额缓存监听器执行失败: {e}", exc_info=True)
+
+    def get(self, quota_id: str) -> Optional[Quota]:
+        """Quota by id, None if it does not exist."""
+        if not self.fresh:
+            self._load()
+        return self._by_id.get(quota_id)
+
+    def get_by_name(self, name: str) -> Optional[Quota]:
+        """Quota by name, None if it does not exist."""
+        if not self.fresh:
+            self._load()
+        return self._by_name.get(name)
+
+    def all(self) -> List[Quota]:
+        if not self.fresh:
+            self._load()
+        return list(self._by_id.values())
+
+    def chain(self, quota: Quota) -> List[Quota]:
+        """``quota`` followed by its ancestors, nearest parent first.
+
+        Stops at a missing parent, a cycle or ``MAX_QUOTA_DEPTH`` levels. A
+        quota without parent never touches the cache.
+        """
+        chain = [quota]
+        seen = {quota.id}
+        parent_id = quota.parent_id
+        while parent_id and parent_id not in seen and len(chain) < MAX_QUOTA_DEPTH:
+            parent = self.get(parent_id)
+            if parent is None:
+                logger.warning(f"配额 {chain[-1].id} 的父配额 {parent_id} 不存在，忽略上级限流")
+                break
+            chain.append(parent)
+            seen.add(parent.id)
+            parent_id = parent.parent_id
+        return chain
+
+    def add_listener(self, callback: Callable[[List[Quota]], None]) -> None:
+        """Call ``callback(quotas)`` after every reload."""
+        self._listeners.append(callback)
+
+    def invalidate(self) -> None:
+        """Drop the cached definitions; the next lookup reloads them."""
+        self._loaded_at = None
+
+    def set_effective_rates(self, rates: Dict[str, float]) -> None:
+        """Replace the controller rates of this process; the next lookup reloads the cache."""
+        self.effective_rates = dict(rates)
+        self.invalidate()
+
+    def _read_effective_rates(self) -> None:
+        try:
+            rates = get_redis().hgetall(EFFECTIVE_RATES_KEY)
+        except Exception as e:
+            logger.warning(f"读取自适应速率失败，沿用当前速率: {e}")
+            return
+        self.effective_rates = {
+            (key.decode() if isinstance(key, bytes) else key): float(value) for key, value in rates.items()
+        }
+
+    def publish_change(self, quota_id: str) -> None:
+        """Invalidate locally and tell every worker that ``quota_id`` changed."""
+        self.invalidate()
+        try:
+            get_redis().publish(QUOTA_CHANNEL, quota_id)
+        except Exception as e:
+            logger.warning(f"发布配额变更失败，其他进程将在缓存过期后生效: {e}")
+
+    def start_subscriber(self) -> None:
+        """Reload the cache whenever a change is published (idempotent)."""
+        if self._subscriber is not None and self._subscriber.is_alive():
+            return
+        self._stop.clear()
+        self._subscriber = threading.Thread(target=self._subscribe, name="quota-subscriber", daemon=True)
+        self._subscriber.start()
+
+    def stop_subscriber(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        if self._subscriber is not None:
+            self._subscriber.join(timeout)
+            self._subscriber = None
+
+    def _subscribe(self) -> None:
+        while not self._stop.is_set():
+            pubsub = None
+            try:
+                pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(QUOTA_CHANNEL)
+                # Changes may have been missed while (re)connecting
+                self._read_effective_rates()
+                self._load(force=True)
+                logger.info(f"✓ 已订阅配额变更频道 {QUOTA_CHANNEL}")
+                while not self._stop.is_set():
+                    message = pubsub.get_message(timeout=1.0)
+                    if message is not None:
+                        logger.info(f"收到配额变更: {message['data']!r}，重新加载配额缓存")
+                        self._read_effective_rates()
+                        self._load(force=True)
+            except Exception as e:
+                logger.warning(f"配额变更订阅中断，稍后重连: {e}")
+                self._stop.wait(5.0)
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+
+
+quota_cache = QuotaCache()
@@ -0,0 +1,115 @@
+"""AIMD control of adaptive quota rates from health-check signals.
+
+An adaptive quota (``max_refill_rate`` set) runs at an effective rate
+between its floor and ceiling (see ``quota_store.rate_bounds``). Every
+health check the controller looks at the quota's metrics window:
+
+- error rate above ``rate_control_error_rate_threshold`` or p95 latency
+  above ``rate_control_latency_p95_ms``: multiplicative decrease
+- otherwise, if the limiter denied calls (429s), callers want more than the
+  current rate and upstream is coping: additive increase
+- otherwise the rate stays
+
+Effective rates live in the Redis hash ``EFFECTIVE_RATES_KEY`` and a change
+is published like a quota edit, so every worker reloads its quota cache
+with the new rate. The Quota rows keep the configured rate.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Dict, Optional, Sequence
+
+from ..core.config import settings
+from ..core.logging_config import get_logger
+from ..core.redis_client import get_redis
+from ..models import Quota
+from .quota_store import EFFECTIVE_RATES_KEY, configured_rate, quota_cache, rate_bounds
+
+logger = get_logger(__name__)
+
+
+# Every worker runs the health check; the first to take this lock runs the step
+CONTROL_LOCK_KEY = "quota:rate_control:lock"
+# A little shorter than the 3 minute health check interval
+CONTROL_LOCK_SECONDS = 150
+
+
+@dataclass
+class QuotaSignals:
+    """Health of a quota over the alert window, summed from its Metric rows."""
+    ok: int
+    err: int
+    r429: int
+    latency_p95: Optional[float] = None  # worst minute in the window
+
+    @property
+    def error_rate(self) -> float:
+        """Failed share of the calls that were let through."""
+        executed = self.ok + self.err
+        return self.err / executed if executed else 0.0
+
+
+def next_rate(current: float, configured: float, bounds: tuple[float, float], signals: QuotaSignals) -> float:
+    """One AIMD step from ``current``, clamped to ``bounds``."""
+    floor, ceiling = bounds
+    latency_limit = settings.rate_control_latency_p95_ms
+    slow = latency_limit > 0 and (signals.latency_p95 or 0.0) > latency_limit
+    if signals.error_rate > settings.rate_control_error_rate_threshold or slow:
+        rate = current * settings.rate_control_decrease_factor
+    elif signals.r429 > 0:
+        rate = current + configured * settings.rate_control_increase_fraction
+    else:
+        rate = current
+    return min(max(rate, floor), ceiling)
+
+
+@dataclass
+class RateController:
+    """Adjusts the effective rates of adaptive quotas, see the module docstring."""
+
+    def update(self, observations: Sequence[tuple[Quota, QuotaSignals]]) -> Dict[str, float]:
+        """Run one control step over ``(quota, signals)`` pairs; returns the changed rates.
+
+        ``quota`` is the Quota row (configured rate). Quotas that are no
+        longer adaptive lose their effective rate.
+        """
+        if not settings.rate_control_enabled:
+            return {}
+        adaptive = [(quota, signals, rate_bounds(quota)) for quota, signals in observations]
+        fixed = [quota.id for quota, _, bounds in adaptive if bounds is None]
+        adaptive = [item for item in adaptive if item[2] is not None]
+        r = get_redis()
+        if not r.set(CONTROL_LOCK_KEY, "1", nx=True, ex=CONTROL_LOCK_SECONDS):
+            return {}
+        current = {
+            (key.decode() if isinstance(key, bytes) else key): float(value)
+            for key, value in r.hgetall(EFFECTIVE_RATES_KEY).items()
+        }
+        stale = [quota_id for quota_id in fixed if quota_id in current]
+        changed: Dict[str, float] = {}
+        for quota, signals, bounds in adaptive:
+            configured = configured_rate(quota)
+            old = current.get(quota.id, configured)
+            new = next_rate(old, configured, bounds, signals)
+            if abs(new - old) > 1e-9:
+                changed[quota.id] = new
+                logger.info(
+                    f"自适应速率 {quota.id}: {old:.4g} → {new:.4g}/s "
+                    f"(错误率 {signals.error_rate:.2%}, 429 {signals.r429}, p95 {signals.latency_p95 or 0:.0f}ms)"
+                )
+        if not changed and not stale:
+            return {}
+        if changed:
+            r.hset(EFFECTIVE_RATES_KEY, mapping=changed)
+        if stale:
+            r.hdel(EFFECTIVE_RATES_KEY, *stale)
+        current.update(changed)
+        for quota_id in stale:
+            current.pop(quota_id, None)
+        quota_cache.set_effective_rates(current)
+        quota_cache.publish_change(EFFECTIVE_RATES_KEY)
+        return changed
+
+
+rate_controller = RateController()
@@ -0,0 +1,112 @@
+"""Retention of the append-only metrics, metric rollup and traces tables.
+
+Rows are deleted in primary-key ranges of ``retention_chunk_size`` with one
+set-based DELETE per range, each in its own short transaction, so a run
+never loads rows into memory or holds locks for long. Ids grow with the
+row timestamps, which lets a binary search over the primary key find the
+last id before a policy's cutoff without an index on the timestamp; the
+timestamp condition is still part of every DELETE, so rows written out of
+order are kept until a later run.
+"""
+
+from __future__ import annotations
+
+import datetime as dt
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Type
+
+from sqlalchemy import delete, func, select
+from sqlmodel import SQLModel
+
+from ..core.config import settings
+from ..core.database import engine
+from ..core.logging_config import get_logger
+from ..models import Metric, MetricDaily, MetricHourly, TraceLog
+
+logger = get_logger(__name__)
+
+
+@dataclass(frozen=True)
+class RetentionPolicy:
+    """Rows of ``model`` matching ``where`` are deleted once ``ts_column`` is older than ``days``."""
+    name: str
+    model: Type[SQLModel]
+    ts_column: str
+    days: int  # 0 = keep forever
+    where: Optional[Any] = None  # extra SQL condition selecting the rows of this policy
+
+
+def retention_policies() -> List[RetentionPolicy]:
+    """Policies from the settings; error traces are kept longer than the rest."""
+    is_error = TraceLog.status_code >= 500
+    return [
+        RetentionPolicy("metrics", Metric, "ts", settings.metric_retention_days),
+        RetentionPolicy("metrics_hourly", MetricHourly, "ts", settings.metric_hourly_retention_days),
+        RetentionPolicy("metrics_daily", MetricDaily, "ts", settings.metric_daily_retention_days),
+        RetentionPolicy("traces", TraceLog, "created_at", settings.trace_retention_days, ~is_error),
+        RetentionPolicy("error_traces", TraceLog, "created_at", settings.trace_error_retention_days, is_error),
+    ]
+
+
+def _naive_utc(value: dt.datetime) -> dt.datetime:
+    """``value`` as naive UTC, the way the TIMESTAMP WITHOUT TIME ZONE columns hold it."""
+    if value.tzinfo is not None:
+        value = value.astimezone(dt.timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _boundary_id(conn, model: Type[SQLModel], ts, cutoff: dt.datetime, low: int, high: int) -> int:
+    """First id in ``[low, high]`` whose row is at or after ``cutoff`` (``high + 1`` if none)."""
+    cutoff = _naive_utc(cutoff)
+    pk = model.id
+    while low <= high:
+        middle = (low + high) // 2
+        row = conn.execute(select(pk, ts).where(pk >= middle).order_by(pk).limit(1)).first()
+        if row is None or row[0] > high:
+            high = middle - 1
+        elif _naive_utc(row[1]) < cutoff:
+            low = row[0] + 1
+        else:
+            high = middle - 1
+    return low
+
+
+def apply_policy(policy: RetentionPolicy, now: Optional[dt.datetime] = None, chunk_size: Optional[int] = None) -> int:
+    """Delete the expired rows of one policy chunk by chunk; returns the number deleted."""
+    if policy.days <= 0:
+        return 0
+    chunk_size = chunk_size or settings.retention_chunk_size
+    cutoff = _naive_utc(now or dt.datetime.now(dt.timezone.utc)) - dt.timedelta(days=policy.days)
+    model = policy.model
+    ts = getattr(model, policy.ts_column)
+
+    with engine.connect() as conn:
+        low, high = conn.execute(select(func.min(model.id), func.max(model.id))).first()
+        if low is None:
+            return 0
+        end = _boundary_id(conn, model, ts, cutoff, low, high)
+
+    condition = ts < cutoff
+    if policy.where is not None:
+        condition = condition & policy.where
+    deleted = 0
+    for start in range(low, end, chunk_size):
+        statement = delete(model).where(
+            model.id >= start,
+            model.id < min(start + chunk_size, end),
+            condition,
+        )
+        with engine.begin() as conn:
+            deleted += conn.execute(statement).rowcount or 0
+    return deleted
+
+
+def apply_retention(now: Optional[dt.datetime] = None) -> Dict[str, int]:
+    """Run every retention policy; returns the rows deleted per policy."""
+    result: Dict[str, int] = {}
+    for policy in retention_policies():
+        try:
+            result[policy.name] = apply_policy(policy, now)
+        except Exception as e:
+            logger.error(f"数据保留策略 {policy.name} 执行失败: {e}", exc_info=True)
+    return result
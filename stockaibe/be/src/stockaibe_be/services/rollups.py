@@ -0,0 +1,181 @@
+"""Hourly and daily rollups of the per-minute metrics.
+
+Every hour the rollup job merges the minute rows of the last closed hours
+into ``metrics_hourly`` and recomputes the day containing them in
+``metrics_daily`` from the hourly rows. Counts are summed, latency
+histograms are merged bucket by bucket and the percentiles recomputed from
+the merged histogram, and ``tokens_remain`` is the value at the end of the
+bucket. A bucket is always rebuilt from all of its source rows, so running a
+range again (or backfilling with ``rollup_metrics``) is idempotent. Every
+worker schedules the job; a per-hour Redis lock lets one of them run it.
+
+``choose_resolution`` picks the table a chart reads: the finest resolution
+whose number of points over the requested range fits the point budget.
+"""
+
+from __future__ import annotations
+
+import datetime as dt
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple, Type
+
+from sqlalchemy import delete, insert
+from sqlmodel import Session, SQLModel, select
+
+from ..core.config import settings
+from ..core.database import engine
+from ..core.logging_config import get_logger
+from ..core.redis_client import get_redis
+from ..models import Metric, MetricDaily, MetricHourly
+from .limiter import latency_percentiles
+
+logger = get_logger(__name__)
+
+# The first worker to take an hour's lock runs that hour's rollup
+ROLLUP_LOCK_PREFIX = "metrics:rollup:lock:"
+ROLLUP_LOCK_SECONDS = 3000
+
+
+@dataclass(frozen=True)
+class Resolution:
+    """One metrics table and the width of its buckets."""
+    name: str
+    model: Type[SQLModel]
+    seconds: int
+
+
+RESOLUTIONS = [
+    Resolution("1m", Metric, 60),
+    Resolution("1h", MetricHourly, 3600),
+    Resolution("1d", MetricDaily, 86400),
+]
+
+
+def as_utc(ts: dt.datetime) -> dt.datetime:
+    """``ts`` as an aware UTC datetime; naive values are taken to be UTC already."""
+    if ts.tzinfo is None:
+        return ts.replace(tzinfo=dt.timezone.utc)
+    return ts.astimezone(dt.timezone.utc)
+
+
+def choose_resolution(start: dt.datetime, end: dt.datetime, points: int) -> Resolution:
+    """The finest resolution with at most ``points`` buckets between ``start`` and ``end``."""
+    span = (as_utc(end) - as_utc(start)).total_seconds()
+    for resolution in RESOLUTIONS:
+        if span / resolution.seconds <= points:
+            return resolution
+    return RESOLUTIONS[-1]
+
+
+def bucket_start(ts: dt.datetime, seconds: int) -> dt.datetime:
+    """Start of the UTC bucket of width ``seconds`` containing ``ts``."""
+    epoch = int(as_utc(ts).timestamp())
+    return dt.datetime.fromtimestamp(epoch - epoch % seconds, dt.timezone.utc)
+
+
+def merge_rows(rows: Iterable) -> Dict[str, object]:
+    """Merge metric rows of one quota and bucket into the columns of a rollup row.
+
+    Rows without a histogram (written before histograms were stored)
+    contribute the worst of their percentiles instead.
+    """
+    ok = err = r429 = 0
+    histogram: Dict[str, int] = {}
+    legacy: List[Tuple[Optional[float], Optional[float], Optional[float]]] = []
+    last_ts = None
+    tokens_remain = None
+    for row in rows:
+        ok += row.ok
+        err += row.err
+        r429 += row.r429
+        if row.latency_hist:
+            for name, count in row.latency_hist.items():
+                histogram[name] = histogram.get(name, 0) + count
+        elif row.latency_p95 is not None:
+            legacy.append((row.latency_p50, row.latency_p95, row.latency_p99))
+        if last_ts is None or row.ts >= last_ts:
+            last_ts = row.ts
+            tokens_remain = row.tokens_remain
+    percentiles = latency_percentiles(histogram)
+    for values in legacy:
+        percentiles = [
+            current if value is None else value if current is None else max(current, value)
+            for current, value in zip(percentiles, values)
+        ]
+    p50, p95, p99 = percentiles
+    return {
+        "ok": ok,
+        "err": err,
+        "r429": r429,
+        "latency_p50": p50,
+        "latency_p95": p95,
+        "latency_p99": p99,
+        "latency_hist": histogram or None,
+        "tokens_remain": tokens_remain,
+    }
+
+
+def aggregate(rows: Iterable, seconds: int) -> List[Dict[str, object]]:
+    """Group metric rows by quota and bucket and merge each group into a rollup row.
+
+    Rows repeating a ``(quota_id, ts)`` already seen (a minute snapshot
+    written twice) are counted once.
+    """
+    unique = {(row.quota_id, row.ts): row for row in rows}
+    groups: Dict[Tuple[str, dt.datetime], list] = {}
+    for (quota_id, ts), row in unique.items():
+        groups.setdefault((quota_id, bucket_start(ts, seconds)), []).append(row)
+    return [
+        {"ts": ts, "quota_id": quota_id, **merge_rows(group)}
+        for (quota_id, ts), group in sorted(groups.items(), key=lambda item: item[0][1])
+    ]
+
+
+def _rollup(source: Resolution, target: Resolution, start: dt.datetime, end: dt.datetime) -> int:
+    """Rebuild the ``target`` buckets in ``[start, end)`` from the ``source`` rows; returns the rows written."""
+    start, end = bucket_start(start, target.seconds), bucket_start(end, target.seconds)
+    if start >= end:
+        return 0
+    model = source.model
+    statement = select(
+        model.quota_id, model.ts, model.ok, model.err, model.r429,
+        model.latency_p50, model.latency_p95, model.latency_p99, model.latency_hist, model.tokens_remain,
+    ).where(model.ts >= start, model.ts < end)
+    with Session(engine) as session:
+        rows = aggregate(session.exec(statement).all(), target.seconds)
+    # One short transaction replaces the buckets
+    with engine.begin() as conn:
+        conn.execute(delete(target.model).where(target.model.ts >= start, target.model.ts < end))
+        if rows:
+            conn.execute(insert(target.model).values(rows))
+    return len(rows)
+
+
+def rollup_metrics(start: dt.datetime, end: dt.datetime) -> Dict[str, int]:
+    """Rebuild the hourly and daily rollups of the closed hours in ``[start, end)`` (also for backfills)."""
+    minute, hour, day = RESOLUTIONS
+    hourly = 0
+    # A day of minute rows at a time, so backfills of long ranges stay small
+    chunk_start = start
+    while chunk_start < end:
+        chunk_end = min(end, bucket_start(chunk_start, day.seconds) + dt.timedelta(days=1))
+        hourly += _rollup(minute, hour, chunk_start, chunk_end)
+        chunk_start = chunk_end
+    # Whole days containing the range, from the hourly rows just written
+    day_end = bucket_start(end - dt.timedelta(microseconds=1), day.seconds) + dt.timedelta(days=1)
+    daily = _rollup(hour, day, start, day_end)
+    return {"hourly": hourly, "daily": daily}
+
+
+def rollup_job(now: Optional[dt.datetime] = None) -> None:
+    """Roll up the last ``rollup_lookback_hours`` closed hours (once per hour across workers)."""
+    try:
+        end = bucket_start(now or dt.datetime.now(dt.timezone.utc), 3600)
+        if not get_redis().set(f"{ROLLUP_LOCK_PREFIX}{end:%Y%m%d%H}", "1", nx=True, ex=ROLLUP_LOCK_SECONDS):
+            logger.debug(f"指标汇总 {end:%Y-%m-%d %H:%M} 已由其他进程执行")
+            return
+        start = end - dt.timedelta(hours=max(1, settings.rollup_lookback_hours))
+        written = rollup_metrics(start, end)
+        logger.info(f"指标汇总完成（{start:%Y-%m-%d %H:%M} ~ {end:%H:%M} UTC）: {written}")
+    except Exception as e:
+        logger.error(f"指标汇总任务失败: {e}", exc_info=True)
@@ -2,19 +2,29 @@
 
 from __future__ import annotations
 
+import contextlib
 import datetime as dt
-from typing import Any, Callable
+import math
+from typing import Any, Callable, Dict, Optional, Sequence
 
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
+from sqlalchemy import case, insert
 from sqlmodel import Session, select, func
 
 from ..core.config import settings
 from ..core.database import engine
 from ..core.redis_client import get_redis
 from ..core.logging_config import get_logger
-from ..models import SchedulerTask, Metric, Quota, TraceLog
-from .limiter import limiter_service
+from ..models import SchedulerTask, Metric, Quota
+from .limiter import latency_histogram, latency_percentiles, limiter_service
+from .limiter_scripts import CONCURRENCY
+from .quota_store import quota_cache
+from .rate_control import QuotaSignals, rate_controller
+from .partitions import partition_maintenance
+from .retention import apply_retention
+from .rollups import rollup_job
+from .trace_writer import trace_sink
 from .task_decorators import get_task_by_id
 from .task_registry import initialize_task_system, get_active_tasks
 
@@ -24,136 +34,178 @@ logger = get_logger(__name__)
 
 scheduler = AsyncIOScheduler(timezone=settings.scheduler_timezone)
 
+# Every worker runs the snapshot; the first to take a minute's lock writes its rows
+SNAPSHOT_LOCK_PREFIX = "metrics:snapshot:lock:"
+SNAPSHOT_LOCK_SECONDS = 300
+
 
 def _with_session(func: Callable[[Session], Any]) -> None:
     with Session(engine) as session:
         func(session)
 
 
-def snapshot_metrics(session: Session) -> None:
-    """Aggregate Redis stats and save to database."""
-    now = dt.datetime.now(dt.timezone.utc)
+def snapshot_metrics(session: Session, now: Optional[dt.datetime] = None) -> None:
+    """Save the stats of the last closed minute of every quota to the database.
+
+    Runs a few seconds into each minute in every worker; a per-minute Redis
+    lock (``SET NX``) lets only one of them write the minute. The stats
+    hashes of all quotas are read with one pipelined round trip, remaining
+    tokens with one read-only script call, and the Metric rows are written
+    with a single multi-row INSERT, so the cost stays flat as quotas are
+    added.
+    """
+    now = now or dt.datetime.now(dt.timezone.utc)
+    # The previous minute no longer receives writes; the current one is still filling
+    minute = now.replace(second=0, microsecond=0) - dt.timedelta(minutes=1)
+    minute_key = minute.strftime("%Y%m%d%H%M")
     
     try:
         r = get_redis()
-        statement = select(Quota)
-        quotas = session.exec(statement).all()
+        if not r.set(f"{SNAPSHOT_LOCK_PREFIX}{minute_key}", "1", nx=True, ex=SNAPSHOT_LOCK_SECONDS):
+            logger.debug(f"指标快照 {minute_key} 已由其他进程写入")
+            return
         
+        quotas = session.exec(select(Quota)).all()
+        if not quotas:
+            return
+        
+        pipe = r.pipeline(transaction=False)
         for quota in quotas:
-            # Get stats from Redis for the current minute
-            minute_key = now.strftime("%Y%m%d%H%M")
-            stats_key = f"stats:{quota.id}:{minute_key}"
-            
+            pipe.hgetall(f"stats:{quota.id}:{minute_key}")
+        all_stats = pipe.execute()
+        
+        # Remaining tokens of every quota with one read-only script call; the
+        # cached copies carry the effective rate of adaptive quotas
+        cached = [quota_cache.get(quota.id) or quota for quota in quotas]
+        tokens = {snapshot.quota_id: snapshot.tokens for snapshot in limiter_service.inspect_many(cached)}
+        
+        rows = []
+        for quota, stats in zip(quotas, all_stats):
+            if not stats:
+                continue
             try:
-                stats = r.hgetall(stats_key)
-                if stats:
-                    ok = int(stats.get(b"ok", 0))
-                    err = int(stats.get(b"err", 0))
-                    r429 = int(stats.get(b"r429", 0))
-                    latency_sum = float(stats.get(b"latency_sum", 0))
-                    latency_count = int(stats.get(b"latency_count", 0))
-                    
-                    # Calculate P95 latency (simplified as average for now)
-                    latency_p95 = latency_sum / latency_count if latency_count > 0 else None
-                    
-                    # Get current token count
-                    tokens_remain = limiter_service.get_current_tokens(quota.id)
-                    
-                    # Save to database
-                    metric = Metric(
-                        ts=now,
-                        quota_id=quota.id,
-                        ok=ok,
-                        err=err,
-                        r429=r429,
-                        latency_p95=latency_p95,
-                        tokens_remain=tokens_remain,
-                    )
-                    session.add(metric)
+                # Percentiles from the log-bucketed latency histogram
+                latency_p50, latency_p95, latency_p99 = latency_percentiles(stats)
+                rows.append({
+                    "ts": minute,
+                    "quota_id": quota.id,
+                    "ok": int(stats.get(b"ok", 0)),
+                    "err": int(stats.get(b"err", 0)),
+                    "r429": int(stats.get(b"r429", 0)),
+                    "latency_p50": latency_p50,
+                    "latency_p95": latency_p95,
+                    "latency_p99": latency_p99,
+                    "latency_hist": latency_histogram(stats) or None,
+                    "tokens_remain": tokens.get(quota.id),
+                })
             except Exception as e:
                 logger.error(f"快照指标失败 {quota.id}: {e}", exc_info=True)
         
-        session.commit()
-        logger.info(f"指标快照完成，处理了 {len(quotas)} 个配额")
+        if rows:
+            session.execute(insert(Metric).values(rows))
+            session.commit()
+        logger.info(f"指标快照完成（{minute_key}），{len(quotas)} 个配额，写入 {len(rows)} 条")
     except Exception as e:
         logger.error(f"快照指标任务失败: {e}", exc_info=True)
         session.rollback()
 
 
+def window_signals(
+    session: Session, windows: Sequence[int], now: Optional[dt.datetime] = None
+) -> Dict[str, Dict[int, QuotaSignals]]:
+    """Sum the Metric rows of every quota over several trailing windows at once.
+
+    One grouped query over the longest window: each shorter window is a
+    conditional sum, so the cost does not grow with the number of quotas.
+    Returns ``{quota_id: {minutes: QuotaSignals}}``; quotas without rows in
+    the longest window are missing.
+    """
+    now = now or dt.datetime.now(dt.timezone.utc)
+    windows = sorted(set(windows))
+    columns = []
+    for minutes in windows:
+        in_window = Metric.ts >= now - dt.timedelta(minutes=minutes)
+        columns.extend(
+            func.sum(case((in_window, column), else_=0))
+            for column in (Metric.ok, Metric.err, Metric.r429)
+        )
+        columns.append(func.max(case((in_window, Metric.latency_p95), else_=None)))
+    statement = (
+        select(Metric.quota_id, *columns)
+        .where(Metric.ts >= now - dt.timedelta(minutes=windows[-1]))
+        .group_by(Metric.quota_id)
+    )
+    result: Dict[str, Dict[int, QuotaSignals]] = {}
+    for row in session.exec(statement).all():
+        signals = result[row[0]] = {}
+        for index, minutes in enumerate(windows):
+            ok, err, r429, latency_p95 = row[1 + 4 * index : 5 + 4 * index]
+            signals[minutes] = QuotaSignals(int(ok or 0), int(err or 0), int(r429 or 0), latency_p95)
+    return result
+
+
 def health_check_job(session: Session) -> None:
-    """Analyze error rates and 429 rates, trigger alerts or circuit breakers."""
-    now = dt.datetime.now(dt.timezone.utc)
-    window_start = now - dt.timedelta(minutes=settings.alert_window_minutes)
+    """Analyze error rates, 429 rates and error-budget burn, alert, and adapt the rates of adaptive quotas."""
+    alert_window = settings.alert_window_minutes
+    burn_windows = settings.alert_burn_windows_minutes
     
     try:
         statement = select(Quota).where(Quota.enabled == True)
         quotas = session.exec(statement).all()
+        # All quotas and windows with one query
+        totals = window_signals(session, [alert_window, *burn_windows])
+        observations = []
         
+        idle = QuotaSignals(0, 0, 0)
         for quota in quotas:
-            # Query metrics in the alert window
-            statement = select(
-                func.sum(Metric.ok).label("total_ok"),
-                func.sum(Metric.err).label("total_err"),
-                func.sum(Metric.r429).label("total_429"),
-            ).where(
-                Metric.quota_id == quota.id,
-                Metric.ts >= window_start,
-            )
-            result = session.exec(statement).first()
+            windows = totals.get(quota.id, {})
+            signals = windows.get(alert_window, idle)
+            observations.append((quota, signals))
             
-            if result:
-                total_ok = result[0] or 0
-                total_err = result[1] or 0
-                total_429 = result[2] or 0
-                total_requests = total_ok + total_err + total_429
+            total_requests = signals.ok + signals.err + signals.r429
+            if total_requests > 0:
+                error_rate = signals.err / total_requests
+                rate_429 = signals.r429 / total_requests
+                
+                # Check thresholds
+                if error_rate > settings.alert_error_rate_threshold:
+                    logger.warning(
+                        f"⚠️ 告警: {quota.id} 错误率 {error_rate:.2%} "
+                        f"超过阈值 {settings.alert_error_rate_threshold:.2%}"
+                    )
                 
-                if total_requests > 0:
-                    error_rate = total_err / total_requests
-                    rate_429 = total_429 / total_requests
-                    
-                    # Check thresholds
-                    if error_rate > settings.alert_error_rate_threshold:
-                        logger.warning(
-                            f"⚠️ 告警: {quota.id} 错误率 {error_rate:.2%} "
-                            f"超过阈值 {settings.alert_error_rate_threshold:.2%}"
-                        )
-                        # TODO: Implement circuit breaker logic
-                        # quota.enabled = False
-                        # session.commit()
-                    
-                    if rate_429 > settings.alert_429_rate_threshold:
-                        logger.warning(
-                            f"⚠️ 告警: {quota.id} 429 比率 {rate_429:.2%} "
-                            f"超过阈值 {settings.alert_429_rate_threshold:.2%}"
-                        )
-                        # TODO: Implement auto-slowdown logic
-                        # quota.refill_rate *= 0.8
-                        # session.commit()
+                if rate_429 > settings.alert_429_rate_threshold:
+                    logger.warning(
+                        f"⚠️ 告警: {quota.id} 429 比率 {rate_429:.2%} "
+                        f"超过阈值 {settings.alert_429_rate_threshold:.2%}"
+                    )
+            
+            # Multi-window burn rate: the error budget must be burning too fast in
+            # every window, so a short spike or an old incident alone does not alert
+            if burn_windows and settings.alert_error_budget > 0:
+                burn_rates = [
+                    windows.get(minutes, idle).error_rate / settings.alert_error_budget for minutes in burn_windows
+                ]
+                if min(burn_rates) >= settings.alert_burn_rate_threshold:
+                    detail = "，".join(
+                        f"{minutes} 分钟 {rate:.1f}x" for minutes, rate in zip(burn_windows, burn_rates)
+                    )
+                    logger.warning(
+                        f"🔥 告警: {quota.id} 错误预算消耗过快（{detail}），"
+                        f"阈值 {settings.alert_burn_rate_threshold:.1f}x"
+                    )
+        
+        # 自适应配额：按窗口内的错误率、429 和延迟调整实际速率（写入 Redis，不改配额表）
+        rate_controller.update(observations)
     except Exception as e:
         logger.error(f"健康检查任务失败: {e}", exc_info=True)
 
 
-def window_reset_job(session: Session) -> None:
-    """Clean up expired Redis keys and old metrics."""
-    try:
-        r = get_redis()
-        
-        # Clean up old metrics (keep last 7 days)
-        cutoff = dt.datetime.now(dt.timezone.utc) - dt.timedelta(days=7)
-        statement = select(Metric).where(Metric.ts < cutoff)
-        old_metrics = session.exec(statement).all()
-        for metric in old_metrics:
-            session.delete(metric)
-        session.commit()
-        deleted = len(old_metrics)
-        
-        if deleted > 0:
-            logger.info(f"🗑️ 清理了 {deleted} 条旧指标")
-        
-        # Redis keys are auto-expired via TTL, no manual cleanup needed
-    except Exception as e:
-        logger.error(f"窗口重置任务失败: {e}", exc_info=True)
-        session.rollback()
+def retention_job() -> None:
+    """Delete expired metrics and traces (Redis keys expire via TTL)."""
+    deleted = apply_retention()
+    if any(deleted.values()):
+        logger.info(f"🗑️ 数据保留清理完成: {deleted}")
 
 
 def _execute_limiter_task(job_id: str, session: Session) -> None:
@@ -171,8 +223,7 @@ def _execute_limiter_task(job_id: str, session: Session) -> None:
     # 获取关联的配额（通过 name 字段匹配）
     quota = None
     if metadata.quota_name:
-        statement = select(Quota).where(Quota.name == metadata.quota_name)
-        quota = session.exec(statement).first()
+        quota = quota_cache.get_by_name(metadata.quota_name)
         if not quota:
             logger.warning(
                 f"任务 {job_id} 关联的配额名称 '{metadata.quota_name}' 不存在，"
@@ -182,31 +233,41 @@ def _execute_limiter_task(job_id: str, session: Session) -> None:
     start_time = time.time()
     success = False
     error_msg = None
+    lease_id = None
+    acquired = False
     
     try:
         if quota and quota.enabled:
-            # 尝试获取令牌
-            allowed, remain = limiter_service.acquire(
-                db=session,
-                quota=quota,
-                cost=1,
-                success=False,  # 先标记为 False，执行成功后更新
-                message=f"执行任务: {metadata.name}",
-                func_id=metadata.job_id,
-                func_name=metadata.name,
-            )
+            # 尝试获取令牌或并发槽位（追踪在任务结束后只记录一条，
+            # ok/err 在任务结束后与执行耗时一起计入配额统计）
+            if quota.algo == CONCURRENCY:
+                lease_id, remain, _ = limiter_service.acquire_slot(quota, success=None)
+                allowed = lease_id is not None
+            else:
+                allowed, remain, _ = limiter_service.try_acquire(quota, cost=1, success=None)
             
             if not allowed:
+                trace_sink.record(
+                    quota_id=quota.id,
+                    func_id=metadata.job_id,
+                    func_name=metadata.name,
+                    status_code=429,
+                    message=f"任务被限流: {metadata.name}",
+                )
                 logger.warning(f"⚠️ 任务 {job_id} 被限流，剩余令牌: {remain}")
                 return
             
             # 执行任务
-            func(session)
+            acquired = True
+            start_time = time.time()
+            # 长任务执行期间续期并发槽位，避免租约在任务结束前过期被回收
+            with limiter_service.slot_heartbeat(quota, lease_id) if lease_id else contextlib.nullcontext():
+                func(session)
             success = True
             
-            # 更新为成功状态
             latency_ms = (time.time() - start_time) * 1000
-            trace = TraceLog(
+            limiter_service.record_outcome(quota, True, latency_ms)
+            trace_sink.record(
                 quota_id=quota.id,
                 func_id=metadata.job_id,
                 func_name=metadata.name,
@@ -214,7 +275,6 @@ def _execute_limiter_task(job_id: str, session: Session) -> None:
                 latency_ms=latency_ms,
                 message=f"任务执行成功: {metadata.name}",
             )
-            session.add(trace)
         else:
             # 无配额限制或配额未启用，直接执行
             func(session)
@@ -228,7 +288,9 @@ def _execute_limiter_task(job_id: str, session: Session) -> None:
         # 记录错误
         if quota:
             latency_ms = (time.time() - start_time) * 1000
-            trace = TraceLog(
+            if acquired:
+                limiter_service.record_outcome(quota, False, latency_ms)
+            trace_sink.record(
                 quota_id=quota.id,
                 func_id=metadata.job_id,
                 func_name=metadata.name,
@@ -236,9 +298,11 @@ def _execute_limiter_task(job_id: str, session: Session) -> None:
                 latency_ms=latency_ms,
                 message=f"任务执行失败: {error_msg}",
             )
-            session.add(trace)
     
     finally:
+        if lease_id:
+            limiter_service.release_slot(quota, lease_id)
+        
         # 更新任务最后执行时间
         statement = select(SchedulerTask).where(SchedulerTask.job_id == job_id)
         db_task = session.exec(statement).first()
@@ -337,18 +401,30 @@ def init_jobs(tasks_dir: str = None) -> None:
         # 内置系统任务
         logger.info("添加内置系统任务...")
         
-        # Snapshot metrics every minute
+        # Snapshot the previous minute's metrics, a few seconds after it closes
         if not scheduler.get_job("snapshot_metrics"):
             scheduler.add_job(
                 lambda: _with_session(snapshot_metrics),
-                trigger="interval",
-                seconds=60,
+                trigger="cron",
+                second=5,
                 id="snapshot_metrics",
                 name="Snapshot Metrics",
                 replace_existing=True,
             )
             logger.info("✓ 已添加任务: Snapshot Metrics")
         
+        # Roll the closed hours up into the hourly / daily metrics
+        if not scheduler.get_job("metrics_rollup"):
+            scheduler.add_job(
+                rollup_job,
+                trigger="cron",
+                minute=2,
+                id="metrics_rollup",
+                name="Metrics Rollup",
+                replace_existing=True,
+            )
+            logger.info("✓ 已添加任务: Metrics Rollup")
+        
         # Health check every 3 minutes
         if not scheduler.get_job("health_check"):
             scheduler.add_job(
@@ -361,18 +437,43 @@ def init_jobs(tasks_dir: str = None) -> None:
             )
             logger.info("✓ 已添加任务: Health Check")
         
-        # Window reset daily at 3 AM
-        if not scheduler.get_job("window_reset"):
+        # Return expired token leases to Redis
+        if not scheduler.get_job("release_leases"):
+            scheduler.add_job(
+                limiter_service.release_leases,
+                trigger="interval",
+                seconds=max(1, math.ceil(settings.lease_ttl_seconds)),
+                id="release_leases",
+                name="Release Leases",
+                replace_existing=True,
+            )
+            logger.info("✓ 已添加任务: Release Leases")
+        
+        # Create upcoming and drop expired metrics/traces partitions daily
+        if not scheduler.get_job("partition_maintenance"):
+            scheduler.add_job(
+                partition_maintenance,
+                trigger="cron",
+                hour=0,
+                minute=10,
+                id="partition_maintenance",
+                name="Partition Maintenance",
+                replace_existing=True,
+            )
+            logger.info("✓ 已添加任务: Partition Maintenance")
+        
+        # Retention of metrics and traces daily at 3 AM
+        if not scheduler.get_job("retention"):
             scheduler.add_job(
-                lambda: _with_session(window_reset_job),
+                retention_job,
                 trigger="cron",
                 hour=3,
                 minute=0,
-                id="window_reset",
-                name="Window Reset",
+                id="retention",
+                name="Retention",
                 replace_existing=True,
             )
-            logger.info("✓ 已添加任务: Window Reset")
+            logger.info("✓ 已添加任务: Retention")
         
         logger.info("✓ 所有定时任务已初始化完成")
     except Exception as e:
@@ -0,0 +1,198 @@
+"""Token buckets in shared memory, used by every worker on the host while Redis is down.
+
+The table is a memory-mapped file of fixed-size slots (quota key, tokens,
+last refill, capacity, rate). A slot is locked with an ``fcntl`` byte-range
+lock for other processes and a striped ``threading.Lock`` for threads of
+this process (``fcntl`` locks are per process), so gunicorn/uvicorn workers
+enforce one shared limit instead of one limit each. Only available where
+``fcntl`` exists (Linux/macOS); elsewhere the limiter keeps its
+per-process twins.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Sequence
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from ..core.config import settings
+from ..core.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+
+# File header: magic, layout version, slot count
+HEADER = struct.Struct("<4sII")
+MAGIC = b"SKLB"
+VERSION = 1
+# Slot: quota key (0 = free), tokens, last refill (epoch seconds), capacity, rate
+SLOT = struct.Struct("<Qdddd")
+# Thread lock stripes per process
+LOCK_STRIPES = 64
+
+# Tolerance for float rounding, same as EPS in the Lua scripts
+_EPSILON = 1e-9
+
+
+def _quota_key(quota_id: str) -> int:
+    """Stable 64-bit key of a quota id (``hash()`` differs between processes)."""
+    key = int.from_bytes(hashlib.blake2b(quota_id.encode(), digest_size=8).digest(), "little")
+    return key or 1
+
+
+def default_path() -> str:
+    """``/dev/shm`` when available so the table never touches disk."""
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(base, "stockaibe_limiter.buckets")
+
+
+@dataclass
+class SharedBucketTable:
+    """Fixed-slot array of token buckets shared by the processes mapping ``path``."""
+    path: str
+    slots: int
+    _fd: int = -1
+    _mm: Optional[mmap.mmap] = None
+    _index: Dict[str, int] = field(default_factory=dict)  # quota id -> slot, per process
+    _stripes: List[threading.Lock] = field(
+        default_factory=lambda: [threading.Lock() for _ in range(LOCK_STRIPES)]
+    )
+
+    def __post_init__(self) -> None:
+        size = HEADER.size + self.slots * SLOT.size
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        # The header lock serializes initialization between workers starting together
+        fcntl.lockf(self._fd, fcntl.LOCK_EX, HEADER.size, 0)
+        try:
+            header = os.pread(self._fd, HEADER.size, 0)
+            if len(header) < HEADER.size or HEADER.unpack(header) != (MAGIC, VERSION, self.slots):
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, size)
+                os.pwrite(self._fd, HEADER.pack(MAGIC, VERSION, self.slots), 0)
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, HEADER.size, 0)
+        self._mm = mmap.mmap(self._fd, size)
+
+    @classmethod
+    def open_default(cls) -> Optional["SharedBucketTable"]:
+        """Open the table from settings; None when disabled or unsupported."""
+        if not settings.shared_fallback_enabled:
+            return None
+        if fcntl is None:
+            logger.info("当前平台不支持 fcntl，共享内存限流不可用，使用进程内限流")
+            return None
+        path = settings.shared_fallback_path or default_path()
+        try:
+            table = cls(path=path, slots=settings.shared_fallback_slots)
+        except OSError as e:
+            logger.warning(f"打开共享内存限流表失败 {path}: {e}")
+            return None
+        logger.info(f"共享内存限流表已打开: {path} ({table.slots} 个槽位)")
+        return table
+
+    def _offset(self, slot: int) -> int:
+        return HEADER.size + slot * SLOT.size
+
+    @contextmanager
+    def _locked(self, slots: Sequence[int]) -> Iterator[None]:
+        """Lock slots in ascending order (stripes first), so lockers never deadlock."""
+        ordered = sorted(set(slots))
+        with ExitStack() as stack:
+            for stripe in sorted({slot % LOCK_STRIPES for slot in ordered}):
+                stack.enter_context(self._stripes[stripe])
+            for slot in ordered:
+                fcntl.lockf(self._fd, fcntl.LOCK_EX, SLOT.size, self._offset(slot))
+                stack.callback(fcntl.lockf, self._fd, fcntl.LOCK_UN, SLOT.size, self._offset(slot))
+            yield
+
+    def _slot(self, quota_id: str) -> Optional[int]:
+        """Slot of a quota, claiming a free one (linear probing); None when the table is full."""
+        slot = self._index.get(quota_id)
+        if slot is not None:
+            return slot
+        key = _quota_key(quota_id)
+        start = key % self.slots
+        for probe in range(self.slots):
+            slot = (start + probe) % self.slots
+            with self._locked([slot]):
+                stored = SLOT.unpack_from(self._mm, self._offset(slot))[0]
+                if stored == 0:
+                    # Fresh bucket is full; capacity and rate are set on first use
+                    SLOT.pack_into(self._mm, self._offset(slot), key, -1.0, 0.0, 0.0, 0.0)
+                    stored = key
+            if stored == key:
+                self._index[quota_id] = slot
+                return slot
+        logger.warning(f"共享内存限流表已满（{self.slots} 个槽位），配额 {quota_id} 使用进程内限流")
+        return None
+
+    def _refill(self, slot: int, capacity: float, rate: float, now: float) -> float:
+        """Tokens of a locked slot at ``now`` with the current capacity and rate."""
+        key, tokens, last_refill, _, _ = SLOT.unpack_from(self._mm, self._offset(slot))
+        if tokens < 0:
+            return float(capacity)
+        return min(capacity, tokens + max(0.0, now - last_refill) * rate)
+
+    def acquire(
+        self, levels: Sequence[tuple[str, int, float, bool]], cost: int
+    ) -> Optional[tuple[bool, float, float]]:
+        """Take ``cost`` tokens from every ``(quota_id, capacity, rate, enabled)`` level or from none.
+
+        Mirrors the acquire script for token buckets: returns ``(allowed,
+        lowest remaining, retry-after seconds)`` (-1 = never), or None when a
+        level has no slot.
+        """
+        slots = [self._slot(quota_id) for quota_id, _, _, _ in levels]
+        if any(slot is None for slot in slots):
+            return None
+        now = time.time()
+        with self._locked(slots):
+            tokens = [
+                self._refill(slot, capacity, rate, now)
+                for slot, (_, capacity, rate, _) in zip(slots, levels)
+            ]
+            allowed = True
+            retry_after = 0.0
+            for available, (_, capacity, rate, enabled) in zip(tokens, levels):
+                if enabled and available + _EPSILON >= cost:
+                    continue
+                allowed = False
+                if not enabled or cost > capacity or rate <= 0 or retry_after < 0:
+                    retry_after = -1.0
+                else:
+                    retry_after = max(retry_after, (cost - available) / rate)
+            if allowed:
+                tokens = [available - cost for available in tokens]
+                for slot, available, (quota_id, capacity, rate, _) in zip(slots, tokens, levels):
+                    SLOT.pack_into(
+                        self._mm, self._offset(slot), _quota_key(quota_id), available, now, capacity, rate
+                    )
+        return allowed, min(tokens), retry_after
+
+    def tokens(self, quota_id: str, capacity: int, rate: float) -> Optional[float]:
+        """Remaining tokens of a quota without taking any; None when it has no slot."""
+        slot = self._slot(quota_id)
+        if slot is None:
+            return None
+        with self._locked([slot]):
+            return self._refill(slot, capacity, rate, time.time())
+
+    def close(self) -> None:
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
@@ -2,13 +2,12 @@
 
 from __future__ import annotations
 
+import contextlib
 import functools
 import inspect
 import time
 from typing import Any, Callable, Dict, List, Optional
 
-from sqlmodel import Session, select
-
 from ..core.logging_config import get_logger
 
 logger = get_logger(__name__)
@@ -193,6 +192,10 @@ def LimitCallTask(
     name: str,
     quota_name: str,
     description: Optional[str] = None,
+    timeout: Optional[float] = None,
+    lease: bool = False,
+    concurrency_quota: Optional[str] = None,
+    upstream: Optional[str] = None,
 ) -> Callable:
     """
     函数调用限流装饰器
@@ -205,6 +208,11 @@ def LimitCallTask(
         name: 任务名称（可重复）
         quota_name: 关联的配额名称（必须在 Quota 表中存在）
         description: 任务描述
+        timeout: 等待令牌的最长时间（秒），默认使用 settings.limit_call_timeout_seconds
+        lease: 是否使用令牌租约（从 Redis 批量预取令牌在本地发放，适合高频调用）
+        concurrency_quota: 额外的并发配额名称，函数执行期间占用其一个槽位
+        upstream: 上游主机名，获取令牌后等待该主机的自适应并发槽位并在执行期间占用
+            （见 adaptive_concurrency.upstream_limit）；等待计入等待时间，不计入执行耗时
         
     Example:
         @LimitCallTask(id="api_call_001", name="调用API", quota_name="external_api")
@@ -220,7 +228,9 @@ def LimitCallTask(
     
     注意:
         - 如果配额不存在或未启用，函数正常执行（无限制）
-        - 如果被限流，函数会阻塞等待直到获取到令牌
+        - 如果被限流，函数会按令牌补充所需的精确时间阻塞等待，超时抛出 RateLimitTimeout
+        - quota_name 指向并发配额（algo="concurrency"）时，函数执行期间占用一个槽位，
+          返回或抛出异常后归还（上下文管理器模式）
         - 需要在调用上下文中能访问数据库 Session
     """
     def decorator(func: Callable) -> Callable:
@@ -247,99 +257,115 @@ def LimitCallTask(
             限流策略：
             1. 尝试获取令牌
             2. 如果成功，执行函数
-            3. 如果失败，等待一段时间后重试
+            3. 如果失败，按限流脚本返回的精确等待时间休眠后重试，超时则抛出 RateLimitTimeout
+            4. 整个调用只记录一条追踪（等待时间、重试次数、执行耗时、最终状态）
             """
-            from ..core.database import engine
-            from ..models import Quota, TraceLog
-            from .limiter import limiter_service
+            from ..core.config import settings
+            from .adaptive_concurrency import upstream_limit
+            from .limiter import RateLimitTimeout, limiter_service
+            from .limiter_scripts import CONCURRENCY
+            from .quota_store import quota_cache
+            from .trace_writer import trace_sink
+            
+            # 获取配额（通过 name 字段匹配，进程内缓存，命中时不访问数据库）
+            quota = quota_cache.get_by_name(quota_name)
+            slot_quota = quota_cache.get_by_name(concurrency_quota) if concurrency_quota else None
+            if quota and quota.algo == CONCURRENCY:
+                # 并发配额：执行期间占用槽位，而不是消耗令牌
+                quota, slot_quota = None, quota
+            rate_quota = quota if quota and quota.enabled else None
+            slot_quota = slot_quota if slot_quota and slot_quota.enabled else None
             
-            # 获取配额（通过 name 字段匹配）
-            with Session(engine) as session:
-                statement = select(Quota).where(Quota.name == quota_name)
-                quota = session.exec(statement).first()
-                
-                if not quota or not quota.enabled:
-                    # 无配额或配额未启用，直接执行
-                    logger.debug(f"函数 {func.__name__} 无限流限制（配额名称: {quota_name}）")
+            if not rate_quota and not slot_quota:
+                # 无配额或配额未启用，直接执行
+                logger.debug(f"函数 {func.__name__} 无限流限制（配额名称: {quota_name}）")
+                with upstream_limit(upstream).slot() if upstream else contextlib.nullcontext():
                     return func(*args, **kwargs)
-                
-                # 尝试获取令牌，带重试机制
-                max_retries = 10
-                retry_count = 0
-                start_time = time.time()
-                
-                while retry_count < max_retries:
-                    allowed, remain = limiter_service.acquire(
-                        db=session,
-                        quota=quota,
-                        cost=1,
-                        success=False,  # 先标记为 False
-                        message=f"函数调用: {name}",
-                        func_id=id,
-                        func_name=name,
+            
+            trace_quota = rate_quota or slot_quota
+            
+            # 每次调用只记录一条追踪：等待时间、重试次数、执行耗时与最终状态；
+            # 获取令牌时不计 ok/err，执行结束后与执行耗时一起计入配额统计
+            def record(status_code: int, latency_ms: float | None, waited: float, attempts: int, message: str) -> None:
+                if latency_ms is not None:
+                    for held in (rate_quota, slot_quota):
+                        if held:
+                            limiter_service.record_outcome(held, status_code == 200, latency_ms)
+                trace_sink.record(
+                    quota_id=trace_quota.id,
+                    func_id=id,
+                    func_name=name,
+                    status_code=status_code,
+                    latency_ms=latency_ms,
+                    wait_ms=waited * 1000,
+                    retries=attempts - 1,
+                    message=message,
+                )
+            
+            max_wait = timeout if timeout is not None else settings.limit_call_timeout_seconds
+            waited, attempts, remain = 0.0, 1, 0.0
+            slot = None
+            try:
+                if rate_quota:
+                    decision = limiter_service.acquire_blocking(
+                        rate_quota, cost=1, timeout=max_wait, success=None, lease=lease,
                     )
-                    
-                    if allowed:
-                        # 获取令牌成功，执行函数
-                        try:
-                            result = func(*args, **kwargs)
-                            
-                            # 记录成功
-                            latency_ms = (time.time() - start_time) * 1000
-                            trace = TraceLog(
-                                quota_id=quota.id,
-                                func_id=id,
-                                func_name=name,
-                                status_code=200,
-                                latency_ms=latency_ms,
-                                message=f"函数调用成功: {name}",
-                            )
-                            session.add(trace)
-                            session.commit()
-                            
-                            logger.debug(
-                                f"✓ 函数 {func.__name__} 执行成功 "
-                                f"(耗时 {latency_ms:.2f}ms, 剩余令牌 {remain:.1f})"
-                            )
-                            return result
-                            
-                        except Exception as e:
-                            # 记录错误
-                            latency_ms = (time.time() - start_time) * 1000
-                            trace = TraceLog(
-                                quota_id=quota.id,
-                                func_id=id,
-                                func_name=name,
-                                status_code=500,
-                                latency_ms=latency_ms,
-                                message=f"函数调用失败: {str(e)}",
-                            )
-                            session.add(trace)
-                            session.commit()
-                            
-                            logger.error(f"✗ 函数 {func.__name__} 执行失败: {e}")
-                            raise
-                    else:
-                        # 被限流，等待后重试
-                        retry_count += 1
-                        wait_time = min(0.1 * (2 ** retry_count), 5.0)  # 指数退避，最多 5 秒
-                        
-                        logger.debug(
-                            f"⏳ 函数 {func.__name__} 被限流 "
-                            f"(剩余令牌 {remain:.1f}, 等待 {wait_time:.2f}s, "
-                            f"重试 {retry_count}/{max_retries})"
-                        )
-                        
-                        time.sleep(wait_time)
-                
-                # 超过最大重试次数
+                    waited, attempts, remain = decision.waited, decision.attempts, decision.remain
+                if slot_quota:
+                    slot = limiter_service.acquire_slot_blocking(
+                        slot_quota, timeout=max(0.0, max_wait - waited), success=None,
+                    )
+                    waited += slot.waited
+                    attempts += slot.attempts - 1
+                    remain = slot.remain if not rate_quota else min(remain, slot.remain)
+            except RateLimitTimeout as e:
+                # 超过最大等待时间，函数未执行
+                waited += e.decision.waited
+                attempts += e.decision.attempts - 1
+                record(429, None, waited, attempts, f"函数调用限流超时: {name}")
                 logger.warning(
-                    f"⚠️ 函数 {func.__name__} 超过最大重试次数 {max_retries}，"
-                    f"配额 {quota_name} 可能耗尽"
+                    f"⚠️ 函数 {func.__name__} 限流超时 "
+                    f"(尝试 {attempts} 次, 等待 {waited:.2f}s)，"
+                    f"配额 {e.decision.qid} 令牌不足"
                 )
-                raise RuntimeError(
-                    f"函数 {func.__name__} 限流超时，配额 {quota_name} 令牌不足"
+                raise
+            
+            if attempts > 1:
+                logger.debug(
+                    f"⏳ 函数 {func.__name__} 被限流，"
+                    f"等待 {waited:.2f}s 后获取令牌 (尝试 {attempts} 次)"
                 )
+            
+            # 获取令牌成功，执行函数；并发槽位在返回或异常后归还
+            start_time = time.time()
+            try:
+                with contextlib.ExitStack() as stack:
+                    if slot:
+                        # 执行期间续期并发槽位，长调用的租约不会中途过期
+                        stack.enter_context(limiter_service.slot_heartbeat(slot_quota, slot.lease_id))
+                    if upstream:
+                        # 上游槽位的排队时间计入等待时间，执行耗时只包含函数本身
+                        stack.enter_context(upstream_limit(upstream).slot())
+                        waited += time.time() - start_time
+                        start_time = time.time()
+                    result = func(*args, **kwargs)
+            except Exception as e:
+                latency_ms = (time.time() - start_time) * 1000
+                record(500, latency_ms, waited, attempts, f"函数调用失败: {str(e)}")
+                logger.error(f"✗ 函数 {func.__name__} 执行失败: {e}")
+                raise
+            finally:
+                if slot:
+                    limiter_service.release_slot(slot_quota, slot.lease_id)
+            
+            latency_ms = (time.time() - start_time) * 1000
+            record(200, latency_ms, waited, attempts, f"函数调用成功: {name}")
+            logger.debug(
+                f"✓ 函数 {func.__name__} 执行成功 "
+                f"(耗时 {latency_ms:.2f}ms, 等待 {waited * 1000:.2f}ms, "
+                f"剩余令牌 {remain:.1f})"
+            )
+            return result
         
         # 附加元数据，便于调试与自省
         wrapper._task_metadata = metadata
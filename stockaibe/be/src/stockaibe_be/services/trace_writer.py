@@ -0,0 +1,182 @@
+"""Buffered, batched writer for TraceLog rows."""
+
+from __future__ import annotations
+
+import atexit
+import datetime as dt
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+
+from ..core.config import settings
+from ..core.database import engine
+from ..core.logging_config import get_logger
+from ..models import TraceLog
+
+logger = get_logger(__name__)
+
+
+@dataclass
+class TraceSink:
+    """In-process queue of trace rows flushed to the database in bulk.
+
+    ``record`` only enqueues a row; a background thread writes the queue with
+    one multi-row INSERT per batch whenever ``batch_size`` rows are waiting or
+    ``flush_interval`` seconds have passed. When the queue is full producers
+    block for up to ``enqueue_timeout`` seconds (backpressure) before the row
+    is dropped. ``close`` drains the queue and is called on shutdown.
+    """
+    batch_size: int = settings.trace_batch_size
+    flush_interval: float = settings.trace_flush_interval_seconds
+    max_queue: int = settings.trace_queue_size
+    enqueue_timeout: float = settings.trace_enqueue_timeout_seconds
+    dropped: int = 0
+    _queue: queue.Queue = field(init=False)
+    _thread: Optional[threading.Thread] = None
+    _lock: threading.Lock = field(default_factory=threading.Lock)
+    _flushed: threading.Condition = field(default_factory=threading.Condition)
+    _pending: int = 0
+
+    def __post_init__(self) -> None:
+        self._queue = queue.Queue(maxsize=self.max_queue)
+
+    def start(self) -> None:
+        """Start the flush thread (idempotent)."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="trace-sink", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def record(
+        self,
+        quota_id: str,
+        status_code: int,
+        latency_ms: float | None = None,
+        message: str | None = None,
+        func_id: str | None = None,
+        func_name: str | None = None,
+        wait_ms: float | None = None,
+        retries: int | None = None,
+        block: bool = True,
+    ) -> None:
+        """Queue one trace row.
+
+        ``block=False`` never waits on a full queue (for event-loop callers);
+        the row is dropped instead.
+        """
+        now = dt.datetime.now(dt.timezone.utc)
+        self._put(
+            {
+                "quota_id": quota_id,
+                "func_id": func_id,
+                "func_name": func_name,
+                "status_code": status_code,
+                "latency_ms": latency_ms,
+                "wait_ms": wait_ms,
+                "retries": retries,
+                "message": message,
+                "created_at": now,
+                "updated_at": now,
+            },
+            block,
+        )
+
+    def record_many(self, rows: Iterable[Dict[str, Any]]) -> None:
+        """Queue several trace rows given as ``record`` keyword dicts."""
+        for row in rows:
+            self.record(**row)
+
+    def _put(self, row: Dict[str, Any], block: bool = True) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self.start()
+        with self._flushed:
+            self._pending += 1
+        try:
+            self._queue.put(row, block=block, timeout=self.enqueue_timeout)
+        except queue.Full:
+            with self._flushed:
+                self._pending -= 1
+                self._flushed.notify_all()
+            self.dropped += 1
+            logger.warning(f"追踪日志队列已满，丢弃 1 条记录（累计丢弃 {self.dropped}）")
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Block until every row queued so far is written. Returns False on timeout."""
+        if self._thread is None or not self._thread.is_alive():
+            return self._pending == 0
+        self._queue.put(None)  # wake the writer without waiting for the interval
+        with self._flushed:
+            return self._flushed.wait_for(lambda: self._pending == 0, timeout)
+
+    def close(self, timeout: float | None = 10.0) -> None:
+        """Flush the queue and stop the writer thread."""
+        if self._thread is None:
+            return
+        self.flush(timeout)
+        thread, self._thread = self._thread, None
+        self._queue.put(None)
+        thread.join(timeout)
+
+    def _run(self) -> None:
+        batch: List[Dict[str, Any]] = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                row = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                row = None
+            if row is not None:
+                batch.append(row)
+                if len(batch) < self.batch_size:
+                    continue
+            # Size reached, interval elapsed or an explicit flush/close
+            if batch:
+                self._write(batch)
+                with self._flushed:
+                    self._pending -= len(batch)
+                    self._flushed.notify_all()
+                batch = []
+            deadline = time.monotonic() + self.flush_interval
+            # close() detached this thread: exit once everything is written
+            if self._thread is not threading.current_thread() and self._queue.empty():
+                return
+
+    def _write(self, rows: List[Dict[str, Any]]) -> None:
+        """Write rows with a single multi-row INSERT.
+
+        A batch rejected by a constraint (e.g. a trace of a deleted quota) is
+        written again row by row, so only the offending rows are dropped.
+        """
+        try:
+            with engine.begin() as conn:
+                conn.execute(insert(TraceLog).values(rows))
+            return
+        except IntegrityError as e:
+            logger.warning(f"批量写入追踪日志违反约束，逐条重试 {len(rows)} 条: {e.orig}")
+        except Exception as e:
+            self.dropped += len(rows)
+            logger.error(f"批量写入追踪日志失败，丢弃 {len(rows)} 条: {e}")
+            return
+        rejected = 0
+        for index, row in enumerate(rows):
+            try:
+                with engine.begin() as conn:
+                    conn.execute(insert(TraceLog).values(row))
+            except IntegrityError as e:
+                rejected += 1
+                logger.warning(f"丢弃无效追踪日志 quota_id={row.get('quota_id')}: {e.orig}")
+            except Exception as e:
+                self.dropped += rejected + len(rows) - index
+                logger.error(f"逐条写入追踪日志失败，丢弃剩余 {len(rows) - index} 条: {e}")
+                return
+        self.dropped += rejected
+
+
+trace_sink = TraceSink()
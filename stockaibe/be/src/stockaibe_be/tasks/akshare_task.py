@@ -4,12 +4,14 @@ from __future__ import annotations
 
 import datetime as dt
 import math
-from typing import Dict, Iterable, List, Optional, Set
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
 
 import akshare as ak
 import pandas as pd
 from sqlmodel import Session, select
 
+from ..core.config import settings
 from ..core.logging_config import get_logger
 from ..models import (
     ShanghaiAMarketFundFlow,
@@ -19,17 +21,31 @@ from ..models import (
     ShanghaiAStockFundFlow,
     ShanghaiAStockPerformance,
 )
+from ..services.adaptive_concurrency import upstream_limit
+from ..services.limiter import RateLimitTimeout, limiter_service
+from ..services.limiter_scripts import FIXED_WINDOW
+from ..services.quota_store import quota_cache
 from ..services.shanghai_a_service import ShanghaiAService
 from ..services.task_decorators import LimitCallTask, SchedulerTask
 
 logger = get_logger(__name__)
 
-# Quota used for AkShare calls (needs to exist in quota management)
+# Quota used for AkShare calls (needs to exist in quota management); as a
+# fixed_window quota it is a calendar-day budget that resets at local midnight
 AKSHARE_DAILY_QUOTA = "akshare_daily"
 MAX_FINANCIAL_QUARTERS = 40
+# A fetch that timed out waiting for a quota token goes back in the queue this often
+RATE_LIMIT_RETRIES = 3
 CODE_COLUMN_CANDIDATES = ("股票代码", "代码", "证券代码")
 NAME_COLUMN_CANDIDATES = ("股票简称", "名称", "股票名称", "简称", "证券简称")
 
+# Upstream hosts behind the AkShare functions; each has its own adaptive
+# concurrency limit (see services/adaptive_concurrency.py)
+EASTMONEY_HISTORY_HOST = "push2his.eastmoney.com"
+EASTMONEY_QUOTE_HOST = "push2.eastmoney.com"
+EASTMONEY_DATACENTER_HOST = "datacenter-web.eastmoney.com"
+THS_DATA_HOST = "data.10jqka.com.cn"
+
 
 # ---------------------------------------------------------------------------
 # Utility helpers
@@ -415,6 +431,7 @@ def _upsert_stock_history(
     name="Market fund flow",
     quota_name=AKSHARE_DAILY_QUOTA,
     description="Fetch Shanghai & Shenzhen market fund flow via ak.stock_market_fund_flow",
+    upstream=EASTMONEY_HISTORY_HOST,
 )
 def fetch_market_fund_flow() -> pd.DataFrame:
     return ak.stock_market_fund_flow()
@@ -425,6 +442,7 @@ def fetch_market_fund_flow() -> pd.DataFrame:
     name="Shanghai A fund flow rank",
     quota_name=AKSHARE_DAILY_QUOTA,
     description="Fetch Shanghai A-share fund flow ranking via ak.stock_fund_flow_individual",
+    upstream=THS_DATA_HOST,
 )
 def fetch_shanghai_a_fund_flow_rank() -> pd.DataFrame:
     # Use 今日榜单（收盘后更新），若接口字段异常则自动切换即时榜单
@@ -465,6 +483,7 @@ def fetch_shanghai_a_fund_flow_rank() -> pd.DataFrame:
     name="Stock individual info",
     quota_name=AKSHARE_DAILY_QUOTA,
     description="Fetch per-stock metadata via ak.stock_individual_info_em",
+    upstream=EASTMONEY_QUOTE_HOST,
 )
 def fetch_stock_individual_info(symbol: str) -> pd.DataFrame:
     return ak.stock_individual_info_em(symbol=symbol)
@@ -475,6 +494,7 @@ def fetch_stock_individual_info(symbol: str) -> pd.DataFrame:
     name="Stock balance sheet (quarterly)",
     quota_name=AKSHARE_DAILY_QUOTA,
     description="Fetch quarterly balance sheet data via ak.stock_zcfz_em",
+    upstream=EASTMONEY_DATACENTER_HOST,
 )
 def fetch_stock_balance_sheet(raw_date: str) -> pd.DataFrame:
     """Wrapper around ak.stock_zcfz_em."""
@@ -486,6 +506,7 @@ def fetch_stock_balance_sheet(raw_date: str) -> pd.DataFrame:
     name="Stock performance (quarterly)",
     quota_name=AKSHARE_DAILY_QUOTA,
     description="Fetch quarterly earnings performance data via ak.stock_yjbb_em",
+    upstream=EASTMONEY_DATACENTER_HOST,
 )
 def fetch_stock_performance(raw_date: str) -> pd.DataFrame:
     """Wrapper around ak.stock_yjbb_em."""
@@ -497,6 +518,7 @@ def fetch_stock_performance(raw_date: str) -> pd.DataFrame:
     name="Stock history (daily/weekly/monthly)",
     quota_name=AKSHARE_DAILY_QUOTA,
     description="Fetch Shanghai A-share historical quotes via ak.stock_zh_a_hist",
+    upstream=EASTMONEY_HISTORY_HOST,
 )
 def fetch_stock_history(
     symbol: str,
@@ -520,6 +542,7 @@ def fetch_stock_history(
     name="Company news",
     quota_name=AKSHARE_DAILY_QUOTA,
     description="Fetch company news via ak.stock_gsrl_gsdt_em",
+    upstream=EASTMONEY_DATACENTER_HOST,
 )
 def fetch_company_news(date: str) -> pd.DataFrame:
     """Wrapper around ak.stock_gsrl_gsdt_em."""
@@ -531,12 +554,75 @@ def fetch_company_news(date: str) -> pd.DataFrame:
     name="Stock bid ask quote",
     quota_name=AKSHARE_DAILY_QUOTA,
     description="Fetch real-time stock bid/ask quote via ak.stock_bid_ask_em",
+    upstream=EASTMONEY_QUOTE_HOST,
 )
 def fetch_stock_bid_ask(symbol: str) -> pd.DataFrame:
     """Wrapper around ak.stock_bid_ask_em for real-time quote data."""
     return ak.stock_bid_ask_em(symbol=symbol)
 
 
+def _fetch_workers(host: str, quota_name: str) -> int:
+    """Threads for parallel fetches against ``host`` under the quota ``quota_name``.
+
+    At most the host's concurrency ceiling, and no more than the tokens the
+    quota refills within one LimitCallTask wait: every thread blocks for a
+    token, so extra threads would only time out.
+    """
+    workers = upstream_limit(host).max_limit
+    quota = quota_cache.get_by_name(quota_name)
+    if quota and quota.enabled and quota.refill_rate > 0:
+        refilled = int(quota.refill_rate * settings.limit_call_timeout_seconds)
+        workers = min(workers, max(1, refilled))
+    return workers
+
+
+def _fetch_concurrently(
+    fetch: Callable[..., pd.DataFrame],
+    jobs: Sequence[Tuple],
+    host: str,
+    quota_name: str = AKSHARE_DAILY_QUOTA,
+) -> Iterator[Tuple[Tuple, Optional[pd.DataFrame], Optional[BaseException]]]:
+    """Run ``fetch(*job)`` for every job in parallel, yielding ``(job, df, error)`` as each finishes.
+
+    The thread pool is sized by _fetch_workers; the host's adaptive limit
+    (taken by the fetch wrappers) decides how many calls are really in
+    flight. A job whose token wait timed out is queued again (up to
+    ``RATE_LIMIT_RETRIES`` times) when the token is due within another wait,
+    instead of being reported as failed. Results are handled on the calling
+    thread, so database sessions are never shared between threads.
+    """
+    workers = _fetch_workers(host, quota_name)
+    remaining = iter(jobs)
+    pending: Dict[Future, Tuple] = {}
+    retries: Dict[Tuple, int] = {}
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="akshare") as pool:
+
+        def submit_next() -> None:
+            job = next(remaining, None)
+            if job is not None:
+                pending[pool.submit(fetch, *job)] = job
+
+        # Keep a bounded backlog so finished DataFrames do not pile up
+        for _ in range(workers * 2):
+            submit_next()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                job = pending.pop(future)
+                error = future.exception()
+                if (
+                    isinstance(error, RateLimitTimeout)
+                    and 0 <= error.decision.retry_after <= settings.limit_call_timeout_seconds
+                    and retries.get(job, 0) < RATE_LIMIT_RETRIES
+                ):
+                    retries[job] = retries.get(job, 0) + 1
+                    logger.info("Rate limited fetch %s queued again (retry %d)", job, retries[job])
+                    pending[pool.submit(fetch, *job)] = job
+                    continue
+                submit_next()
+                yield job, (None if error else future.result()), error
+
+
 def _resolve_history_stock_codes(
     session: Session,
     stock_codes: Optional[Iterable[str]],
@@ -580,13 +666,15 @@ def collect_stock_history(
     start_str = start_date.strftime("%Y%m%d")
     end_str = end_date.strftime("%Y%m%d")
 
+    codes: List[str] = []
     for raw_code in stock_codes:
         code = _normalize_stock_code(raw_code)
         if not code:
             logger.debug("Skipping invalid stock code: %s", raw_code)
             continue
+        codes.append(code)
 
-        summary["stocks_processed"] += 1
+    def _fetch(code: str) -> pd.DataFrame:
         logger.info(
             "Collecting %s history for %s (%s -> %s, adjust=%s)",
             normalized_period,
@@ -595,24 +683,28 @@ def collect_stock_history(
             end_str,
             adjust,
         )
+        return fetch_stock_history(
+            symbol=code,
+            period=normalized_period,
+            start_date=start_str,
+            end_date=end_str,
+            adjust=adjust,
+        )
 
-        try:
-            df = fetch_stock_history(
-                symbol=code,
-                period=normalized_period,
-                start_date=start_str,
-                end_date=end_str,
-                adjust=adjust,
-            )
-        except Exception as exc:
+    # Fetches run in parallel under the upstream's adaptive limit; rows are
+    # written here, one stock at a time
+    for (code,), df, exc in _fetch_concurrently(_fetch, [(code,) for code in codes], EASTMONEY_HISTORY_HOST):
+        summary["stocks_processed"] += 1
+        if exc is not None:
             session.rollback()
-            logger.exception(
+            logger.error(
                 "History fetch failed for %s (%s, %s-%s): %s",
                 code,
                 normalized_period,
                 start_str,
                 end_str,
                 exc,
+                exc_info=exc,
             )
             continue
 
@@ -717,6 +809,30 @@ def _default_history_range(period: str, end_date: dt.date) -> tuple[dt.date, dt.
     raise ValueError(f"Unsupported period: {period}")
 
 
+def _plan_within_daily_budget(codes: List[str], label: str) -> List[str]:
+    """Trim a batch of one-call-per-code work to the AkShare daily budget.
+
+    Only applies when the quota is a fixed_window budget. Codes beyond the
+    remaining budget are left for the next run instead of failing with
+    RateLimitTimeout halfway through.
+    """
+    quota = quota_cache.get_by_name(AKSHARE_DAILY_QUOTA)
+    if not quota or not quota.enabled or quota.algo != FIXED_WINDOW:
+        return codes
+    remain, reset_at = limiter_service.get_budget(quota)
+    if remain is None or remain >= len(codes):
+        return codes
+    budget = max(0, int(remain))
+    logger.warning(
+        "AkShare daily budget covers %d of %d %s calls; the rest wait for the reset at %s",
+        budget,
+        len(codes),
+        label,
+        reset_at,
+    )
+    return codes[:budget]
+
+
 def _run_scheduled_history_task(session: Session, period: str, adjust: str = "hfq") -> None:
     """Helper for scheduler entries to collect history data."""
     today = dt.date.today()
@@ -728,6 +844,10 @@ def _run_scheduled_history_task(session: Session, period: str, adjust: str = "hf
     if not codes:
         logger.info("Skipped %s history task: no active stock codes", period)
         return
+    codes = _plan_within_daily_budget(codes, f"{period} history")
+    if not codes:
+        logger.info("Skipped %s history task: daily AkShare budget exhausted", period)
+        return
     summary = collect_stock_history(
         session=session,
         stock_codes=codes,
@@ -857,71 +977,56 @@ def collect_shanghai_a_financials(
     balance_codes: Set[str] = set()
     performance_codes: Set[str] = set()
 
+    datasets = []
+    if include_balance_sheet:
+        datasets.append("balance_sheet")
+    if include_performance:
+        datasets.append("performance")
+    jobs = []
+    for quarter_end in _iter_quarters(start_period, end_period):
+        summary["quarters_processed"].append(quarter_end.isoformat())
+        jobs.extend((quarter_end, dataset) for dataset in datasets)
+
+    def _fetch(quarter_end: dt.date, dataset: str) -> pd.DataFrame:
+        quarter_key = quarter_end.strftime("%Y%m%d")
+        if dataset == "balance_sheet":
+            return fetch_stock_balance_sheet(quarter_key)
+        return fetch_stock_performance(quarter_key)
+
+    labels = {"balance_sheet": "Balance sheet", "performance": "Performance"}
     try:
-        for quarter_end in _iter_quarters(start_period, end_period):
-            summary["quarters_processed"].append(quarter_end.isoformat())
+        # Quarter datasets are fetched in parallel; rows are written here
+        for (quarter_end, dataset), df, exc in _fetch_concurrently(_fetch, jobs, EASTMONEY_DATACENTER_HOST):
             quarter_key = quarter_end.strftime("%Y%m%d")
+            if exc is not None:
+                logger.warning("%s fetch failed at %s: %s", labels[dataset], quarter_key, exc)
+                continue
+            if df is None or df.empty:
+                logger.info("%s dataset empty for %s", labels[dataset], quarter_key)
+                continue
 
-            if include_balance_sheet:
-                try:
-                    balance_df = fetch_stock_balance_sheet(quarter_key)
-                except Exception as exc:
-                    logger.warning("Balance sheet fetch failed at %s: %s", quarter_key, exc)
-                else:
-                    if balance_df is None or balance_df.empty:
-                        logger.info("Balance sheet dataset empty for %s", quarter_key)
-                    else:
-                        for _, row in balance_df.iterrows():
-                            code = None
-                            for candidate in CODE_COLUMN_CANDIDATES:
-                                value = row.get(candidate)
-                                if value:
-                                    code = _normalize_stock_code(value)
-                                    if code:
-                                        break
-                            if not code:
-                                continue
-                            name = None
-                            for candidate in NAME_COLUMN_CANDIDATES:
-                                raw_name = row.get(candidate)
-                                if isinstance(raw_name, str) and raw_name.strip():
-                                    name = raw_name.strip()
-                                    break
-                            _ensure_stock(session, code, name or code)
-                            _upsert_balance_sheet(session, code, quarter_end, row.to_dict())
-                            summary["balance_sheet_rows"] += 1
-                            balance_codes.add(code)
-
-            if include_performance:
-                try:
-                    performance_df = fetch_stock_performance(quarter_key)
-                except Exception as exc:
-                    logger.warning("Performance fetch failed at %s: %s", quarter_key, exc)
-                else:
-                    if performance_df is None or performance_df.empty:
-                        logger.info("Performance dataset empty for %s", quarter_key)
-                    else:
-                        for _, row in performance_df.iterrows():
-                            code = None
-                            for candidate in CODE_COLUMN_CANDIDATES:
-                                value = row.get(candidate)
-                                if value:
-                                    code = _normalize_stock_code(value)
-                                    if code:
-                                        break
-                            if not code:
-                                continue
-                            name = None
-                            for candidate in NAME_COLUMN_CANDIDATES:
-                                raw_name = row.get(candidate)
-                                if isinstance(raw_name, str) and raw_name.strip():
-                                    name = raw_name.strip()
-                                    break
-                            _ensure_stock(session, code, name or code)
-                            _upsert_performance(session, code, quarter_end, row.to_dict())
-                            summary["performance_rows"] += 1
-                            performance_codes.add(code)
-
+            codes = balance_codes if dataset == "balance_sheet" else performance_codes
+            upsert = _upsert_balance_sheet if dataset == "balance_sheet" else _upsert_performance
+            for _, row in df.iterrows():
+                code = None
+                for candidate in CODE_COLUMN_CANDIDATES:
+                    value = row.get(candidate)
+                    if value:
+                        code = _normalize_stock_code(value)
+                        if code:
+                            break
+                if not code:
+                    continue
+                name = None
+                for candidate in NAME_COLUMN_CANDIDATES:
+                    raw_name = row.get(candidate)
+                    if isinstance(raw_name, str) and raw_name.strip():
+                        name = raw_name.strip()
+                        break
+                _ensure_stock(session, code, name or code)
+                upsert(session, code, quarter_end, row.to_dict())
+                summary[f"{dataset}_rows"] += 1
+                codes.add(code)
         session.commit()
     except Exception:
         session.rollback()
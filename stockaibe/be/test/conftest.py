@@ -0,0 +1,66 @@
+"""pytest setup: import the package from src and run against a throwaway SQLite database."""
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+from sqlalchemy import event
+
+# 添加 src 目录到 Python 路径
+src_path = Path(__file__).resolve().parent.parent / "src"
+if str(src_path) not in sys.path:
+    sys.path.insert(0, str(src_path))
+
+# The engine is created on import, so the database has to be chosen first
+os.environ.setdefault("LIMITER_DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/limiter_test.db")
+
+# Manual scripts that need a running server or AkShare; run them by hand
+collect_ignore = [
+    "test.py",
+    "test_decorator_simple.py",
+    "test_quota_tokens.py",
+    "test_simple.py",
+    "test_task_registration.py",
+]
+
+
+def _enforce_foreign_keys(dbapi_connection, _record):
+    # SQLite ignores foreign keys unless asked; PostgreSQL always checks them
+    dbapi_connection.execute("PRAGMA foreign_keys=ON")
+
+
+@pytest.fixture
+def db():
+    """Fresh tables for one test; yields the engine."""
+    from sqlmodel import SQLModel
+
+    from stockaibe_be.core.database import engine
+
+    if not event.contains(engine, "connect", _enforce_foreign_keys):
+        event.listen(engine, "connect", _enforce_foreign_keys)
+        engine.dispose()
+    SQLModel.metadata.drop_all(engine)
+    SQLModel.metadata.create_all(engine)
+    yield engine
+    SQLModel.metadata.drop_all(engine)
+
+
+@pytest.fixture
+def fake_redis():
+    """In-process Redis that runs the Lua scripts (fakeredis + lupa)."""
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    return fakeredis.FakeRedis()
+
+
+@pytest.fixture
+def limiter(fake_redis):
+    """LimiterService on ``fake_redis``, without the shared-memory fallback table."""
+    from stockaibe_be.services.limiter import LimiterService
+
+    service = LimiterService(_shared_opened=True)
+    service._load_scripts(fake_redis)
+    service._redis = fake_redis
+    return service
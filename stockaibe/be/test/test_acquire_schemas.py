@@ -0,0 +1,19 @@
+"""Validation of the acquire request bodies."""
+
+import pytest
+from pydantic import ValidationError
+
+from stockaibe_be.schemas import AcquireRequest, BatchAcquireItem
+
+
+@pytest.mark.parametrize("model", [AcquireRequest, BatchAcquireItem])
+def test_cost_defaults_to_one(model):
+    assert model(qid="q").cost == 1
+
+
+@pytest.mark.parametrize("model", [AcquireRequest, BatchAcquireItem])
+@pytest.mark.parametrize("cost", [0, -1, -100])
+def test_cost_below_one_is_rejected(model, cost):
+    # A negative cost would credit sliding / fixed window counters
+    with pytest.raises(ValidationError):
+        model(qid="q", cost=cost)
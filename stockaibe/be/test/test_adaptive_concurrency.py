@@ -0,0 +1,63 @@
+"""Gradient concurrency limits of upstream hosts."""
+
+import pytest
+
+from stockaibe_be.services.adaptive_concurrency import AdaptiveConcurrencyLimit
+
+
+def _limit(**kwargs) -> AdaptiveConcurrencyLimit:
+    kwargs.setdefault("initial", 4)
+    kwargs.setdefault("max_limit", 32)
+    kwargs.setdefault("tolerance", 1.5)
+    return AdaptiveConcurrencyLimit("host", **kwargs)
+
+
+def _run(limit, rtt, calls, ok=True):
+    for _ in range(calls):
+        limit._update(rtt, ok, inflight=int(limit.limit))  # callers use the whole limit
+
+
+def test_flat_latency_grows_the_limit():
+    limit = _limit()
+    _run(limit, 0.1, 20)
+    assert limit.limit > 8
+
+
+def test_rising_latency_shrinks_the_limit():
+    limit = _limit(initial=16)
+    _run(limit, 0.1, 5)
+    grown = limit.limit
+    _run(limit, 0.6, 30)  # upstream queues: 6x the no-load latency
+    assert limit.limit < grown / 2
+    assert limit.base_rtt < 0.2  # the no-load estimate only creeps up
+
+
+def test_failures_back_off():
+    limit = _limit(initial=10)
+    limit._update(0.1, False, inflight=10)
+    assert limit.limit == pytest.approx(9.0)
+
+
+def test_limit_stays_within_its_bounds():
+    limit = _limit(initial=2, max_limit=6)
+    _run(limit, 0.1, 200)
+    assert limit.limit == 6
+    _run(limit, 0.1, 200, ok=False)
+    assert limit.limit == 1
+
+
+def test_unused_limit_does_not_grow():
+    limit = _limit(initial=8)
+    for _ in range(50):
+        limit._update(0.1, True, inflight=1)
+    assert limit.limit == 8
+
+
+def test_full_limit_times_out():
+    limit = _limit(initial=1)
+    with limit.slot():
+        assert limit.snapshot()["inflight"] == 1
+        with pytest.raises(TimeoutError):
+            with limit.slot(timeout=0.05):
+                pass
+    assert limit.snapshot()["inflight"] == 0
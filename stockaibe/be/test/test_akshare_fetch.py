@@ -0,0 +1,47 @@
+"""Parallel AkShare fetches under the daily quota."""
+
+import pytest
+
+pytest.importorskip("akshare")
+
+from stockaibe_be.models import Quota
+from stockaibe_be.services.limiter import AcquireDecision, RateLimitTimeout
+from stockaibe_be.services.quota_store import quota_cache
+from stockaibe_be.tasks import akshare_task
+
+
+@pytest.fixture
+def daily_quota(monkeypatch):
+    quota = Quota(id="akshare_daily", name="akshare_daily", capacity=10, refill_rate=0.5)
+    monkeypatch.setattr(quota_cache, "get_by_name", {"akshare_daily": quota}.get)
+    return quota
+
+
+def test_pool_is_sized_to_the_tokens_of_one_wait(daily_quota, monkeypatch):
+    from stockaibe_be.core.config import settings
+
+    monkeypatch.setattr(settings, "limit_call_timeout_seconds", 30.0)
+    assert akshare_task._fetch_workers("host-a", "akshare_daily") == 15
+    daily_quota.refill_rate = 0.01
+    assert akshare_task._fetch_workers("host-a", "akshare_daily") == 1
+    daily_quota.refill_rate = 100.0
+    assert akshare_task._fetch_workers("host-a", "akshare_daily") == akshare_task.upstream_limit("host-a").max_limit
+
+
+def test_token_timeouts_are_retried(daily_quota):
+    calls = {}
+
+    def fetch(code):
+        calls[code] = calls.get(code, 0) + 1
+        if code == "slow" and calls[code] == 1:
+            raise RateLimitTimeout("timeout", AcquireDecision("akshare_daily", 1, False, 0.0, 2.0))
+        if code == "never":
+            raise RateLimitTimeout("timeout", AcquireDecision("akshare_daily", 1, False, 0.0, -1.0))
+        return code
+
+    jobs = [("ok",), ("slow",), ("never",)]
+    results = {job: (df, error) for job, df, error in akshare_task._fetch_concurrently(fetch, jobs, "host-b")}
+    assert results[("ok",)] == ("ok", None)
+    assert results[("slow",)] == ("slow", None)
+    assert isinstance(results[("never",)][1], RateLimitTimeout)
+    assert calls == {"ok": 1, "slow": 2, "never": 1}
@@ -0,0 +1,44 @@
+"""AsyncLimiterService fallback while its Redis breaker is open."""
+
+import asyncio
+import threading
+import time
+
+from stockaibe_be.models import Quota
+from stockaibe_be.services.circuit_breaker import OPEN, CircuitBreaker
+from stockaibe_be.services.limiter import AsyncLimiterService, LimiterService
+
+
+def _open_breaker() -> CircuitBreaker:
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=60.0)
+    breaker.state = OPEN
+    breaker.opened_at = time.monotonic()
+    return breaker
+
+
+def test_fallback_runs_off_the_event_loop():
+    fallback = LimiterService(_shared_opened=True)
+    service = AsyncLimiterService(fallback=fallback, breaker=_open_breaker())
+    quota = Quota(id="async-q", capacity=2, refill_rate=0.001)
+    threads = []
+    acquire_memory = fallback._acquire_memory
+
+    def recording_acquire(*args):
+        threads.append(threading.get_ident())
+        return acquire_memory(*args)
+
+    fallback._acquire_memory = recording_acquire
+
+    async def run():
+        loop_thread = threading.get_ident()
+        results = [await service.try_acquire(quota) for _ in range(3)]
+        tokens = await service.get_current_tokens(quota.id)
+        snapshots = await service.inspect_many([quota])
+        return loop_thread, results, tokens, snapshots
+
+    loop_thread, results, tokens, snapshots = asyncio.run(run())
+
+    assert [allowed for allowed, _, _ in results] == [True, True, False]
+    assert threads and loop_thread not in threads
+    assert tokens < 1
+    assert snapshots[0].quota_id == quota.id
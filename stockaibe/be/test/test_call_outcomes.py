@@ -0,0 +1,90 @@
+"""LimitCallTask counts ok/err after the call, together with its latency."""
+
+import time
+from contextlib import contextmanager
+
+import pytest
+
+from stockaibe_be.models import Quota
+from stockaibe_be.services import trace_writer
+from stockaibe_be.services.quota_store import quota_cache
+from stockaibe_be.services.task_decorators import LimitCallTask, clear_registered_call_limiters
+
+
+@pytest.fixture
+def traces(monkeypatch):
+    rows = []
+    monkeypatch.setattr(trace_writer.trace_sink, "record", lambda **row: rows.append(row))
+    return rows
+
+
+@pytest.fixture
+def quotas(limiter, traces, monkeypatch):
+    """Rate quota "api" and concurrency quota "slots" on the fakeredis limiter."""
+    by_name = {
+        "api": Quota(id="api", name="api", capacity=10, refill_rate=0.001),
+        "slots": Quota(id="slots", name="slots", algo="concurrency", capacity=2),
+    }
+    monkeypatch.setattr(quota_cache, "get_by_name", by_name.get)
+    monkeypatch.setattr("stockaibe_be.services.limiter.limiter_service", limiter)
+    yield by_name
+    clear_registered_call_limiters()
+
+
+def _stats(fake_redis, quota_id):
+    """Stats of a quota summed over its minute hashes (a test may cross a minute)."""
+    stats = {}
+    for key in fake_redis.keys(f"stats:{quota_id}:*"):
+        for field, value in fake_redis.hgetall(key).items():
+            stats[field.decode()] = stats.get(field.decode(), 0) + float(value)
+    return stats
+
+
+@pytest.mark.parametrize("lease", [False, True])
+def test_failed_calls_are_counted_as_errors(quotas, limiter, fake_redis, lease):
+    @LimitCallTask(id="fails", name="fails", quota_name="api", lease=lease, concurrency_quota="slots")
+    def fails():
+        raise RuntimeError("upstream down")
+
+    @LimitCallTask(id="works", name="works", quota_name="api", lease=lease)
+    def works():
+        return 1
+
+    for _ in range(3):
+        with pytest.raises(RuntimeError):
+            fails()
+    assert works() == 1
+    limiter.release_leases(expired_only=False)
+
+    stats = _stats(fake_redis, "api")
+    assert (stats.get("ok", 0), stats.get("err", 0)) == (1, 3)
+    assert stats["latency_count"] == 4
+    slots = _stats(fake_redis, "slots")
+    assert (slots.get("ok", 0), slots.get("err", 0)) == (0, 3)
+
+
+def test_record_outcome_without_latency_only_counts(limiter, fake_redis):
+    quota = Quota(id="obs")
+    limiter.record_outcome(quota, True, 0)
+    limiter.record_outcome(quota, False, 12.5)
+    stats = _stats(fake_redis, "obs")
+    assert (stats["ok"], stats["err"], stats["latency_count"]) == (1, 1, 1)
+
+
+def test_upstream_slot_wait_is_not_execution_time(quotas, traces, monkeypatch):
+    class SlowHost:
+        @contextmanager
+        def slot(self):
+            time.sleep(0.2)  # queued behind other calls to the host
+            yield
+
+    monkeypatch.setattr("stockaibe_be.services.adaptive_concurrency.upstream_limit", lambda host: SlowHost())
+
+    @LimitCallTask(id="upstream", name="upstream", quota_name="api", upstream="host")
+    def call():
+        return 1
+
+    assert call() == 1
+    (trace,) = traces
+    assert trace["wait_ms"] >= 200
+    assert trace["latency_ms"] < 100
@@ -0,0 +1,88 @@
+"""CircuitBreaker state machine and how LimiterService reports to it."""
+
+import pytest
+
+from stockaibe_be.models import Quota
+from stockaibe_be.services.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr("stockaibe_be.services.circuit_breaker.time.monotonic", clock)
+    return clock
+
+
+def test_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker("t", failure_threshold=3, reset_timeout=5.0)
+    assert not breaker.record_failure("e1")
+    assert not breaker.record_failure("e2")
+    assert breaker.record_failure("e3")
+    assert breaker.state == OPEN and breaker.trips == 1
+    assert not breaker.allow()
+
+
+def test_success_resets_the_failure_count(clock):
+    breaker = CircuitBreaker("t", failure_threshold=2, reset_timeout=5.0)
+    breaker.record_failure("e1")
+    assert not breaker.record_success()  # already closed
+    breaker.record_failure("e2")
+    assert breaker.state == CLOSED
+
+
+def test_half_open_lets_one_probe_through(clock):
+    breaker = CircuitBreaker("t", failure_threshold=1, reset_timeout=5.0)
+    breaker.record_failure("down")
+    clock.now += 5.0
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()  # the probe has not reported yet
+    assert breaker.record_success()
+    assert breaker.state == CLOSED and breaker.allow()
+
+
+def test_failed_probe_opens_again(clock):
+    breaker = CircuitBreaker("t", failure_threshold=3, reset_timeout=5.0)
+    for _ in range(3):
+        breaker.record_failure("down")
+    clock.now += 5.0
+    assert breaker.allow()
+    assert breaker.record_failure("still down")
+    assert breaker.state == OPEN and breaker.trips == 2
+    assert not breaker.allow()
+
+
+def test_silent_probe_is_retried_after_the_timeout(clock):
+    breaker = CircuitBreaker("t", failure_threshold=1, reset_timeout=5.0)
+    breaker.record_failure("down")
+    clock.now += 5.0
+    assert breaker.allow()
+    clock.now += 5.0
+    assert breaker.allow()
+
+
+def test_remove_quota_reports_the_probe_outcome(limiter, fake_redis, clock, monkeypatch):
+    limiter.breaker = CircuitBreaker("redis", failure_threshold=1, reset_timeout=5.0)
+    quota = Quota(id="rm", capacity=5, refill_rate=1.0)
+    limiter.try_acquire(quota)
+    assert fake_redis.exists("quota:rm")
+
+    limiter.breaker.record_failure("down")
+    clock.now += 5.0
+    limiter.remove_quota("rm")
+    assert limiter.breaker.state == CLOSED
+    assert not fake_redis.exists("quota:rm")
+
+    limiter.breaker.record_failure("down")
+    clock.now += 5.0
+    monkeypatch.setattr(limiter, "_get_redis", lambda: None)
+    limiter.remove_quota("rm")  # no connection: the probe opens the breaker again
+    assert limiter.breaker.state == OPEN
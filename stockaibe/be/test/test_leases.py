@@ -0,0 +1,74 @@
+"""Token leases: blocks reserved from Redis and handed out locally."""
+
+import threading
+
+import pytest
+
+from stockaibe_be.models import Quota
+
+
+def _stats(fake_redis, quota_id):
+    stats = {}
+    for key in fake_redis.keys(f"stats:{quota_id}:*"):
+        for field, value in fake_redis.hgetall(key).items():
+            stats[field.decode()] = stats.get(field.decode(), 0) + int(value)
+    return stats
+
+
+@pytest.fixture
+def quota(limiter):
+    quota = Quota(id="leased", capacity=100, refill_rate=0.001)
+    limiter.ensure_quota(quota)
+    return quota
+
+
+def test_lease_is_prefetched_and_returned(limiter, fake_redis, quota, monkeypatch):
+    assert limiter.acquire_leased(quota) == (True, 0.0, 0.0)  # first lease: one token
+    # Called again at once: the next lease is sized to lease_max_fraction of the capacity
+    assert limiter.acquire_leased(quota) == (True, 9.0, 0.0)
+    assert limiter.get_current_tokens(quota.id) == pytest.approx(89, abs=0.01)
+
+    calls = []
+    monkeypatch.setattr(limiter, "_lease_redis", lambda *args, **kwargs: calls.append(args))
+    for left in range(8, 3, -1):
+        assert limiter.acquire_leased(quota) == (True, float(left), 0.0)
+    assert calls == []  # served from the lease
+    monkeypatch.undo()
+
+    assert limiter.release_leases(expired_only=False) == 1
+    assert limiter.get_current_tokens(quota.id) == pytest.approx(93, abs=0.01)
+    assert _stats(fake_redis, quota.id)["ok"] == 7
+    assert limiter.release_leases(expired_only=False) == 0
+
+
+def test_calls_taken_with_deferred_outcome_are_not_counted(limiter, fake_redis, quota):
+    for _ in range(3):
+        limiter.acquire_leased(quota, success=None)
+    limiter.release_leases(expired_only=False)
+    assert "ok" not in _stats(fake_redis, quota.id)
+
+
+def test_a_slow_renewal_only_blocks_its_own_quota(limiter, monkeypatch):
+    # Quotas share a lock when their ids hash to the same stripe; pick one that does not
+    fast_id = next(f"fast-{i}" for i in range(100) if limiter._lease_stripe(f"fast-{i}") is not limiter._lease_stripe("slow"))
+    slow, fast = Quota(id="slow", capacity=100, refill_rate=0.001), Quota(id=fast_id, capacity=100, refill_rate=0.001)
+    entered, unblock = threading.Event(), threading.Event()
+    lease_redis = limiter._lease_redis
+
+    def blocking_lease_redis(quota, **kwargs):
+        if quota.id == "slow":
+            entered.set()
+            unblock.wait(5)
+        return lease_redis(quota, **kwargs)
+
+    monkeypatch.setattr(limiter, "_lease_redis", blocking_lease_redis)
+    thread = threading.Thread(target=limiter.acquire_leased, args=(slow,))
+    thread.start()
+    try:
+        assert entered.wait(5)
+        done = threading.Event()
+        threading.Thread(target=lambda: (limiter.acquire_leased(fast), done.set())).start()
+        assert done.wait(1)  # not queued behind the slow quota's Redis call
+    finally:
+        unblock.set()
+        thread.join()
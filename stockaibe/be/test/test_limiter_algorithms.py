@@ -0,0 +1,127 @@
+"""Limiter algorithms: the Lua scripts (on fakeredis) and their in-memory twins."""
+
+import math
+import time
+
+import pytest
+
+from stockaibe_be.models import Quota
+from stockaibe_be.services.circuit_breaker import CircuitBreaker
+from stockaibe_be.services.limiter import LimiterService
+from stockaibe_be.services.quota_store import quota_cache
+
+ALGOS = ["token_bucket", "gcra", "leaky_bucket", "sliding_window", "fixed_window"]
+
+
+@pytest.fixture
+def memory_limiter():
+    """LimiterService whose breaker never lets a call through to Redis."""
+    breaker = CircuitBreaker("memory", failure_threshold=1, reset_timeout=math.inf)
+    breaker.record_failure("memory only")
+    return LimiterService(breaker=breaker, _shared_opened=True)
+
+
+@pytest.fixture(params=["redis", "memory"])
+def service(request, limiter, memory_limiter):
+    service = limiter if request.param == "redis" else memory_limiter
+    yield service
+    assert service.breaker.state == ("closed" if request.param == "redis" else "open")
+
+
+def _quota(quota_id: str, algo: str = "token_bucket", **kwargs) -> Quota:
+    kwargs.setdefault("capacity", 5)
+    kwargs.setdefault("refill_rate", 0.001)  # no noticeable refill during a test
+    return Quota(id=quota_id, algo=algo, window_unit="day" if algo == "fixed_window" else None, **kwargs)
+
+
+@pytest.mark.parametrize("algo", ALGOS)
+def test_capacity_is_enforced(service, algo):
+    quota = _quota(f"cap-{algo}", algo)
+    service.ensure_quota(quota)
+    results = [service.try_acquire(quota) for _ in range(6)]
+    assert [allowed for allowed, _, _ in results] == [True] * 5 + [False]
+    assert results[4][1] == pytest.approx(0, abs=0.01)
+    assert results[5][2] > 0  # retry-after of the rejected call
+
+
+@pytest.mark.parametrize("algo", ALGOS)
+def test_cost_counts_several_tokens(service, algo):
+    quota = _quota(f"cost-{algo}", algo)
+    service.ensure_quota(quota)
+    assert service.try_acquire(quota, cost=3)[0]
+    assert not service.try_acquire(quota, cost=3)[0]  # only 2 left, nothing debited
+    assert service.try_acquire(quota, cost=2)[0]
+
+
+@pytest.mark.parametrize("algo", ["token_bucket", "sliding_window", "fixed_window"])
+def test_cost_above_capacity_never_fits(service, algo):
+    quota = _quota(f"never-{algo}", algo)
+    service.ensure_quota(quota)
+    allowed, _, retry_after = service.try_acquire(quota, cost=6)
+    assert not allowed and retry_after == -1
+
+
+def test_disabled_quota_rejects(service):
+    quota = _quota("disabled", enabled=False)
+    service.ensure_quota(quota)
+    allowed, _, retry_after = service.try_acquire(quota)
+    assert not allowed and retry_after == -1
+
+
+def test_token_bucket_refills(service):
+    quota = _quota("refill", capacity=1, refill_rate=1000.0)
+    service.ensure_quota(quota)
+    assert service.try_acquire(quota)[0]
+    allowed, _, retry_after = service.try_acquire(quota)
+    assert allowed or 0 < retry_after <= 0.001 + 1e-6
+
+
+def test_parent_chain_is_checked_before_any_level_is_debited(service, monkeypatch):
+    parent = _quota("parent", capacity=2)
+    child = _quota("child", capacity=10, parent_id="parent")
+    monkeypatch.setattr(quota_cache, "chain", lambda quota: [quota, parent] if quota.parent_id else [quota])
+    for quota in (parent, child):
+        service.ensure_quota(quota)
+    assert [service.try_acquire(child)[0] for _ in range(3)] == [True, True, False]
+    # The rejected call did not take a token from the child
+    assert service.get_current_tokens("child") == pytest.approx(8, abs=0.01)
+
+
+def test_concurrency_slots(service):
+    quota = _quota("slots", "concurrency", capacity=2)
+    service.ensure_quota(quota)
+    first, _, _ = service.acquire_slot(quota, ttl=60)
+    second, remain, _ = service.acquire_slot(quota, ttl=60)
+    third, _, retry_after = service.acquire_slot(quota, ttl=60)
+    assert first and second and third is None
+    assert remain == 0 and retry_after > 0
+    assert service.release_slot(quota, first)
+    assert service.acquire_slot(quota, ttl=60)[0]
+
+
+def test_concurrency_quotas_are_rejected_by_try_acquire(service):
+    with pytest.raises(ValueError):
+        service.try_acquire(_quota("slots-only", "concurrency"))
+
+
+def test_inspect_does_not_consume(service):
+    quota = _quota("inspect")
+    service.ensure_quota(quota)
+    service.try_acquire(quota, cost=2)
+    for _ in range(2):
+        (snapshot,) = service.inspect_many([quota])
+        assert snapshot.tokens == pytest.approx(3, abs=0.01)
+        assert snapshot.capacity == 5
+        assert snapshot.time_to_full > 0
+
+
+def test_renewed_slot_outlives_its_ttl(service):
+    quota = _quota("renew", "concurrency", capacity=1)
+    service.ensure_quota(quota)
+    lease_id, _, _ = service.acquire_slot(quota, ttl=0.2)
+    with service.slot_heartbeat(quota, lease_id, ttl=0.2):
+        time.sleep(0.5)
+        assert service.acquire_slot(quota, ttl=0.2)[0] is None
+    assert service.release_slot(quota, lease_id)
+    assert not service.renew_slot(quota, lease_id)  # released leases are not brought back
+    assert service.acquire_slot(quota, ttl=0.2)[0]
@@ -0,0 +1,58 @@
+"""Partitioned metrics / traces tables: DDL per dialect and partition expiry."""
+
+import datetime as dt
+
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateTable
+from sqlmodel import Session
+
+from stockaibe_be.models import Metric, Quota, TraceLog
+from stockaibe_be.services.partitions import expired_partitions, partition_name, retention_days
+
+
+def test_postgresql_keeps_the_partition_key_in_the_primary_key():
+    ddl = str(CreateTable(Metric.__table__).compile(dialect=postgresql.dialect()))
+    assert "PRIMARY KEY (id, ts)" in ddl
+    assert "PARTITION BY RANGE (ts)" in ddl
+    ddl = str(CreateTable(TraceLog.__table__).compile(dialect=postgresql.dialect()))
+    assert "PRIMARY KEY (id, created_at)" in ddl
+
+
+def test_sqlite_creates_the_tables_with_autoincrement_ids(db):
+    now = dt.datetime(2026, 1, 1)
+    with Session(db) as session:
+        session.add(Quota(id="q"))
+        session.commit()
+        metrics = [Metric(quota_id="q", ts=now), Metric(quota_id="q", ts=now)]
+        trace = TraceLog(quota_id="q", status_code=200, created_at=now)
+        session.add_all([*metrics, trace])
+        session.commit()
+        assert [metric.id for metric in metrics] == [1, 2]
+        assert trace.id == 1
+
+
+def test_expired_partitions_drop_only_whole_days_past_retention():
+    today = dt.date(2026, 3, 10)
+    partitions = {
+        partition_name("metrics", today - dt.timedelta(days=offset)): today - dt.timedelta(days=offset)
+        for offset in range(-1, 6)
+    }
+    # Cutoff 2026-03-07: the 03-06 partition ends at the cutoff, 03-07 holds kept rows
+    assert expired_partitions(partitions, 3, today) == [
+        "metrics_p20260305",
+        "metrics_p20260306",
+    ]
+    assert expired_partitions(partitions, 0, today) == []
+    assert expired_partitions(partitions, 30, today) == []
+
+
+def test_retention_days_keep_partitions_for_the_longest_policy(monkeypatch):
+    from stockaibe_be.core.config import settings
+
+    monkeypatch.setattr(settings, "trace_retention_days", 7)
+    monkeypatch.setattr(settings, "trace_error_retention_days", 30)
+    monkeypatch.setattr(settings, "metric_retention_days", 14)
+    assert retention_days("traces") == 30
+    assert retention_days("metrics") == 14
+    monkeypatch.setattr(settings, "trace_error_retention_days", 0)
+    assert retention_days("traces") == 0  # error traces kept forever
@@ -0,0 +1,94 @@
+"""QuotaCache: lookups without the database and invalidation across workers."""
+
+import time
+
+import pytest
+from sqlalchemy import event
+from sqlmodel import Session
+
+from stockaibe_be.models import Quota
+from stockaibe_be.services import quota_store, trace_writer
+from stockaibe_be.services.quota_store import EFFECTIVE_RATES_KEY, QuotaCache
+
+
+@pytest.fixture
+def statements(db):
+    """SQL statements run on the engine from here on."""
+    seen = []
+
+    def listener(conn, cursor, statement, *args):
+        seen.append(statement)
+
+    event.listen(db, "before_cursor_execute", listener)
+    yield seen
+    event.remove(db, "before_cursor_execute", listener)
+
+
+@pytest.fixture
+def quotas(db):
+    with Session(db) as session:
+        session.add(Quota(id="root", name="root", capacity=100, refill_rate=10.0))
+        session.add(Quota(id="child", name="child", capacity=5, refill_rate=1.0, parent_id="root"))
+        session.add(Quota(id="adaptive", name="adaptive", refill_rate=4.0, min_refill_rate=1.0, max_refill_rate=8.0))
+        session.commit()
+    return db
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def test_lookups_hit_the_database_once(quotas, statements):
+    cache = QuotaCache(ttl=60)
+    for _ in range(3):
+        assert cache.get("child").capacity == 5
+        assert cache.get_by_name("root").id == "root"
+        assert [quota.id for quota in cache.chain(cache.get("child"))] == ["child", "root"]
+    assert len(statements) == 1
+    cache.invalidate()
+    assert cache.get("missing") is None
+    assert len(statements) == 2
+
+
+def test_acquire_path_reads_quotas_from_the_cache(quotas, statements, limiter, monkeypatch):
+    cache = QuotaCache(ttl=60)
+    monkeypatch.setattr("stockaibe_be.services.limiter.quota_cache", cache)
+    monkeypatch.setattr(trace_writer.trace_sink, "record", lambda **row: None)
+    cache.all()
+    statements.clear()
+    for _ in range(3):
+        (decision,) = limiter.acquire_many([("child", 1)])
+        assert decision.allowed
+    (missing,) = limiter.acquire_many([("missing", 1)])
+    assert not missing.found
+    assert statements == []
+
+
+def test_published_changes_reload_other_workers(quotas, fake_redis, monkeypatch):
+    monkeypatch.setattr(quota_store, "get_redis", lambda: fake_redis)
+    editor, worker = QuotaCache(ttl=3600), QuotaCache(ttl=3600)
+    reloads = []
+    worker.add_listener(reloads.append)
+    worker.start_subscriber()
+    try:
+        assert _wait_for(lambda: reloads)
+        assert worker.get("child").capacity == 5
+
+        with Session(quotas) as session:
+            session.get(Quota, "child").capacity = 7
+            session.commit()
+        editor.publish_change("child")
+        assert _wait_for(lambda: worker.get("child").capacity == 7)
+
+        # Controller rates are applied within the quota's bounds
+        fake_redis.hset(EFFECTIVE_RATES_KEY, mapping={"adaptive": 20.0, "root": 3.0})
+        editor.publish_change(EFFECTIVE_RATES_KEY)
+        assert _wait_for(lambda: worker.get("adaptive").refill_rate == 8.0)
+        assert worker.get("root").refill_rate == 10.0  # not adaptive
+    finally:
+        worker.stop_subscriber()
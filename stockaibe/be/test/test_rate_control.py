@@ -0,0 +1,62 @@
+"""AIMD control of adaptive quota rates."""
+
+import pytest
+
+from stockaibe_be.core.config import settings
+from stockaibe_be.models import Quota
+from stockaibe_be.services import rate_control
+from stockaibe_be.services.quota_store import EFFECTIVE_RATES_KEY, rate_bounds
+from stockaibe_be.services.rate_control import CONTROL_LOCK_KEY, QuotaSignals, RateController, next_rate
+
+BOUNDS = (1.0, 20.0)
+
+
+@pytest.fixture(autouse=True)
+def thresholds(monkeypatch):
+    monkeypatch.setattr(settings, "rate_control_error_rate_threshold", 0.05)
+    monkeypatch.setattr(settings, "rate_control_latency_p95_ms", 500.0)
+    monkeypatch.setattr(settings, "rate_control_increase_fraction", 0.1)
+    monkeypatch.setattr(settings, "rate_control_decrease_factor", 0.5)
+
+
+def test_rejections_increase_additively():
+    assert next_rate(10.0, 10.0, BOUNDS, QuotaSignals(ok=100, err=0, r429=5)) == pytest.approx(11.0)
+    assert next_rate(11.0, 10.0, BOUNDS, QuotaSignals(ok=100, err=0, r429=5)) == pytest.approx(12.0)
+
+
+def test_errors_and_slow_calls_decrease_multiplicatively():
+    assert next_rate(10.0, 10.0, BOUNDS, QuotaSignals(ok=90, err=10, r429=5)) == pytest.approx(5.0)
+    assert next_rate(10.0, 10.0, BOUNDS, QuotaSignals(ok=100, err=0, r429=0, latency_p95=800.0)) == pytest.approx(5.0)
+
+
+def test_quiet_quota_keeps_its_rate():
+    assert next_rate(7.0, 10.0, BOUNDS, QuotaSignals(ok=100, err=1, r429=0)) == 7.0
+
+
+def test_rate_is_clamped_to_the_bounds():
+    assert next_rate(19.5, 10.0, BOUNDS, QuotaSignals(ok=1, err=0, r429=1)) == 20.0
+    assert next_rate(1.5, 10.0, BOUNDS, QuotaSignals(ok=0, err=5, r429=0)) == 1.0
+
+
+def test_bounds_default_to_a_fraction_of_the_configured_rate():
+    assert rate_bounds(Quota(id="fixed", refill_rate=10.0)) is None
+    assert rate_bounds(Quota(id="a", refill_rate=10.0, max_refill_rate=30.0)) == (1.0, 30.0)
+    assert rate_bounds(Quota(id="b", refill_rate=10.0, min_refill_rate=4.0, max_refill_rate=30.0)) == (4.0, 30.0)
+
+
+def test_update_stores_changed_rates_once_per_interval(fake_redis, monkeypatch):
+    monkeypatch.setattr(rate_control, "get_redis", lambda: fake_redis)
+    monkeypatch.setattr(rate_control.quota_cache, "set_effective_rates", lambda rates: None)
+    monkeypatch.setattr(rate_control.quota_cache, "publish_change", lambda quota_id: None)
+    adaptive = Quota(id="adaptive", refill_rate=10.0, max_refill_rate=20.0)
+    fixed = Quota(id="fixed", refill_rate=10.0)
+    fake_redis.hset(EFFECTIVE_RATES_KEY, "fixed", 3.0)  # left over from when it was adaptive
+
+    observations = [(adaptive, QuotaSignals(ok=10, err=0, r429=3)), (fixed, QuotaSignals(ok=10, err=0, r429=3))]
+    assert RateController().update(observations) == {"adaptive": pytest.approx(11.0)}
+    assert {k.decode(): float(v) for k, v in fake_redis.hgetall(EFFECTIVE_RATES_KEY).items()} == {"adaptive": 11.0}
+
+    # Another worker in the same interval does nothing
+    assert RateController().update(observations) == {}
+    fake_redis.delete(CONTROL_LOCK_KEY)
+    assert RateController().update(observations) == {"adaptive": pytest.approx(12.0)}
@@ -0,0 +1,101 @@
+"""Chunked retention of metrics and traces against real rows."""
+
+import datetime as dt
+
+import pytest
+from sqlmodel import Session, select
+
+from stockaibe_be.models import Metric, Quota, TraceLog
+from stockaibe_be.services.retention import (
+    RetentionPolicy,
+    _boundary_id,
+    apply_policy,
+    apply_retention,
+    retention_policies,
+)
+
+NOW = dt.datetime(2026, 3, 10, 12, 0, tzinfo=dt.timezone.utc)
+
+
+def _naive(days_ago: float) -> dt.datetime:
+    # The timestamp columns are TIMESTAMP WITHOUT TIME ZONE holding UTC
+    return (NOW - dt.timedelta(days=days_ago)).replace(tzinfo=None)
+
+
+@pytest.fixture
+def quota(db):
+    with Session(db) as session:
+        session.add(Quota(id="q"))
+        session.commit()
+    return "q"
+
+
+def _add_metrics(db, quota, days_ago):
+    with Session(db) as session:
+        session.add_all([Metric(quota_id=quota, ts=_naive(days)) for days in days_ago])
+        session.commit()
+
+
+def _metric_ages(db):
+    with Session(db) as session:
+        rows = session.exec(select(Metric).order_by(Metric.id)).all()
+        return [round((_naive(0) - row.ts) / dt.timedelta(days=1)) for row in rows]
+
+
+def test_boundary_id_with_an_aware_cutoff(db, quota):
+    _add_metrics(db, quota, [20, 15, 10, 5, 1])
+    with db.connect() as conn:
+        cutoff = NOW - dt.timedelta(days=7)
+        assert _boundary_id(conn, Metric, Metric.ts, cutoff, 1, 5) == 4
+        assert _boundary_id(conn, Metric, Metric.ts, NOW, 1, 5) == 6
+        assert _boundary_id(conn, Metric, Metric.ts, NOW - dt.timedelta(days=30), 1, 5) == 1
+
+
+def test_apply_policy_deletes_rows_older_than_the_cutoff(db, quota):
+    _add_metrics(db, quota, [20, 15, 10, 8, 6, 5, 1])
+    deleted = apply_policy(RetentionPolicy("metrics", Metric, "ts", 7), now=NOW, chunk_size=2)
+    assert deleted == 4
+    assert _metric_ages(db) == [6, 5, 1]
+
+
+def test_apply_policy_never_deletes_rows_written_out_of_order(db, quota):
+    # id 2 is newer than the cutoff although ids 1 and 3 are older
+    _add_metrics(db, quota, [10, 1, 9, 2])
+    deleted = apply_policy(RetentionPolicy("metrics", Metric, "ts", 7), now=NOW, chunk_size=1)
+    ages = _metric_ages(db)
+    assert deleted == 4 - len(ages) >= 1
+    assert 1 in ages and 2 in ages
+
+
+def test_apply_policy_keeps_everything_when_days_is_zero(db, quota):
+    _add_metrics(db, quota, [400])
+    assert apply_policy(RetentionPolicy("metrics", Metric, "ts", 0), now=NOW) == 0
+    assert _metric_ages(db) == [400]
+
+
+def test_error_traces_are_kept_longer(db, quota, monkeypatch):
+    from stockaibe_be.core.config import settings
+
+    monkeypatch.setattr(settings, "trace_retention_days", 7)
+    monkeypatch.setattr(settings, "trace_error_retention_days", 30)
+    with Session(db) as session:
+        for days, status_code in [(40, 500), (40, 200), (10, 500), (10, 429), (1, 200)]:
+            session.add(TraceLog(quota_id=quota, status_code=status_code, created_at=_naive(days)))
+        session.commit()
+
+    policies = {policy.name: policy for policy in retention_policies()}
+    assert apply_policy(policies["traces"], now=NOW) == 2
+    assert apply_policy(policies["error_traces"], now=NOW) == 1
+    with Session(db) as session:
+        kept = session.exec(select(TraceLog.status_code).order_by(TraceLog.id)).all()
+    assert kept == [500, 200]
+
+
+def test_apply_retention_runs_every_policy(db, quota, monkeypatch):
+    from stockaibe_be.core.config import settings
+
+    monkeypatch.setattr(settings, "metric_retention_days", 7)
+    _add_metrics(db, quota, [30, 1])
+    result = apply_retention(now=NOW)
+    assert set(result) == {policy.name for policy in retention_policies()}
+    assert result["metrics"] == 1
@@ -0,0 +1,137 @@
+"""Metric rollups, resolution choice and the series endpoint."""
+
+import datetime as dt
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select
+
+from stockaibe_be.api import metrics
+from stockaibe_be.core.security import get_current_user
+from stockaibe_be.models import Metric, MetricDaily, MetricHourly, Quota
+from stockaibe_be.services import rollups
+from stockaibe_be.services.rollups import bucket_start, choose_resolution, rollup_job, rollup_metrics
+
+UTC = dt.timezone.utc
+START = dt.datetime(2026, 3, 10, tzinfo=UTC)
+
+
+@pytest.mark.parametrize(
+    "span, points, name",
+    [
+        (dt.timedelta(minutes=300), 300, "1m"),
+        (dt.timedelta(minutes=301), 300, "1h"),
+        (dt.timedelta(hours=300), 300, "1h"),
+        (dt.timedelta(hours=301), 300, "1d"),
+        (dt.timedelta(days=5000), 300, "1d"),  # coarsest even when over budget
+    ],
+)
+def test_choose_resolution_is_the_finest_within_the_budget(span, points, name):
+    assert choose_resolution(START, START + span, points).name == name
+
+
+def test_choose_resolution_takes_naive_times_as_utc():
+    naive = START.replace(tzinfo=None)
+    assert choose_resolution(naive, START + dt.timedelta(hours=10), 300).name == "1h"
+    shanghai = dt.timezone(dt.timedelta(hours=8))
+    assert choose_resolution(START.astimezone(shanghai), naive + dt.timedelta(hours=1), 60).name == "1m"
+
+
+def test_bucket_start():
+    assert bucket_start(dt.datetime(2026, 3, 10, 13, 59, 59), 3600) == dt.datetime(2026, 3, 10, 13, tzinfo=UTC)
+    assert bucket_start(dt.datetime(2026, 3, 10, 13, 30, tzinfo=UTC), 86400) == START
+
+
+@pytest.fixture
+def minute_rows(db):
+    """Two hours of minute rows of quota q: 1 ok, 1 err every minute, latency 10 ms in the 2nd hour."""
+    with Session(db) as session:
+        session.add(Quota(id="q"))
+        session.commit()
+        for minute in range(120):
+            ts = (START + dt.timedelta(minutes=minute)).replace(tzinfo=None)
+            session.add(
+                Metric(
+                    quota_id="q",
+                    ts=ts,
+                    ok=1,
+                    err=1,
+                    tokens_remain=float(minute),
+                    latency_hist={"lb:10": 2} if minute >= 60 else None,
+                )
+            )
+        session.commit()
+    return db
+
+
+def test_rollup_sums_minutes_into_hours_and_days(minute_rows):
+    written = rollup_metrics(START, START + dt.timedelta(hours=2))
+    assert written == {"hourly": 2, "daily": 1}
+    with Session(minute_rows) as session:
+        hours = session.exec(select(MetricHourly).order_by(MetricHourly.ts)).all()
+        days = session.exec(select(MetricDaily)).all()
+    assert [(h.ok, h.err, h.tokens_remain) for h in hours] == [(60, 60, 59.0), (60, 60, 119.0)]
+    assert hours[0].latency_hist is None and hours[1].latency_hist == {"lb:10": 120}
+    assert (days[0].ok, days[0].err, days[0].tokens_remain) == (120, 120, 119.0)
+    assert days[0].latency_hist == {"lb:10": 120}
+
+    # Rebuilding the same range replaces the buckets
+    assert rollup_metrics(START, START + dt.timedelta(hours=2)) == written
+    with Session(minute_rows) as session:
+        assert len(session.exec(select(MetricHourly)).all()) == 2
+
+
+def test_duplicate_minute_rows_are_counted_once(minute_rows):
+    # The same minute snapshot written by two workers
+    with Session(minute_rows) as session:
+        session.add(Metric(quota_id="q", ts=START.replace(tzinfo=None), ok=1, err=1, tokens_remain=0.0))
+        session.commit()
+    rollup_metrics(START, START + dt.timedelta(hours=1))
+    with Session(minute_rows) as session:
+        (hour,) = session.exec(select(MetricHourly)).all()
+    assert (hour.ok, hour.err) == (60, 60)
+
+
+def test_rollup_job_runs_once_per_hour(fake_redis, monkeypatch):
+    runs = []
+    monkeypatch.setattr(rollups, "get_redis", lambda: fake_redis)
+    monkeypatch.setattr(rollups, "rollup_metrics", lambda start, end: runs.append((start, end)) or {})
+    now = START + dt.timedelta(hours=5, minutes=2)
+    rollup_job(now)
+    rollup_job(now + dt.timedelta(seconds=30))  # another worker, same hour
+    rollup_job(now + dt.timedelta(hours=1))
+    assert [end for _, end in runs] == [START + dt.timedelta(hours=5), START + dt.timedelta(hours=6)]
+
+
+@pytest.fixture
+def client(minute_rows):
+    app = FastAPI()
+    app.include_router(metrics.router, prefix="/metrics")
+    app.dependency_overrides[get_current_user] = lambda: None
+    return TestClient(app)
+
+
+def test_series_accepts_naive_start(client):
+    # end defaults to an aware now()
+    assert client.get("/metrics/series", params={"start": "2026-03-10T00:00:00"}).status_code == 200
+    response = client.get("/metrics/series", params={"start": "2026-03-10T00:00:00", "end": "2026-03-10T01:00:00"})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["resolution"] == "1m"
+    assert len(body["items"]) == 60
+
+
+def test_series_reads_rollups_for_long_ranges(client):
+    rollup_metrics(START, START + dt.timedelta(hours=2))
+    params = {"start": "2026-03-09T00:00:00", "end": "2026-03-11T00:00:00Z", "points": 100}
+    response = client.get("/metrics/series", params=params)
+    assert response.status_code == 200
+    assert response.json()["resolution"] == "1h"
+    assert [item["ok"] for item in response.json()["items"]] == [60, 60]
+
+
+def test_series_without_start_returns_the_latest_rows(client):
+    response = client.get("/metrics/series", params={"limit": 5})
+    items = response.json()["items"]
+    assert [item["tokens_remain"] for item in items] == [115.0, 116.0, 117.0, 118.0, 119.0]
@@ -0,0 +1,55 @@
+"""SharedBucketTable: one token bucket per quota shared by every process on the host."""
+
+import multiprocessing
+
+import pytest
+
+from stockaibe_be.services import shared_buckets
+from stockaibe_be.services.shared_buckets import SharedBucketTable
+
+pytestmark = pytest.mark.skipif(shared_buckets.fcntl is None, reason="needs fcntl")
+
+WORKERS = 4
+CALLS = 50
+
+
+def _take(path, results):
+    table = SharedBucketTable(path=path, slots=16)
+    allowed = sum(table.acquire([("shared", 100, 0.001, True)], 1)[0] for _ in range(CALLS))
+    table.close()
+    results.put(allowed)
+
+
+def test_processes_share_one_limit(tmp_path):
+    path = str(tmp_path / "buckets")
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+    workers = [context.Process(target=_take, args=(path, results)) for _ in range(WORKERS)]
+    for worker in workers:
+        worker.start()
+    allowed = [results.get(timeout=30) for _ in workers]
+    for worker in workers:
+        worker.join(30)
+    # 200 calls against one bucket of 100: without sharing each process would allow 50
+    assert sum(allowed) == 100
+
+    table = SharedBucketTable(path=path, slots=16)
+    assert table.tokens("shared", 100, 0.001) == pytest.approx(0, abs=0.01)
+    assert table.acquire([("shared", 100, 0.001, True)], 1)[0] is False
+    table.close()
+
+
+def test_chain_is_taken_from_every_level_or_none(tmp_path):
+    table = SharedBucketTable(path=str(tmp_path / "buckets"), slots=16)
+    levels = [("child", 10, 0.001, True), ("parent", 2, 0.001, True)]
+    assert [table.acquire(levels, 1)[0] for _ in range(3)] == [True, True, False]
+    assert table.tokens("child", 10, 0.001) == pytest.approx(8, abs=0.01)
+    table.close()
+
+
+def test_full_table_returns_none(tmp_path):
+    table = SharedBucketTable(path=str(tmp_path / "buckets"), slots=2)
+    assert table.acquire([("a", 1, 1.0, True)], 1) is not None
+    assert table.acquire([("b", 1, 1.0, True)], 1) is not None
+    assert table.acquire([("c", 1, 1.0, True)], 1) is None
+    table.close()
@@ -0,0 +1,90 @@
+"""Minute snapshots of the Redis stats hashes into Metric rows, and the window sums read from them."""
+
+import datetime as dt
+import importlib
+
+import pytest
+from sqlalchemy import event
+from sqlmodel import Session, select
+
+from stockaibe_be.models import Metric, Quota
+from stockaibe_be.services.quota_store import quota_cache
+
+# The package re-exports the AsyncIOScheduler instance under the module's name
+scheduler = importlib.import_module("stockaibe_be.services.scheduler")
+
+
+@pytest.fixture
+def quota(db, limiter, fake_redis, monkeypatch):
+    monkeypatch.setattr(scheduler, "get_redis", lambda: fake_redis)
+    monkeypatch.setattr(scheduler, "limiter_service", limiter)
+    monkeypatch.setattr(quota_cache, "get", lambda quota_id: None)
+    quota = Quota(id="q", capacity=5, refill_rate=0.001)
+    with Session(db) as session:
+        session.add(quota)
+        session.commit()
+        session.refresh(quota)
+    return quota
+
+
+def _snapshot(db, now):
+    with Session(db) as session:
+        scheduler.snapshot_metrics(session, now=now)
+        return session.exec(select(Metric)).all()
+
+
+def test_snapshot_writes_counts_and_percentiles(db, limiter, quota):
+    for _ in range(90):
+        limiter.record_outcome(quota, True, 10.0)
+    for _ in range(10):
+        limiter.record_outcome(quota, False, 1000.0)
+    limiter.try_acquire(quota, cost=2)
+
+    now = dt.datetime.now(dt.timezone.utc) + dt.timedelta(minutes=1)
+    (row,) = _snapshot(db, now)
+    assert row.ts == now.replace(second=0, microsecond=0, tzinfo=None) - dt.timedelta(minutes=1)
+    assert (row.ok, row.err, row.r429) == (91, 10, 0)
+    assert 9 < row.latency_p50 < 12  # inside the log bucket holding 10 ms
+    assert 800 < row.latency_p99 <= 1100
+    assert sum(row.latency_hist.values()) == 100
+    assert row.tokens_remain == pytest.approx(3, abs=0.01)
+
+
+def test_each_minute_is_written_once(db, limiter, quota):
+    limiter.record_outcome(quota, True, 10.0)
+    now = dt.datetime.now(dt.timezone.utc) + dt.timedelta(minutes=1)
+    assert len(_snapshot(db, now)) == 1
+    # Another worker running the same minute's snapshot
+    assert len(_snapshot(db, now + dt.timedelta(seconds=20))) == 1
+
+
+def test_window_signals_sums_every_window_in_one_query(db):
+    now = dt.datetime(2026, 3, 10, 12, 0, tzinfo=dt.timezone.utc)
+    with Session(db) as session:
+        session.add_all([Quota(id="a"), Quota(id="b"), Quota(id="idle")])
+        session.commit()
+        rows = [(2, "a", 1, 100.0), (4, "a", 0, 300.0), (30, "a", 5, 900.0), (50, "b", 2, None), (90, "a", 9, 1.0)]
+        for minutes_ago, quota_id, err, p95 in rows:
+            ts = (now - dt.timedelta(minutes=minutes_ago)).replace(tzinfo=None)
+            session.add(Metric(quota_id=quota_id, ts=ts, ok=10, err=err, r429=1, latency_p95=p95))
+        session.commit()
+
+    statements = []
+
+    def listener(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(db, "before_cursor_execute", listener)
+    try:
+        with Session(db) as session:
+            signals = scheduler.window_signals(session, [60, 5, 5], now=now)
+    finally:
+        event.remove(db, "before_cursor_execute", listener)
+
+    assert len(statements) == 1
+    assert set(signals) == {"a", "b"}  # rows older than the longest window are ignored
+    assert (signals["a"][5].ok, signals["a"][5].err, signals["a"][5].r429) == (20, 1, 2)
+    assert signals["a"][5].latency_p95 == 300.0
+    assert (signals["a"][60].ok, signals["a"][60].err, signals["a"][60].latency_p95) == (30, 6, 900.0)
+    assert (signals["b"][5].ok, signals["b"][5].latency_p95) == (0, None)
+    assert signals["b"][60].err == 2
@@ -0,0 +1,36 @@
+"""TraceSink batch writes."""
+
+from sqlmodel import Session, select
+
+from stockaibe_be.models import Quota, TraceLog
+from stockaibe_be.services.trace_writer import TraceSink
+
+
+def _row(quota_id: str, status_code: int = 200) -> dict:
+    sink = TraceSink()
+    rows = []
+    sink._put = lambda row, block=True: rows.append(row)
+    sink.record(quota_id=quota_id, status_code=status_code, message=quota_id)
+    return rows[0]
+
+
+def test_batch_is_written_in_one_insert(db):
+    with Session(db) as session:
+        session.add(Quota(id="q"))
+        session.commit()
+    sink = TraceSink()
+    sink._write([_row("q"), _row("q", 429)])
+    with Session(db) as session:
+        assert sorted(t.status_code for t in session.exec(select(TraceLog)).all()) == [200, 429]
+    assert sink.dropped == 0
+
+
+def test_rows_of_unknown_quotas_do_not_drop_the_batch(db):
+    with Session(db) as session:
+        session.add_all([Quota(id="a"), Quota(id="b")])
+        session.commit()
+    sink = TraceSink()
+    sink._write([_row("a"), _row("missing"), _row("b")])
+    with Session(db) as session:
+        assert sorted(t.quota_id for t in session.exec(select(TraceLog)).all()) == ["a", "b"]
+    assert sink.dropped == 1
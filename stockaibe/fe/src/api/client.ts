@@ -7,6 +7,7 @@ import type {
   FuncStats,
   LoginRequest,
   MetricsCurrent,
+  MetricsSeriesRange,
   MetricsSeriesResponse,
   PaginatedResponse,
   Quota,
@@ -148,10 +149,19 @@ class ApiClient {
     return response.data;
   }
 
-  async getMetricsSeries(quotaId?: string, limit: number = 100): Promise<MetricsSeriesResponse> {
+  async getMetricsSeries(
+    quotaId?: string,
+    limit: number = 100,
+    range?: MetricsSeriesRange,
+  ): Promise<MetricsSeriesResponse> {
     const params = new URLSearchParams();
     if (quotaId) params.append('quota_id', quotaId);
     params.append('limit', limit.toString());
+    if (range) {
+      params.append('start', range.start);
+      if (range.end) params.append('end', range.end);
+      if (range.points) params.append('points', range.points.toString());
+    }
     
     const response = await this.client.get<MetricsSeriesResponse>('/metrics/series', { params });
     return response.data;
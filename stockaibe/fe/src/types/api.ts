@@ -95,12 +95,21 @@ export interface MetricSeriesPoint {
   ok: number;
   err: number;
   r429: number;
+  latency_p50?: number;
   latency_p95?: number;
+  latency_p99?: number;
   tokens_remain?: number;
 }
 
 export interface MetricsSeriesResponse {
   items: MetricSeriesPoint[];
+  resolution: '1m' | '1h' | '1d';
+}
+
+export interface MetricsSeriesRange {
+  start: string;
+  end?: string;
+  points?: number;
 }
 
 // Trace types
@@ -111,6 +120,8 @@ export interface Trace {
   func_name?: string;
   status_code: number;
   latency_ms?: number;
+  wait_ms?: number;
+  retries?: number;
   message?: string;
   created_at: string;
 }
@@ -124,6 +135,8 @@ export interface FuncStats {
   failed_calls: number;
   limited_calls: number;
   avg_latency_ms?: number;
+  avg_wait_ms?: number;
+  total_retries: number;
   last_call_at?: string;
 }
 